@@ -0,0 +1,566 @@
+"""
+In-memory Elasticsearch stand-in for benchmarks.
+
+Implements the subset of the client API the app uses: `search` (knn with
+bool/should term boosts, match_all / term / terms / ids / range / bool
+queries, terms aggregations, sort and search_after), point-in-time
+open / close, `index`, `get`, `mget`, `update`, `ping` and `close`.
+kNN is exact (brute-force cosine over a numpy matrix) and scored like ES
+`cosine` similarity, (1 + cos) / 2. A PIT only pins the index name; it does
+not freeze the data.
+
+An optional per-call latency simulates the network round trip, so
+concurrency effects show up as they would against a real cluster.
+"""
+import asyncio
+import copy
+import functools
+import itertools
+import threading
+import time
+
+import numpy as np
+from elastic_transport import ApiResponseMeta, HttpHeaders, NodeConfig
+from elasticsearch import NotFoundError
+
+CATEGORIES = {
+    "Clothing": {
+        "Men's Clothing": {"Topwear": ["T-Shirts", "Shirts", "Jackets"], "Bottomwear": ["Jeans", "Trousers", "Shorts"]},
+        "Women's Clothing": {"Western Wear": ["Dresses", "Tops", "Skirts"], "Ethnic Wear": ["Kurtas", "Sarees", "Leggings"]}
+    },
+    "Footwear": {
+        "Men's Footwear": {"Casual Shoes": ["Sneakers", "Loafers", "Boots"], "Sports Shoes": ["Running Shoes", "Football Shoes"]},
+        "Women's Footwear": {"Flats": ["Ballerinas", "Sandals"], "Heels": ["Pumps", "Wedges"]}
+    },
+    "Electronics": {
+        "Mobile Accessories": {"Cases & Covers": ["Back Covers", "Flip Covers"], "Chargers": ["Wall Chargers", "Car Chargers"]},
+        "Audio": {"Headphones": ["In-Ear Headphones", "Over-Ear Headphones"], "Speakers": ["Bluetooth Speakers", "Soundbars"]}
+    },
+    "Home & Kitchen": {
+        "Kitchenware": {"Cookware": ["Pans", "Pressure Cookers"], "Storage": ["Jars", "Lunch Boxes"]},
+        "Home Decor": {"Lighting": ["Lamps", "String Lights"], "Wall Decor": ["Clocks", "Posters"]}
+    }
+}
+
+BRANDS = [
+    "Aurora", "Bolt", "Cascade", "Drift", "Ember", "Flux", "Granite", "Harbor", "Indigo", "Juniper",
+    "Kestrel", "Lumen", "Maple", "Nimbus", "Onyx", "Pioneer", "Quartz", "Ridge", "Summit", "Tidal"
+]
+
+ADJECTIVES = ["classic", "slim", "premium", "casual", "sport", "soft", "wireless", "compact", "printed", "solid"]
+
+KEYWORD_FIELDS = ["brand", "category", "sub_category", "sub_sub_category", "sub_sub_sub_category"]
+
+COLOURS = ["black", "white", "blue", "red", "green", "grey", "brown", "pink"]
+
+
+def category_paths():
+    return [
+        (category, sub_category, sub_sub_category, leaf)
+        for category, sub_categories in CATEGORIES.items()
+        for sub_category, sub_sub_categories in sub_categories.items()
+        for sub_sub_category, leaves in sub_sub_categories.items()
+        for leaf in leaves
+    ]
+
+
+def synthetic_catalog(n_products, seed=0):
+    """
+    Generates `n_products` inventory documents over a fixed category tree.
+    """
+    rng = np.random.default_rng(seed)
+    paths = category_paths()
+
+    products = []
+    for i in range(n_products):
+        category, sub_category, sub_sub_category, leaf = paths[rng.integers(len(paths))]
+        brand = BRANDS[rng.integers(len(BRANDS))]
+        price = int(rng.integers(199, 9999))
+
+        products.append({
+            "product_id": f"P{i:07d}",
+            "name": f"{brand} {ADJECTIVES[rng.integers(len(ADJECTIVES))]} {COLOURS[rng.integers(len(COLOURS))]} {leaf}",
+            "brand": brand,
+            "category": category,
+            "sub_category": sub_category,
+            "sub_sub_category": sub_sub_category,
+            "sub_sub_sub_category": leaf,
+            "price": price,
+            "discounted_price": round(price * float(rng.uniform(0.5, 1.0)), 2),
+            "item_image_url": ""
+        })
+
+    return products
+
+
+def not_found(index, doc_id):
+    meta = ApiResponseMeta(
+        status=404,
+        http_version="1.1",
+        headers=HttpHeaders(),
+        duration=0.0,
+        node=NodeConfig("http", "localhost", 9200)
+    )
+    return NotFoundError(
+        message=f"[{doc_id}]: document missing",
+        meta=meta,
+        body={"_index": index, "_id": doc_id, "found": False}
+    )
+
+
+def filter_source(source, _source):
+    """
+    Applies an ES `_source` option (bool, field list or includes/excludes).
+    """
+    if _source is None or _source is True:
+        return copy.deepcopy(source)
+    if _source is False:
+        return None
+
+    if isinstance(_source, str):
+        _source = [_source]
+    if isinstance(_source, list):
+        _source = {"includes": _source}
+
+    includes = _source.get("includes")
+    excludes = set(_source.get("excludes") or [])
+
+    return copy.deepcopy({
+        field: value
+        for field, value in source.items()
+        if (not includes or field in includes) and field not in excludes
+    })
+
+
+def matches(source, doc_id, query):
+    """
+    Evaluates the query DSL subset the app uses against one document.
+    """
+    if not query or "match_all" in query:
+        return True
+
+    if "term" in query:
+        (field, term), = query["term"].items()
+        value = term.get("value") if isinstance(term, dict) else term
+        return source.get(field) == value
+
+    if "terms" in query:
+        (field, values), = query["terms"].items()
+        return source.get(field) in values
+
+    if "ids" in query:
+        return doc_id in query["ids"]["values"]
+
+    if "range" in query:
+        (field, bounds), = query["range"].items()
+        value = source.get(field)
+        if value is None:
+            return False
+        return (
+            ("gte" not in bounds or value >= bounds["gte"]) and ("gt" not in bounds or value > bounds["gt"])
+            and ("lte" not in bounds or value <= bounds["lte"]) and ("lt" not in bounds or value < bounds["lt"])
+        )
+
+    if "bool" in query:
+        bool_query = query["bool"]
+        if not all(matches(source, doc_id, clause) for clause in as_list(bool_query.get("must")) + as_list(bool_query.get("filter"))):
+            return False
+        if any(matches(source, doc_id, clause) for clause in as_list(bool_query.get("must_not"))):
+            return False
+
+        should = as_list(bool_query.get("should"))
+        has_required = bool_query.get("must") or bool_query.get("filter")
+        minimum = bool_query.get("minimum_should_match", 0 if has_required or not should else 1)
+        return sum(matches(source, doc_id, clause) for clause in should) >= int(minimum)
+
+    raise NotImplementedError(f"FakeElasticsearch does not support query: {list(query)}")
+
+
+def sort_spec(sort):
+    """
+    Normalizes an ES `sort` option to [(field, descending), ...].
+    """
+    spec = []
+    for clause in as_list(sort):
+        if isinstance(clause, str):
+            spec.append((clause, clause == "_score"))
+        else:
+            (field, order), = clause.items()
+            order = order.get("order", "asc") if isinstance(order, dict) else order
+            spec.append((field, order == "desc"))
+
+    return spec
+
+
+def compare_sort_values(left, right, spec):
+    for a, b, (_, descending) in zip(left, right, spec):
+        if a == b:
+            continue
+        if a is None or b is None:
+            # Missing values sort last
+            return 1 if a is None else -1
+        result = -1 if a < b else 1
+        return -result if descending else result
+
+    return 0
+
+
+def as_list(clauses):
+    if clauses is None:
+        return []
+    return clauses if isinstance(clauses, list) else [clauses]
+
+
+class FakeElasticsearch:
+    """
+    Thread-safe in-memory stand-in for the sync `Elasticsearch` client.
+
+    Args:
+        latency_ms (float): Simulated round-trip time added to every call.
+    """
+
+    def __init__(self, latency_ms=0.0):
+        self.latency = latency_ms / 1000.0
+        self.indices = {}
+        self.vectors = {}
+        self.postings = {}
+        self.pits = {}
+        self.pit_ids = itertools.count(1)
+        self.lock = threading.RLock()
+        self.calls = {}
+
+    # ----------------- LOADING -----------------
+    def load_inventory(self, index, products, embeddings):
+        """
+        Bulk-loads documents with their embedding matrix (rows in `products`
+        order). Embeddings are kept out of `_source` to save memory.
+        """
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+        with self.lock:
+            self.indices[index] = {product["product_id"]: dict(product) for product in products}
+            self.vectors[index] = ([product["product_id"] for product in products], matrix)
+
+            postings = {field: {} for field in KEYWORD_FIELDS}
+            for product in products:
+                for field in KEYWORD_FIELDS:
+                    postings[field].setdefault(product.get(field), []).append(product["product_id"])
+            self.postings[index] = postings
+
+    def shared_view(self, latency_ms=0.0):
+        """
+        Another client over the same data (and call counters).
+        """
+        view = FakeElasticsearch(latency_ms)
+        view.indices = self.indices
+        view.vectors = self.vectors
+        view.postings = self.postings
+        view.pits = self.pits
+        view.pit_ids = self.pit_ids
+        view.lock = self.lock
+        view.calls = self.calls
+        return view
+
+    def reset_index(self, index):
+        with self.lock:
+            self.indices.pop(index, None)
+            self.vectors.pop(index, None)
+            self.postings.pop(index, None)
+
+    # ----------------- HELPERS -----------------
+    def record(self, api):
+        with self.lock:
+            self.calls[api] = self.calls.get(api, 0) + 1
+
+        if self.latency:
+            time.sleep(self.latency)
+
+    def should_scores(self, index, query):
+        """
+        Boost sums for the bool `should` term clauses, via the keyword postings
+        built at load time (a full scan for other fields), for documents
+        matching the bool `filter`.
+        """
+        docs = self.indices.get(index, {})
+        filters = as_list(query.get("bool", {}).get("filter"))
+
+        scores = {}
+        for clause in as_list(query.get("bool", {}).get("should")):
+            if "term" not in clause:
+                continue
+
+            (field, term), = clause["term"].items()
+            value = term.get("value") if isinstance(term, dict) else term
+            boost = term.get("boost", 1.0) if isinstance(term, dict) else 1.0
+
+            postings = self.postings.get(index, {}).get(field)
+            if postings is not None:
+                doc_ids = postings.get(value, ())
+            else:
+                doc_ids = [doc_id for doc_id, source in self.indices.get(index, {}).items() if source.get(field) == value]
+
+            for doc_id in doc_ids:
+                if filters and not matches(docs[doc_id], doc_id, {"bool": {"filter": filters}}):
+                    continue
+                scores[doc_id] = scores.get(doc_id, 0.0) + boost
+
+        return scores
+
+    def knn_scores(self, index, knn):
+        product_ids, matrix = self.vectors[index]
+
+        query = np.asarray(knn["query_vector"], dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        cosine = matrix @ query
+
+        # Pre-filter: only matching documents compete for the candidate slots
+        rows = np.arange(len(product_ids))
+        if knn.get("filter"):
+            docs = self.indices.get(index, {})
+            pre_filter = {"bool": {"filter": as_list(knn["filter"])}}
+            rows = np.array([row for row in rows if matches(docs[product_ids[row]], product_ids[row], pre_filter)], dtype=np.int64)
+
+        num_candidates = min(knn.get("num_candidates", knn.get("k", 10)), len(rows))
+        k = min(knn.get("k", 10), num_candidates)
+        if not num_candidates:
+            return {}
+
+        candidates = rows[np.argpartition(-cosine[rows], num_candidates - 1)[:num_candidates]]
+        top = candidates[np.argsort(-cosine[candidates], kind="stable")][:k]
+
+        return {product_ids[row]: (1.0 + float(cosine[row])) / 2.0 for row in top}
+
+    # ----------------- SEARCH -----------------
+    def open_point_in_time(self, index, keep_alive=None, **kwargs):
+        self.record("open_point_in_time")
+
+        with self.lock:
+            pit_id = f"pit-{next(self.pit_ids)}"
+            self.pits[pit_id] = index
+
+        return {"id": pit_id}
+
+    def close_point_in_time(self, id=None, body=None, **kwargs):
+        self.record("close_point_in_time")
+
+        with self.lock:
+            found = self.pits.pop(id or (body or {}).get("id"), None) is not None
+
+        return {"succeeded": found, "num_freed": int(found)}
+
+    def search(self, index=None, body=None, **kwargs):
+        self.record("search")
+        body = body or kwargs
+
+        with self.lock:
+            pit_id = (body.get("pit") or {}).get("id")
+            if pit_id is not None:
+                if pit_id not in self.pits:
+                    raise not_found("_pit", pit_id)
+                index = self.pits[pit_id]
+
+            docs = self.indices.get(index, {})
+            query = body.get("query")
+
+            if "knn" in body:
+                scores = self.knn_scores(index, body["knn"])
+                if query:
+                    # Hybrid: knn hits plus lexical matches, scores summed
+                    for doc_id, boost in self.should_scores(index, query).items():
+                        scores[doc_id] = scores.get(doc_id, 0.0) + boost
+            else:
+                scores = {doc_id: 1.0 for doc_id, source in docs.items() if matches(source, doc_id, query)}
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            _from = body.get("from", 0)
+            size = body.get("size", 10)
+
+            spec = sort_spec(body.get("sort"))
+            sort_values = {}
+            if spec:
+                positions = {doc_id: position for position, doc_id in enumerate(docs)}
+                for doc_id, score in ranked:
+                    sort_values[doc_id] = [
+                        score if field == "_score" else positions[doc_id] if field == "_shard_doc" else docs[doc_id].get(field)
+                        for field, _ in spec
+                    ]
+
+                ranked.sort(key=functools.cmp_to_key(
+                    lambda a, b: compare_sort_values(sort_values[a[0]], sort_values[b[0]], spec)
+                ))
+
+                if body.get("search_after"):
+                    ranked = [
+                        (doc_id, score) for doc_id, score in ranked
+                        if compare_sort_values(sort_values[doc_id], body["search_after"], spec) > 0
+                    ]
+
+            hits = []
+            for doc_id, score in ranked[_from:_from + size]:
+                hit = {
+                    "_index": index,
+                    "_id": doc_id,
+                    "_score": score,
+                    "_source": filter_source(docs[doc_id], body.get("_source"))
+                }
+                if spec:
+                    hit["sort"] = sort_values[doc_id]
+                hits.append(hit)
+
+            response = {
+                "took": 0,
+                "timed_out": False,
+                "hits": {
+                    "total": {"value": len(ranked), "relation": "eq"},
+                    "max_score": ranked[0][1] if ranked else None,
+                    "hits": hits
+                }
+            }
+
+            if pit_id is not None:
+                response["pit_id"] = pit_id
+
+            if body.get("aggs") or body.get("aggregations"):
+                matched = [docs[doc_id] for doc_id, _ in ranked]
+                response["aggregations"] = self.aggregate(matched, body.get("aggs") or body.get("aggregations"))
+
+        return response
+
+    def aggregate(self, sources, aggs):
+        results = {}
+        for name, agg in aggs.items():
+            if "terms" not in agg:
+                raise NotImplementedError(f"FakeElasticsearch does not support aggregation: {list(agg)}")
+
+            field = agg["terms"]["field"]
+            counts = {}
+            for source in sources:
+                value = source.get(field)
+                if value is not None:
+                    counts[value] = counts.get(value, 0) + 1
+
+            buckets = sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+            results[name] = {
+                "doc_count_error_upper_bound": 0,
+                "sum_other_doc_count": sum(count for _, count in buckets[agg["terms"].get("size", 10):]),
+                "buckets": [
+                    {"key": key, "doc_count": count}
+                    for key, count in buckets[:agg["terms"].get("size", 10)]
+                ]
+            }
+
+        return results
+
+    # ----------------- DOCUMENTS -----------------
+    def index(self, index, id, document=None, body=None, **kwargs):
+        self.record("index")
+
+        with self.lock:
+            docs = self.indices.setdefault(index, {})
+            result = "updated" if id in docs else "created"
+            docs[id] = copy.deepcopy(document if document is not None else body)
+
+        return {"_index": index, "_id": id, "result": result}
+
+    def get(self, index, id, _source=None, **kwargs):
+        self.record("get")
+
+        with self.lock:
+            source = self.indices.get(index, {}).get(id)
+            if source is None:
+                raise not_found(index, id)
+
+            return {"_index": index, "_id": id, "found": True, "_source": filter_source(source, _source)}
+
+    def mget(self, index, body=None, **kwargs):
+        self.record("mget")
+        body = body or kwargs
+        requests = body.get("docs") or [{"_id": doc_id} for doc_id in body.get("ids", [])]
+
+        with self.lock:
+            docs = self.indices.get(index, {})
+            response_docs = []
+
+            for request in requests:
+                source = docs.get(request["_id"])
+                if source is None:
+                    response_docs.append({"_index": index, "_id": request["_id"], "found": False})
+                else:
+                    response_docs.append({
+                        "_index": index,
+                        "_id": request["_id"],
+                        "found": True,
+                        "_source": filter_source(source, request.get("_source"))
+                    })
+
+        return {"docs": response_docs}
+
+    def update(self, index, id, body=None, doc=None, **kwargs):
+        self.record("update")
+        partial = doc if doc is not None else (body or {}).get("doc", {})
+
+        with self.lock:
+            source = self.indices.get(index, {}).get(id)
+            if source is None:
+                raise not_found(index, id)
+
+            source.update(copy.deepcopy(partial))
+
+        return {"_index": index, "_id": id, "result": "updated"}
+
+    def ping(self, **kwargs):
+        return True
+
+    def options(self, **kwargs):
+        # Per-request options (request_timeout, ...) have no effect here
+        return self
+
+    def close(self):
+        pass
+
+
+class FakeAsyncElasticsearch:
+    """
+    `AsyncElasticsearch`-shaped wrapper over a `FakeElasticsearch`; the
+    simulated latency is awaited instead of slept.
+    """
+
+    def __init__(self, sync_client):
+        self.latency = sync_client.latency
+        self.sync = sync_client.shared_view()
+
+    async def call(self, api, *args, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return getattr(self.sync, api)(*args, **kwargs)
+
+    async def search(self, *args, **kwargs):
+        return await self.call("search", *args, **kwargs)
+
+    async def index(self, *args, **kwargs):
+        return await self.call("index", *args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return await self.call("get", *args, **kwargs)
+
+    async def mget(self, *args, **kwargs):
+        return await self.call("mget", *args, **kwargs)
+
+    async def update(self, *args, **kwargs):
+        return await self.call("update", *args, **kwargs)
+
+    async def open_point_in_time(self, *args, **kwargs):
+        return await self.call("open_point_in_time", *args, **kwargs)
+
+    async def close_point_in_time(self, *args, **kwargs):
+        return await self.call("close_point_in_time", *args, **kwargs)
+
+    async def ping(self, **kwargs):
+        return True
+
+    def options(self, **kwargs):
+        return self
+
+    async def close(self):
+        pass
@@ -0,0 +1,435 @@
+"""
+Latency / throughput benchmarks for search, the result cache, PDP
+recommendations and the rerank queue, run against the in-memory ES
+stand-in with a stub embedding model and a stub LLM.
+
+A query log (one query per line, or JSONL with a "query" field) is replayed
+at a fixed concurrency. Each scenario reports p50 / p95 / p99 latency and
+throughput, and the whole run is written as JSON so it can be compared with
+a baseline run:
+
+    python -m benchmarks.run_benchmarks --catalog-size 20000 --concurrency 8 --out bench.json
+    python -m benchmarks.run_benchmarks --queries logs/queries.txt --baseline bench.json
+
+Scenarios:
+- search_miss: first-time queries (empty caches, inline rerank, enqueue)
+- search_hit_l1: repeated queries served from the in-process L1
+- search_hit_l2: repeated queries served from the ES cache index (L1 off)
+- get_cached_results: legacy cache read API (L1 off)
+- pdp_miss / pdp_hit: PDP recommendations before / after their rerank
+- rerank_queue: background worker pool draining one job per unique query
+"""
+import argparse
+import json
+import os
+import platform
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.fake_es import ADJECTIVES, COLOURS, FakeElasticsearch, synthetic_catalog
+from benchmarks.stubs import StubEmbeddingModel, StubLLM
+from config import config
+from src.pipeline.ingest_catalog import build_embedding_text
+from src.recommendations.recommendations import pdp_recommendations
+from src.services import llm_reranking_services, queue_service
+from src.services.caching_service import l1_cache
+from src.services.caching_service.get_cache import get_cached_results
+from src.services.caching_service.local_cache import LocalCache
+from src.services.embedding_service import embedding_cache
+from src.services.inventory_search_service import search_inventory
+
+SCENARIOS = [
+    "search_miss",
+    "search_hit_l1",
+    "search_hit_l2",
+    "get_cached_results",
+    "pdp_miss",
+    "pdp_hit",
+    "rerank_queue"
+]
+
+INDEX_NAME = config.INVENTORY_INDEX
+
+
+# ----------------- WORKLOAD -----------------
+def load_queries(path):
+    with open(path) as f:
+        if path.endswith(".jsonl"):
+            return [json.loads(line)["query"] for line in f if line.strip()]
+        return [line.strip() for line in f if line.strip()]
+
+
+def synthetic_queries(products, n_queries, n_unique, seed=0):
+    """
+    Head-heavy (Zipf-like) query log over `n_unique` distinct queries.
+    """
+    rng = np.random.default_rng(seed)
+
+    unique = []
+    seen = set()
+    while len(unique) < n_unique and len(seen) < 50 * n_unique:
+        product = products[rng.integers(len(products))]
+        leaf = product["sub_sub_sub_category"].lower()
+        query = [
+            leaf,
+            f"{product['brand'].lower()} {leaf}",
+            f"{COLOURS[rng.integers(len(COLOURS))]} {leaf}",
+            f"{ADJECTIVES[rng.integers(len(ADJECTIVES))]} {product['brand'].lower()} {leaf}"
+        ][rng.integers(4)]
+
+        if query not in seen:
+            seen.add(query)
+            unique.append(query)
+
+    weights = 1.0 / np.arange(1, len(unique) + 1)
+    return [unique[i] for i in rng.choice(len(unique), size=n_queries, p=weights / weights.sum())]
+
+
+def unique_in_order(items):
+    return list(dict.fromkeys(items))
+
+
+# ----------------- MEASUREMENT -----------------
+def percentile_ms(latencies, q):
+    return round(float(np.percentile(latencies, q)) * 1000, 3) if len(latencies) else None
+
+
+def summarize(latencies, errors, wall_time):
+    latencies = np.asarray(latencies, dtype=np.float64)
+    return {
+        "requests": int(len(latencies)),
+        "errors": errors,
+        "p50_ms": percentile_ms(latencies, 50),
+        "p95_ms": percentile_ms(latencies, 95),
+        "p99_ms": percentile_ms(latencies, 99),
+        "mean_ms": round(float(latencies.mean()) * 1000, 3) if len(latencies) else None,
+        "max_ms": round(float(latencies.max()) * 1000, 3) if len(latencies) else None,
+        "throughput_per_sec": round(len(latencies) / wall_time, 2) if wall_time else None,
+        "wall_sec": round(wall_time, 3)
+    }
+
+
+def replay(operation, items, concurrency):
+    """
+    Runs `operation(item)` for every item on `concurrency` threads.
+    """
+    def timed(item):
+        start = time.perf_counter()
+        try:
+            operation(item)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    latencies = []
+    errors = 0
+    first_error = None
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for latency, error in pool.map(timed, items):
+            latencies.append(latency)
+            if error is not None:
+                errors += 1
+                first_error = first_error or error
+    wall_time = time.perf_counter() - wall_start
+
+    if first_error is not None:
+        print(f"⚠️ {errors} errors, first: {first_error!r}")
+
+    return summarize(latencies, errors, wall_time)
+
+
+# ----------------- STATE -----------------
+def reset_rerank_queue():
+    while True:
+        try:
+            queue_service.rerank_queue.get_nowait()
+            queue_service.rerank_queue.task_done()
+        except queue.Empty:
+            break
+
+    with queue_service.rerank_lock:
+        queue_service.rerank_in_progress.clear()
+
+
+def reset_caches(es):
+    l1_cache.result_cache.clear()
+    embedding_cache.clear()
+    es.reset_index(config.CACHE_INDEX)
+    reset_rerank_queue()
+
+
+def drain_rerank_queue(es, model=None):
+    """
+    Processes everything queued in the foreground (no worker threads).
+    """
+    while True:
+        jobs = []
+        while len(jobs) < config.RERANK_BATCH_SIZE:
+            try:
+                jobs.append(queue_service.rerank_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        if not jobs:
+            return
+
+        failures = queue_service.process_rerank_batch(jobs, es, model)
+        queue_service.finish_rerank_batch(jobs, failures, "benchmark")
+
+
+class L1Disabled:
+    """
+    Context manager that routes L1 lookups to an always-empty cache.
+    """
+
+    def __enter__(self):
+        self.original = l1_cache.result_cache
+        l1_cache.result_cache = LocalCache(maxsize=0)
+
+    def __exit__(self, *exc):
+        l1_cache.result_cache = self.original
+
+
+def configure(args):
+    """
+    Pins the backends the stand-in supports, independent of the environment.
+    """
+    config.VECTOR_BACKEND = "elasticsearch"
+    config.INTENT_BACKEND = "knn"
+    config.RERANK_QUEUE_BACKEND = "memory"
+    config.ITEM_NEIGHBOURS_DIR = os.path.join(os.devnull, "none")
+    config.INLINE_RERANKER = args.inline_reranker
+    config.BACKGROUND_RERANKER = args.background_reranker
+    config.SEARCH_DEADLINE_MS = config.PDP_DEADLINE_MS = args.deadline_ms
+
+
+def build_environment(args):
+    model = StubEmbeddingModel(dims=config.EMBEDDING_DIMS)
+    products = synthetic_catalog(args.catalog_size, seed=args.seed)
+
+    es = FakeElasticsearch()
+    embeddings = model.encode([build_embedding_text(product) for product in products], batch_size=1024)
+    es.load_inventory(INDEX_NAME, products, embeddings)
+
+    # Simulated costs apply to the benchmarked calls only, not to loading
+    es.latency = args.es_latency_ms / 1000.0
+    model.batch_delay = args.encode_ms / 1000.0
+
+    return model, es, products
+
+
+# ----------------- SCENARIOS -----------------
+def run_search_scenarios(args, model, es, queries, results):
+    unique_queries = unique_in_order(queries)
+
+    def search(query):
+        return search_inventory(query, 0, args.page_size, model, INDEX_NAME, es)
+
+    reset_caches(es)
+    results["search_miss"] = replay(search, unique_queries, args.concurrency)
+
+    # Warm the cache as the rerank worker would (stub LLM answers instantly)
+    reset_caches(es)
+    for query in unique_queries:
+        search(query)
+        drain_rerank_queue(es, model)
+
+    results["search_hit_l1"] = replay(search, queries, args.concurrency)
+
+    with L1Disabled():
+        results["search_hit_l2"] = replay(search, queries, args.concurrency)
+        results["get_cached_results"] = replay(
+            lambda query: get_cached_results(query.strip().lower(), config.search_type, es, 0, args.page_size),
+            queries,
+            args.concurrency
+        )
+
+
+def run_pdp_scenarios(args, model, es, products, results):
+    rng = np.random.default_rng(args.seed + 1)
+    items = [products[i] for i in rng.choice(len(products), size=min(args.pdp_requests, len(products)), replace=False)]
+
+    def recommend(item):
+        return pdp_recommendations(item["name"], item["product_id"], model, INDEX_NAME, es, num_recs=5)
+
+    reset_rerank_queue()
+    results["pdp_miss"] = replay(recommend, items, args.concurrency)
+
+    drain_rerank_queue(es, model)
+    results["pdp_hit"] = replay(recommend, items, args.concurrency)
+
+
+def run_rerank_queue_scenario(args, es, products, queries, stub_llm, results):
+    """
+    Enqueues one job per unique query and lets the worker pool drain them
+    through the (rate-limited, batched) stub LLM.
+    """
+    reset_caches(es)
+    rng = np.random.default_rng(args.seed + 2)
+
+    completed_at = {}
+    completed_lock = threading.Lock()
+    set_cached_results = queue_service.set_cached_results
+
+    def timed_set_cached_results(query, *rest, **kwargs):
+        response = set_cached_results(query, *rest, **kwargs)
+        with completed_lock:
+            completed_at[query] = time.perf_counter()
+        return response
+
+    queue_service.set_cached_results = timed_set_cached_results
+    queue_service.llm_rate_limiter = queue_service.TokenBucket(args.llm_rate, args.llm_burst)
+    stub_llm.delay = args.llm_delay_ms / 1000.0
+    llm_calls_before = stub_llm.calls
+
+    enqueued_at = {}
+    dropped = 0
+
+    wall_start = time.perf_counter()
+    for query in unique_in_order(queries):
+        candidates = [products[i] for i in rng.choice(len(products), size=config.CACHE_DEPTH, replace=False)]
+        enqueued_at[query] = time.perf_counter()
+        if not queue_service.enqueue_rerank(query, candidates, config.search_type):
+            dropped += 1
+
+    queue_service.start_rerank_worker(es, args.rerank_workers)
+
+    deadline = time.perf_counter() + args.rerank_timeout
+    while len(completed_at) < len(enqueued_at) - dropped and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    wall_time = time.perf_counter() - wall_start
+
+    queue_service.set_cached_results = set_cached_results
+
+    latencies = [completed_at[query] - enqueued_at[query] for query in completed_at]
+    summary = summarize(latencies, len(enqueued_at) - dropped - len(completed_at), wall_time)
+    summary.update({
+        "dropped": dropped,
+        "llm_calls": stub_llm.calls - llm_calls_before,
+        "jobs_per_llm_call": round(len(completed_at) / max(stub_llm.calls - llm_calls_before, 1), 2)
+    })
+    results["rerank_queue"] = summary
+
+
+# ----------------- REPORTING -----------------
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Flags scenarios whose p95 grew or throughput fell by more than `tolerance`.
+    """
+    regressions = []
+    for scenario, current in results.items():
+        previous = baseline.get("results", {}).get(scenario)
+        if not previous:
+            continue
+
+        if previous.get("p95_ms") and current.get("p95_ms") and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{scenario}: p95 {previous['p95_ms']}ms → {current['p95_ms']}ms")
+
+        if (
+            previous.get("throughput_per_sec") and current.get("throughput_per_sec")
+            and current["throughput_per_sec"] < previous["throughput_per_sec"] * (1 - tolerance)
+        ):
+            regressions.append(
+                f"{scenario}: throughput {previous['throughput_per_sec']}/s → {current['throughput_per_sec']}/s"
+            )
+
+    return regressions
+
+
+def print_table(results):
+    print(f"{'scenario':<20}{'requests':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'errors':>8}")
+    for scenario, row in results.items():
+        print(
+            f"{scenario:<20}{row['requests']:>10}{str(row['p50_ms']):>10}{str(row['p95_ms']):>10}"
+            f"{str(row['p99_ms']):>10}{str(row['throughput_per_sec']):>10}{row['errors']:>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search, cache, PDP and rerank-queue paths.")
+    parser.add_argument("--queries", help="Query log: one query per line, or .jsonl with a 'query' field")
+    parser.add_argument("--num-queries", type=int, default=1000, help="Synthetic log length (without --queries)")
+    parser.add_argument("--unique-queries", type=int, default=200, help="Distinct synthetic queries")
+    parser.add_argument("--catalog-size", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--pdp-requests", type=int, default=200)
+    parser.add_argument("--es-latency-ms", type=float, default=2.0, help="Simulated ES round trip")
+    parser.add_argument("--encode-ms", type=float, default=5.0, help="Simulated model forward pass")
+    parser.add_argument("--llm-delay-ms", type=float, default=500.0, help="Simulated LLM call latency")
+    parser.add_argument("--llm-rate", type=float, default=config.RERANK_LLM_CALLS_PER_SEC)
+    parser.add_argument("--llm-burst", type=float, default=config.RERANK_LLM_BURST)
+    parser.add_argument("--rerank-workers", type=int, default=config.RERANK_WORKERS)
+    parser.add_argument("--rerank-timeout", type=float, default=300.0)
+    parser.add_argument("--inline-reranker", default=config.INLINE_RERANKER, choices=["local", "none"])
+    parser.add_argument("--background-reranker", default=config.BACKGROUND_RERANKER, choices=["llm", "local"])
+    parser.add_argument("--deadline-ms", type=float, default=0.0, help="Search / PDP latency budget (0 = none, full pipeline)")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Previous --out file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    configure(args)
+
+    stub_llm = StubLLM(delay_ms=0.0)
+    llm_reranking_services.complete = stub_llm
+    queue_service.llm_rate_limiter = queue_service.TokenBucket(rate=1e9, capacity=1e9)
+
+    model, es, products = build_environment(args)
+    queries = (
+        load_queries(args.queries) if args.queries
+        else synthetic_queries(products, args.num_queries, args.unique_queries, seed=args.seed)
+    )
+
+    results = {}
+    if any(scenario.startswith("search") or scenario == "get_cached_results" for scenario in args.scenarios):
+        run_search_scenarios(args, model, es, queries, results)
+    if any(scenario.startswith("pdp") for scenario in args.scenarios):
+        run_pdp_scenarios(args, model, es, products, results)
+    if "rerank_queue" in args.scenarios:
+        run_rerank_queue_scenario(args, es, products, queries, stub_llm, results)
+
+    results = {scenario: results[scenario] for scenario in SCENARIOS if scenario in args.scenarios}
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "parameters": {
+            key: value for key, value in vars(args).items()
+            if key not in ("out", "baseline")
+        },
+        "queries": {"total": len(queries), "unique": len(set(queries))},
+        "results": results
+    }
+
+    print_table(results)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+
+        if regressions:
+            print("❌ Regressions vs baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+
+        print("✅ No regressions vs baseline")
+
+
+if __name__ == "__main__":
+    main()
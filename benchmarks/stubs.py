@@ -0,0 +1,104 @@
+"""
+Deterministic stand-ins for the embedding model and the LLM.
+"""
+import json
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+CANDIDATE_ALIAS_PATTERN = re.compile(r"^\s*(\d+)\. ", re.MULTILINE)
+QUERY_SECTION_PATTERN = re.compile(r"### Query (\d+):")
+
+
+class StubEmbeddingModel:
+    """
+    SentenceTransformer-compatible `encode` without a network or GPU.
+
+    A text's vector is the normalized sum of fixed random vectors of its
+    tokens, so texts sharing words are close and kNN results are meaningful.
+
+    Args:
+        dims (int): Embedding dimensions.
+        batch_delay_ms (float): Simulated inference time per forward pass.
+        item_delay_ms (float): Simulated inference time per text.
+    """
+
+    def __init__(self, dims=384, batch_delay_ms=0.0, item_delay_ms=0.0):
+        self.dims = dims
+        self.batch_delay = batch_delay_ms / 1000.0
+        self.item_delay = item_delay_ms / 1000.0
+        self.token_vectors = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.texts_encoded = 0
+
+    def token_vector(self, token):
+        vector = self.token_vectors.get(token)
+        if vector is None:
+            rng = np.random.default_rng(zlib.crc32(token.encode()))
+            vector = rng.standard_normal(self.dims).astype(np.float32)
+            self.token_vectors[token] = vector
+
+        return vector
+
+    def get_sentence_embedding_dimension(self):
+        return self.dims
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+
+        with self.lock:
+            self.calls += 1
+            self.texts_encoded += len(texts)
+
+        batches = max(1, -(-len(texts) // batch_size))
+        delay = batches * self.batch_delay + len(texts) * self.item_delay
+        if delay:
+            time.sleep(delay)
+
+        vectors = np.zeros((len(texts), self.dims), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in TOKEN_PATTERN.findall(str(text).lower()):
+                vectors[i] += self.token_vector(token)
+
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors[0] if single else vectors
+
+
+class StubLLM:
+    """
+    Replacement for `llm_reranking_services.complete`.
+
+    Answers single and batched rerank prompts with the candidate numbers in
+    prompt order (a valid, complete ranking) after a configurable delay.
+
+    Args:
+        delay_ms (float): Simulated LLM latency per call.
+    """
+
+    def __init__(self, delay_ms=0.0):
+        self.delay = delay_ms / 1000.0
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def __call__(self, prompt):
+        with self.lock:
+            self.calls += 1
+
+        if self.delay:
+            time.sleep(self.delay)
+
+        sections = QUERY_SECTION_PATTERN.split(prompt)
+        if len(sections) == 1:
+            return json.dumps([int(alias) for alias in CANDIDATE_ALIAS_PATTERN.findall(prompt)])
+
+        # Batched prompt: "### Query <n>:" headers, each followed by its candidates
+        return json.dumps({
+            number: [int(alias) for alias in CANDIDATE_ALIAS_PATTERN.findall(section)]
+            for number, section in zip(sections[1::2], sections[2::2])
+        })
@@ -10,4 +10,151 @@ INVENTORY_INDEX = "flipkart_products"
 recommendation_type = "recommendations"
 search_type = "search"
 
-print(ELASTICSEARCH_PASSWORD)
\ No newline at end of file
+# Query embedding cache (in-process, per worker)
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", 10000))
+EMBEDDING_CACHE_TTL = int(os.environ.get("EMBEDDING_CACHE_TTL", 3600))
+EMBEDDING_BATCH_SIZE = 64
+
+# Executor threads used by the async search path for model inference
+ASYNC_ENCODE_WORKERS = int(os.environ.get("ASYNC_ENCODE_WORKERS", 2))
+
+# L1 result cache in front of CACHE_INDEX (in-process, per worker)
+L1_CACHE_SIZE = int(os.environ.get("L1_CACHE_SIZE", 2000))
+L1_CACHE_TTL = int(os.environ.get("L1_CACHE_TTL", 600))
+
+# Deep ranked cache: IDs stored per query, and how many of them the LLM reranks
+CACHE_DEPTH = 200
+CACHE_EXTENSION_STEP = 100
+CACHE_MAX_DEPTH = 1000
+RERANK_WINDOW = 50
+
+# kNN depth scaling: k = max(KNN_MIN_K, deepest rank requested), num_candidates = k × factor (bounded)
+KNN_MIN_K = 75
+KNN_MIN_NUM_CANDIDATES = 100
+KNN_NUM_CANDIDATES_FACTOR = 1.5
+KNN_MAX_NUM_CANDIDATES = 10000
+
+# Rerankers: inline on the request path ("local" or "none") and in the background worker ("llm" or "local")
+INLINE_RERANKER = os.environ.get("INLINE_RERANKER", "local")
+BACKGROUND_RERANKER = os.environ.get("BACKGROUND_RERANKER", "llm")
+LOCAL_RERANKER_WEIGHTS = os.environ.get("LOCAL_RERANKER_WEIGHTS", "data/local_reranker_weights.json")
+
+# Rerank worker pool
+RERANK_QUEUE_SIZE = 1000
+RERANK_QUEUE_HIGH_WATERMARK = 800
+RERANK_WORKERS = int(os.environ.get("RERANK_WORKERS", 4))
+RERANK_BATCH_SIZE = int(os.environ.get("RERANK_BATCH_SIZE", 4))
+RERANK_LLM_CALLS_PER_SEC = float(os.environ.get("RERANK_LLM_CALLS_PER_SEC", 2))
+RERANK_LLM_BURST = 4
+
+# Rerank prompt size: approximate token budget per query's candidate list, and how far names may be shortened to fit it
+RERANK_PROMPT_TOKEN_BUDGET = int(os.environ.get("RERANK_PROMPT_TOKEN_BUDGET", 1200))
+RERANK_NAME_MAX_CHARS = 80
+RERANK_NAME_MIN_CHARS = 32
+
+# Rerank queue backend: "memory" (per process) or "sqlite" (durable, shared across processes)
+RERANK_QUEUE_BACKEND = os.environ.get("RERANK_QUEUE_BACKEND", "memory")
+RERANK_QUEUE_DB = os.environ.get("RERANK_QUEUE_DB", "data/rerank_queue.db")
+RERANK_LEASE_SECONDS = 300
+RERANK_MAX_ATTEMPTS = 3
+RERANK_POLL_INTERVAL = 0.5
+
+# Catalog ingestion
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_DIMS = 384
+EMBEDDING_SIMILARITY = "cosine"
+INGEST_EMBED_BATCH_SIZE = 512
+INGEST_BULK_CHUNK_SIZE = 500
+INGEST_BULK_THREADS = 4
+
+# kNN backend: "elasticsearch" (ES knn) or "local" (memory-mapped IVF index, ES only hydrates _source)
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "elasticsearch")
+LOCAL_VECTOR_INDEX_DIR = os.environ.get("LOCAL_VECTOR_INDEX_DIR", "data/vector_index")
+LOCAL_VECTOR_NPROBE = int(os.environ.get("LOCAL_VECTOR_NPROBE", 16))
+
+# Intent inference: "centroid" (precomputed model, falls back to kNN if not built) or "knn"
+INTENT_BACKEND = os.environ.get("INTENT_BACKEND", "centroid")
+INTENT_MODEL_DIR = os.environ.get("INTENT_MODEL_DIR", LOCAL_VECTOR_INDEX_DIR)
+
+# Offline PDP item-to-item table (falls back to live search when absent)
+ITEM_NEIGHBOURS_DIR = os.environ.get("ITEM_NEIGHBOURS_DIR", LOCAL_VECTOR_INDEX_DIR)
+
+# Home page browse snapshot (in-process, refreshed in the background) and "load more" cursors
+BROWSE_SNAPSHOT_TTL = int(os.environ.get("BROWSE_SNAPSHOT_TTL", 300))
+BROWSE_SNAPSHOT_ITEMS = 60
+BROWSE_CATEGORY_COUNT = 100
+BROWSE_PIT_KEEP_ALIVE = "5m"
+
+# HTTP API (src/api). When SEARCH_API_URL is set, Streamlit is a thin client of it
+SEARCH_API_URL = os.environ.get("SEARCH_API_URL")
+SEARCH_API_TIMEOUT = float(os.environ.get("SEARCH_API_TIMEOUT", 10))
+
+# Instrumentation: stage timings / counters (Prometheus text at /metrics) and an optional per-request JSON trace log
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+TRACE_LOG = os.environ.get("TRACE_LOG")
+
+# Cold start: load the embedding model on a background thread (readiness via /ready), and how long a request waits for it
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "1") == "1"
+MODEL_WAIT_TIMEOUT = float(os.environ.get("MODEL_WAIT_TIMEOUT", 30))
+
+# Single-flight: concurrent identical search / PDP / browse requests share one computation; waiters give up after the timeout (seconds)
+SINGLEFLIGHT_ENABLED = os.environ.get("SINGLEFLIGHT_ENABLED", "1") == "1"
+SINGLEFLIGHT_TIMEOUT = float(os.environ.get("SINGLEFLIGHT_TIMEOUT", 10))
+
+# Cross-request encode micro-batching: single-text encodes from concurrent callers are batched for up to MAX_WAIT_MS or MAX_SIZE texts
+ENCODE_BATCHING = os.environ.get("ENCODE_BATCHING", "1") == "1"
+ENCODE_BATCH_MAX_WAIT_MS = float(os.environ.get("ENCODE_BATCH_MAX_WAIT_MS", 2))
+ENCODE_BATCH_MAX_SIZE = int(os.environ.get("ENCODE_BATCH_MAX_SIZE", 32))
+# Max wait (s) for a micro-batched encode outside a request deadline (inside one, the remaining budget caps it)
+ENCODE_TIMEOUT = float(os.environ.get("ENCODE_TIMEOUT", 10))
+
+# Cache invalidation: entries carry the catalog generation (bumped by ingestion) and expire after CACHE_ENTRY_TTL seconds
+CATALOG_STATE_INDEX = "catalog_state"
+CATALOG_GENERATION_CHECK_INTERVAL = int(os.environ.get("CATALOG_GENERATION_CHECK_INTERVAL", 30))
+CACHE_ENTRY_TTL = int(os.environ.get("CACHE_ENTRY_TTL", 86400))
+
+# Background sweeper: deletes stale / duplicate cache entries and keeps the cache index under CACHE_MAX_ENTRIES
+CACHE_SWEEP_INTERVAL = int(os.environ.get("CACHE_SWEEP_INTERVAL", 900))
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", 200000))
+
+# Typeahead: in-memory prefix index over cached queries and catalog terms, refreshed every SUGGEST_REFRESH_INTERVAL seconds
+SUGGEST_REFRESH_INTERVAL = int(os.environ.get("SUGGEST_REFRESH_INTERVAL", 60))
+SUGGEST_MAX_RESULTS = 10
+SUGGEST_PRECOMPUTED_PREFIX_LEN = 3
+SUGGEST_MAX_SCAN = 5000
+SUGGEST_MAX_TERMS = 5000
+SUGGEST_MAX_QUERIES = 100000
+SUGGEST_MAX_PRODUCT_NAMES = 200000
+# Searches at which a cached query's popularity score saturates
+SUGGEST_QUERY_POPULARITY_SCALE = 1000
+# Seconds between full re-reads of the cached queries, dropping suggestions whose cache entry was deleted
+SUGGEST_RECONCILE_INTERVAL = int(os.environ.get("SUGGEST_RECONCILE_INTERVAL", 600))
+
+# Latency budgets (ms) of a search / PDP request, propagated through its stages; 0 = no deadline
+SEARCH_DEADLINE_MS = float(os.environ.get("SEARCH_DEADLINE_MS", 150))
+PDP_DEADLINE_MS = float(os.environ.get("PDP_DEADLINE_MS", 150))
+# Budget (ms) that must be left to run the optional stages (intent inference, second encode); below it they are skipped
+DEADLINE_INTENT_MIN_MS = float(os.environ.get("DEADLINE_INTENT_MIN_MS", 100))
+DEADLINE_REWRITE_MIN_MS = float(os.environ.get("DEADLINE_REWRITE_MIN_MS", 70))
+# Floor (ms) of the per-request ES timeout derived from the remaining budget
+DEADLINE_MIN_ES_TIMEOUT_MS = float(os.environ.get("DEADLINE_MIN_ES_TIMEOUT_MS", 50))
+# Floor (ms) of the wait for a micro-batched encode derived from the remaining budget
+DEADLINE_MIN_ENCODE_TIMEOUT_MS = float(os.environ.get("DEADLINE_MIN_ENCODE_TIMEOUT_MS", 50))
+# Own budget (ms) of a deep-page cache extension (up to CACHE_MAX_DEPTH), which does not fit in the search budget
+CACHE_EXTEND_DEADLINE_MS = float(os.environ.get("CACHE_EXTEND_DEADLINE_MS", 1000))
+
+# Elasticsearch client: default timeout (seconds), retries and connection pool (kept-alive connections per node)
+ES_REQUEST_TIMEOUT = float(os.environ.get("ES_REQUEST_TIMEOUT", 10))
+ES_MAX_RETRIES = int(os.environ.get("ES_MAX_RETRIES", 2))
+ES_RETRY_ON_TIMEOUT = os.environ.get("ES_RETRY_ON_TIMEOUT", "0") == "1"
+ES_CONNECTIONS_PER_NODE = int(os.environ.get("ES_CONNECTIONS_PER_NODE", 32))
+ES_HTTP_COMPRESS = os.environ.get("ES_HTTP_COMPRESS", "0") == "1"
+
+# ES circuit breaker: opens after FAILURE_THRESHOLD consecutive failed (or slower than SLOW_CALL_MS) calls, probes again after RESET_TIMEOUT seconds
+ES_BREAKER_FAILURE_THRESHOLD = int(os.environ.get("ES_BREAKER_FAILURE_THRESHOLD", 5))
+ES_BREAKER_SLOW_CALL_MS = float(os.environ.get("ES_BREAKER_SLOW_CALL_MS", 1000))
+ES_BREAKER_RESET_TIMEOUT = float(os.environ.get("ES_BREAKER_RESET_TIMEOUT", 5))
+
+# Search facets, counted over the retrieved candidates: top FACET_SIZE values per field, price buckets split at PRICE_FACET_BOUNDS
+FACET_SIZE = int(os.environ.get("FACET_SIZE", 10))
+PRICE_FACET_BOUNDS = [500, 1000, 2500, 5000, 10000]
@@ -1,45 +1,47 @@
 import os
 import streamlit as st
-from elasticsearch import Elasticsearch
-from sentence_transformers import SentenceTransformer
 
-from src.browse.browse_categories import get_all_categories
-from src.browse.browse_items import get_all_items
+from src.browse.browse_snapshot import browse_page, get_browse_categories
 from src.recommendations.recommendations import pdp_recommendations
-from src.search.search import search_catalog
+from src.search.search import search_catalog_page
+from src.services.caching_service.cache_sweeper import start_cache_sweeper
 from src.services.queue_service import start_rerank_worker
 from src.ui_helpers.result_grid import render_results_grid
+from src.services.startup_service import get_es_client, get_model, start_model_warmup
+from src.services.suggestion_service import start_suggestion_refresher, suggest
+from src.api import client as search_api
 from config import config
 
-
-# ================= START RERANK WORKER (SAFE) =================
-# 🔒 Ensure worker starts ONLY ONCE per Streamlit session
-if "rerank_worker_started" not in st.session_state:
-    start_rerank_worker()
-    st.session_state["rerank_worker_started"] = True
-# =============================================================
+# With SEARCH_API_URL set, the app is a thin client of the search API (src/api)
+USE_SEARCH_API = bool(config.SEARCH_API_URL)
 
 
 # ----------------- CACHED BACKEND -----------------
-@st.cache_resource(show_spinner="Loading AI model...")
 def load_model():
-    return SentenceTransformer("all-MiniLM-L6-v2")
-
-@st.cache_resource
-def get_es_client():
-    return Elasticsearch(
-        config.ELASTICSEARCH_URL,
-        basic_auth=(
-            config.ELASTICSEARCH_USER,
-            config.ELASTICSEARCH_PASSWORD
-        ),
-        verify_certs=False
-    )
+    # Warmed in the background since startup; only search / PDP wait for it
+    with st.spinner("Loading AI model..."):
+        return get_model()
 
-model = load_model()
-es = get_es_client()
 INDEX_NAME = config.INVENTORY_INDEX
 
+if not USE_SEARCH_API:
+    # The home page only needs ES, so it renders while the model loads
+    if config.MODEL_WARMUP:
+        start_model_warmup()
+    else:
+        load_model()
+
+    es = get_es_client()
+
+    # ================= START RERANK WORKER (SAFE) =================
+    # 🔒 Ensure worker starts ONLY ONCE per Streamlit session
+    if "rerank_worker_started" not in st.session_state:
+        start_rerank_worker(es)
+        start_cache_sweeper(es)
+        start_suggestion_refresher(es, INDEX_NAME)
+        st.session_state["rerank_worker_started"] = True
+    # =============================================================
+
 
 # ----------------- SESSION STATE -----------------
 if "view" not in st.session_state:
@@ -128,14 +130,21 @@ if st.session_state.view == "PDP" and st.session_state.selected_item:
 
     st.subheader("🔁 You may also like")
 
-    recommended_items = pdp_recommendations(
-        item_name=item.get("name"),
-        item_pid=item.get("product_id"),
-        model=model,
-        INDEX_NAME=INDEX_NAME,
-        es=es,
-        num_recs=5
-    )
+    if USE_SEARCH_API:
+        recommended_items = search_api.pdp_recommendations(
+            item_name=item.get("name"),
+            item_pid=item.get("product_id"),
+            num_recs=5
+        )
+    else:
+        recommended_items = pdp_recommendations(
+            item_name=item.get("name"),
+            item_pid=item.get("product_id"),
+            model=load_model(),
+            INDEX_NAME=INDEX_NAME,
+            es=es,
+            num_recs=5
+        )
 
     render_results_grid(recommended_items)
     st.stop()
@@ -146,30 +155,127 @@ st.title("🛒 Lets Go Shopping!")
 
 col1, col2, col3 = st.columns([1, 2, 1])
 
+def use_suggestion(text):
+    st.session_state.search_box = text
+
+
 with col2:
-    user_query = st.text_input("", placeholder="Search for products...")
+    user_query = st.text_input("", placeholder="Search for products...", key="search_box")
+
+    # Related suggestions (cached queries first) → one click to a cached result
+    if user_query:
+        if USE_SEARCH_API:
+            suggestions = search_api.suggest(user_query, limit=6)
+        else:
+            suggestions = suggest(user_query, INDEX_NAME, limit=6)
+
+        suggestions = [s for s in suggestions if s["text"].lower() != user_query.strip().lower()]
+        if suggestions:
+            for column, suggestion in zip(st.columns(len(suggestions)), suggestions):
+                column.button(
+                    suggestion["text"],
+                    key=f"suggestion_{suggestion['text']}",
+                    on_click=use_suggestion,
+                    args=(suggestion["text"],)
+                )
 
 if user_query:
-    results = search_catalog(
-        user_query=user_query,
-        _from=0,
-        size=20,
-        model=model,
-        INDEX_NAME=INDEX_NAME,
-        es=es
-    )
+
+    # A new query starts unfiltered: the old selections may not even be among its facets
+    if (st.session_state.get("search_query") or (None,))[0] != user_query:
+        for key in ("filter_brand", "filter_category", "filter_min_price", "filter_max_price", "filter_in_stock"):
+            st.session_state.pop(key, None)
+        st.session_state.facet_options = {}
+
+    # Filter widgets are rendered below, once the facets are known; their values live in session state
+    filters = {
+        "brand": st.session_state.get("filter_brand") or None,
+        "category": st.session_state.get("filter_category") or None,
+        "min_price": st.session_state.get("filter_min_price"),
+        "max_price": st.session_state.get("filter_max_price"),
+        "in_stock": st.session_state.get("filter_in_stock", False)
+    }
+
+    def load_search_page(cursor):
+        if USE_SEARCH_API:
+            return search_api.search_page(user_query=user_query, cursor=cursor, size=20, filters=filters)
+        return search_catalog_page(
+            user_query=user_query,
+            cursor=cursor,
+            size=20,
+            model=load_model(),
+            INDEX_NAME=INDEX_NAME,
+            es=es,
+            filters=filters
+        )
+
+    # New query or filters → first page; "Load more" appends the next one via the cursor
+    if st.session_state.get("search_query") != (user_query, filters):
+        st.session_state.search_query = (user_query, filters)
+        try:
+            (
+                st.session_state.search_results,
+                st.session_state.search_cursor,
+                st.session_state.search_facets
+            ) = load_search_page(None)
+        except ValueError as e:
+            st.session_state.search_results, st.session_state.search_cursor, st.session_state.search_facets = [], None, None
+            st.warning(str(e))
+
+    results = st.session_state.search_results
     st.subheader(f"Search Results ({len(results)})")
     render_results_grid(results)
 
+    if st.session_state.search_cursor and st.button("Load more results"):
+        next_results, st.session_state.search_cursor, _ = load_search_page(st.session_state.search_cursor)
+        st.session_state.search_results = results + next_results
+        st.rerun()
+
+    # Facet values seen for this query stay selectable while filters narrow the results
+    facets = st.session_state.search_facets or {}
+    with st.sidebar:
+        st.header("Filters")
+        for field, label in (("brand", "Brand"), ("category", "Category")):
+            counts = {facet["value"]: facet["count"] for facet in facets.get(field, [])}
+            options = st.session_state.facet_options.setdefault(field, [])
+            selected = st.session_state.get(f"filter_{field}") or []
+            options.extend(value for value in [*counts, *selected] if value not in options)
+            st.multiselect(
+                label,
+                options,
+                key=f"filter_{field}",
+                format_func=lambda value, counts=counts: f"{value} ({counts[value]})" if value in counts else value
+            )
+
+        st.number_input("Min price", min_value=0.0, value=None, step=100.0, key="filter_min_price")
+        st.number_input("Max price", min_value=0.0, value=None, step=100.0, key="filter_max_price")
+        st.checkbox("In stock only", key="filter_in_stock")
+
 else:
     st.subheader("🛍️ Popular Categories")
 
-    all_categories_with_counts = get_all_categories(es, INDEX_NAME)[:25]
+    # Served from the in-memory browse snapshot → no ES call per render
+    if USE_SEARCH_API:
+        all_categories_with_counts = search_api.get_all_categories(limit=25)
+    else:
+        all_categories_with_counts = get_browse_categories(es, INDEX_NAME, limit=25)
 
-    browse_items = get_all_items(
-        es=es,
-        INDEX_NAME=INDEX_NAME,
-        size=15
-    )
+    st.caption(" · ".join(
+        f"{bucket['key']} ({bucket['doc_count']})" for bucket in all_categories_with_counts
+    ))
 
-    render_results_grid(browse_items)
+    def load_browse_page(cursor):
+        if USE_SEARCH_API:
+            return search_api.browse_page(cursor=cursor, size=15)
+        return browse_page(es=es, INDEX_NAME=INDEX_NAME, cursor=cursor, size=15)
+
+    if "browse_items" not in st.session_state:
+        st.session_state.browse_items, st.session_state.browse_cursor = load_browse_page(None)
+
+    render_results_grid(st.session_state.browse_items)
+
+    # "Load more" appends the next page from the browse cursor
+    if st.session_state.browse_cursor and st.button("Load more"):
+        next_items, st.session_state.browse_cursor = load_browse_page(st.session_state.browse_cursor)
+        st.session_state.browse_items = st.session_state.browse_items + next_items
+        st.rerun()
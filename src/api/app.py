@@ -0,0 +1,287 @@
+"""
+ASGI search / recommendation API.
+
+Serves search, PDP recommendations and browse as JSON, so any frontend (the
+Streamlit app included) or load balancer can sit in front of it. Each worker
+process opens its Elasticsearch clients once, at startup, and starts the
+rerank worker pool there too. The embedding model is warmed on a background
+thread (MODEL_WARMUP), so the process starts serving browse and health
+checks right away and /ready flips once the model is loaded.
+
+Usage:
+    uvicorn src.api.app:app --host 0.0.0.0 --port 8000 --workers 4
+"""
+from contextlib import asynccontextmanager
+
+from elasticsearch import NotFoundError
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from src.browse.browse_snapshot import browse_page, get_browse_categories, start_browse_refresher
+from src.recommendations.recommendations import pdp_recommendations_async
+from src.search.search import search_catalog_async, search_catalog_page_async
+from src.services.async_inventory_search_service import create_async_es_client
+from src.services.caching_service.cache_sweeper import start_cache_sweeper
+from src.services.circuit_breaker_service import CircuitOpenError, es_breaker
+from src.services.metrics_service import render_prometheus
+from src.services.queue_service import rerank_queue_metrics, start_rerank_worker
+from src.services.suggestion_service import start_suggestion_refresher, suggest
+from src.services.startup_service import (
+    create_es_client,
+    get_model,
+    is_model_ready,
+    print_startup_report,
+    start_model_warmup,
+    startup_report,
+    startup_stage,
+)
+from config import config
+
+INDEX_NAME = config.INVENTORY_INDEX
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Async client for the request path, sync client for browse and the rerank worker
+    with startup_stage("es_clients"):
+        app.state.async_es = create_async_es_client()
+        app.state.es = create_es_client()
+
+    with startup_stage("background_workers"):
+        start_rerank_worker(app.state.es)
+        start_browse_refresher(app.state.es, INDEX_NAME)
+        start_cache_sweeper(app.state.es)
+        start_suggestion_refresher(app.state.es, INDEX_NAME)
+
+    if config.MODEL_WARMUP:
+        start_model_warmup()
+    else:
+        # Model loading is blocking; keep the loop free while it happens
+        await run_in_threadpool(get_model)
+
+    print_startup_report()
+
+    yield
+
+    await app.state.async_es.close()
+    app.state.es.close()
+
+
+app = FastAPI(title="AI E-Commerce Search API", lifespan=lifespan)
+
+
+@app.exception_handler(TimeoutError)
+async def timeout_error(request, exc):
+    # e.g. gave up waiting for an identical in-flight request
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open(request, exc):
+    # ES is failing and there was nothing local to fall back to
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(config.ES_BREAKER_RESET_TIMEOUT) or 1)}
+    )
+
+
+async def embedding_model():
+    """
+    Returns the embedding model, waiting up to MODEL_WAIT_TIMEOUT for the
+    warm-up; 503 while it is still loading so clients can retry.
+    """
+    if is_model_ready():
+        return get_model()
+
+    try:
+        return await run_in_threadpool(get_model, config.MODEL_WAIT_TIMEOUT)
+    except TimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+# ----------------- SEARCH -----------------
+@app.get("/search")
+async def search(
+    q: str | None = Query(None, min_length=1),
+    cursor: str | None = None,
+    _from: int = Query(0, alias="from", ge=0),
+    size: int = Query(20, ge=1, le=100),
+    brand: list[str] | None = Query(None),
+    category: list[str] | None = Query(None),
+    sub_category: list[str] | None = Query(None),
+    sub_sub_category: list[str] | None = Query(None),
+    sub_sub_sub_category: list[str] | None = Query(None),
+    min_price: float | None = Query(None, ge=0),
+    max_price: float | None = Query(None, ge=0),
+    in_stock: bool | None = None
+):
+    """
+    First page: `q`. Next pages: the `next_cursor` of the previous response.
+    `from` offsets are still accepted but return no cursor.
+
+    Filters (repeatable `brand` / category level params, `min_price`,
+    `max_price`, `in_stock`) narrow retrieval; a cursor keeps the filters
+    of its first page. `facets` counts brands, categories and price ranges
+    over the query's results (None when unavailable).
+    """
+    model = await embedding_model()
+
+    filters = {
+        "brand": brand,
+        "category": category,
+        "sub_category": sub_category,
+        "sub_sub_category": sub_sub_category,
+        "sub_sub_sub_category": sub_sub_sub_category,
+        "min_price": min_price,
+        "max_price": max_price,
+        "in_stock": in_stock
+    }
+
+    if cursor or _from == 0:
+        try:
+            results, next_cursor, facets = await search_catalog_page_async(
+                user_query=q,
+                cursor=cursor,
+                size=size,
+                model=model,
+                INDEX_NAME=INDEX_NAME,
+                es=app.state.async_es,
+                filters=filters
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        return {"query": q, "size": size, "results": results, "next_cursor": next_cursor, "facets": facets}
+
+    if not q:
+        raise HTTPException(status_code=400, detail="q is required")
+
+    try:
+        results = await search_catalog_async(
+            user_query=q,
+            _from=_from,
+            size=size,
+            model=model,
+            INDEX_NAME=INDEX_NAME,
+            es=app.state.async_es,
+            filters=filters
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"query": q, "from": _from, "size": size, "results": results, "next_cursor": None, "facets": None}
+
+
+@app.get("/suggest")
+async def suggestions(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(8, ge=1, le=config.SUGGEST_MAX_RESULTS)
+):
+    """
+    Typeahead: served from the in-memory prefix index, without touching ES
+    or the model (empty until the index is first built).
+    """
+    return {"query": q, "suggestions": suggest(q, INDEX_NAME, limit)}
+
+
+# ----------------- RECOMMENDATIONS -----------------
+@app.get("/recommendations/{product_id}")
+async def recommendations(
+    product_id: str,
+    name: str | None = None,
+    size: int = Query(5, ge=1, le=50)
+):
+    # The product name is only needed for the live-search fallback; look it up if not given
+    if name is None:
+        try:
+            product = await app.state.async_es.get(index=INDEX_NAME, id=product_id, _source=["name"])
+        except NotFoundError:
+            raise HTTPException(status_code=404, detail=f"Unknown product: {product_id}")
+
+        name = product["_source"].get("name") or ""
+
+    model = await embedding_model()
+
+    results = await pdp_recommendations_async(
+        item_name=name,
+        item_pid=product_id,
+        model=model,
+        INDEX_NAME=INDEX_NAME,
+        es=app.state.async_es,
+        num_recs=size
+    )
+
+    return {"product_id": product_id, "results": results}
+
+
+# ----------------- BROWSE -----------------
+@app.get("/browse/items")
+async def browse_items(
+    size: int = Query(15, ge=1, le=100),
+    cursor: str | None = None
+):
+    try:
+        results, next_cursor = await run_in_threadpool(browse_page, app.state.es, INDEX_NAME, cursor, size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"results": results, "next_cursor": next_cursor}
+
+
+@app.get("/browse/categories")
+async def browse_categories(limit: int = Query(25, ge=1, le=config.BROWSE_CATEGORY_COUNT)):
+    categories = await run_in_threadpool(get_browse_categories, app.state.es, INDEX_NAME, limit)
+    return {"categories": categories}
+
+
+# ----------------- HEALTH -----------------
+@app.get("/health")
+async def health():
+    """
+    Liveness: the process is up and serving.
+    """
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    """
+    Readiness: the model is loaded and Elasticsearch answers, so the load
+    balancer can route traffic here.
+    """
+    checks = {"model": is_model_ready(), "elasticsearch": False}
+
+    try:
+        checks["elasticsearch"] = bool(await app.state.async_es.ping())
+    except Exception:
+        checks["elasticsearch"] = False
+
+    status = "ready" if all(checks.values()) else "not_ready"
+    return JSONResponse(
+        status_code=200 if status == "ready" else 503,
+        content={
+            "status": status,
+            "checks": checks,
+            # Informational: with the breaker open, searches are served degraded
+            "es_breaker": es_breaker.state,
+            "rerank_queue": rerank_queue_metrics(),
+            "startup": startup_report()
+        }
+    )
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Stage latencies, cache hit ratios, queue depth and LLM timings in the
+    Prometheus text format. Collectors may touch the durable queue database,
+    so rendering runs off the event loop.
+    """
+    return PlainTextResponse(
+        await run_in_threadpool(render_prometheus),
+        media_type="text/plain; version=0.0.4"
+    )
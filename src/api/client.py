@@ -0,0 +1,60 @@
+"""
+HTTP client for the search API (`src.api.app`), used by the Streamlit app
+when SEARCH_API_URL is set. Returns the same shapes as the in-process
+functions it stands in for.
+"""
+import requests
+
+from config import config
+
+# Pooled keep-alive connections, shared across Streamlit reruns
+session = requests.Session()
+
+
+def get_json(path, params=None):
+    response = session.get(
+        f"{config.SEARCH_API_URL.rstrip('/')}{path}",
+        params=params,
+        timeout=config.SEARCH_API_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def search_catalog(user_query, _from=0, size=20):
+    return get_json("/search", {"q": user_query, "from": _from, "size": size})["results"]
+
+
+def search_page(user_query=None, cursor=None, size=20, filters=None):
+    params = {"q": user_query, "cursor": cursor, "size": size}
+    for name, value in (filters or {}).items():
+        # Lists become repeated params; unset filters are left out
+        if value not in (None, False, []):
+            params[name] = "true" if value is True else value
+
+    response = get_json("/search", params)
+    return response["results"], response["next_cursor"], response.get("facets")
+
+
+def suggest(prefix, limit=8):
+    return get_json("/suggest", {"q": prefix, "limit": limit})["suggestions"]
+
+
+def pdp_recommendations(item_name, item_pid, num_recs=5):
+    return get_json(
+        f"/recommendations/{requests.utils.quote(str(item_pid), safe='')}",
+        {"name": item_name, "size": num_recs}
+    )["results"]
+
+
+def get_all_items(size=15):
+    return get_json("/browse/items", {"size": size})["results"]
+
+
+def browse_page(cursor=None, size=15):
+    response = get_json("/browse/items", {"size": size, "cursor": cursor})
+    return response["results"], response["next_cursor"]
+
+
+def get_all_categories(limit=25):
+    return get_json("/browse/categories", {"limit": limit})["categories"]
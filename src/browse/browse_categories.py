@@ -1,5 +1,7 @@
 from src.services.elastic_query_service import browse_categories_query
+from src.services.metrics_service import traced
 
+@traced("browse_categories")
 def get_all_categories(es, INDEX_NAME):
     """
     Retrieve all unique categories from the Elasticsearch index.
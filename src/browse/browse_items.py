@@ -1,5 +1,7 @@
 from src.services.elastic_query_service import browse_items_query
+from src.services.metrics_service import traced
 
+@traced("browse_items")
 def get_all_items(es, INDEX_NAME, size = 15):
 
     body = browse_items_query(size)
@@ -0,0 +1,257 @@
+"""
+In-memory browse snapshot for the home page, and cursor-based "load more".
+
+The snapshot (category counts plus the first BROWSE_SNAPSHOT_ITEMS items) is
+built with a single ES request and served from memory. Once it is older than
+BROWSE_SNAPSHOT_TTL it is rebuilt in the background while the old one keeps
+being served, so a home page render does not touch ES.
+
+"Load more" pages through the snapshot first, then continues with
+`search_after` over a point-in-time (PIT): pages stay consistent while the
+index changes and deep pages cost the same as the first one. All sessions
+share one PIT per snapshot generation (closed when the snapshot is replaced),
+so the number of open PITs does not grow with the number of shoppers; the
+cursor only carries the sort values of the last item shown.
+"""
+import threading
+import time
+
+from elasticsearch import NotFoundError
+
+from src.services.cursor_service import decode_cursor, encode_cursor
+from src.services.elastic_query_service import browse_page_query, browse_snapshot_query
+from src.services.metrics_service import inc, span, traced
+from src.services.singleflight_service import SingleFlight
+from config import config
+
+# INDEX_NAME → snapshot
+browse_snapshots = {}
+snapshot_lock = threading.Lock()
+pit_lock = threading.Lock()
+refreshing = set()
+refresher_threads = {}
+
+browse_flights = SingleFlight("browse")
+
+
+# ----------------- SNAPSHOT -----------------
+def build_browse_snapshot(es, INDEX_NAME):
+    with span("browse_snapshot_build"):
+        response = es.search(
+            index=INDEX_NAME,
+            body=browse_snapshot_query(config.BROWSE_SNAPSHOT_ITEMS, config.BROWSE_CATEGORY_COUNT)
+        )
+
+    items = response["hits"]["hits"]
+    return {
+        "categories": response["aggregations"]["categories"]["buckets"],
+        "items": items,
+        "exhausted": len(items) < config.BROWSE_SNAPSHOT_ITEMS,
+        "built_at": time.time(),
+        # Shared "load more" PIT of this generation, opened on first use
+        "pit": None
+    }
+
+
+def refresh_browse_snapshot(es, INDEX_NAME):
+    """
+    Rebuilds the snapshot; on failure the previous one keeps being served.
+    """
+    try:
+        snapshot = build_browse_snapshot(es, INDEX_NAME)
+        with pit_lock:
+            previous = browse_snapshots.get(INDEX_NAME)
+            browse_snapshots[INDEX_NAME] = snapshot
+
+        # Pages still in flight on the old PIT move to the new one (see `search_after_page`)
+        if previous and previous["pit"]:
+            close_pit(es, previous["pit"])
+        inc("browse_snapshot_refreshes_total", outcome="ok")
+    except Exception as e:
+        print("Browse snapshot refresh failed: ", e)
+        inc("browse_snapshot_refreshes_total", outcome="error")
+
+    return browse_snapshots.get(INDEX_NAME)
+
+
+def refresh_in_background(es, INDEX_NAME):
+    with snapshot_lock:
+        if INDEX_NAME in refreshing:
+            return
+        refreshing.add(INDEX_NAME)
+
+    def run():
+        try:
+            refresh_browse_snapshot(es, INDEX_NAME)
+        finally:
+            refreshing.discard(INDEX_NAME)
+
+    threading.Thread(target=run, name="browse-snapshot-refresh", daemon=True).start()
+
+
+def get_browse_snapshot(es, INDEX_NAME):
+    """
+    Returns the snapshot, building it on first use. A stale snapshot is
+    returned as is and rebuilt in the background.
+    """
+    snapshot = browse_snapshots.get(INDEX_NAME)
+
+    if snapshot is None:
+        with snapshot_lock:
+            snapshot = browse_snapshots.get(INDEX_NAME)
+            if snapshot is None:
+                snapshot = browse_snapshots[INDEX_NAME] = build_browse_snapshot(es, INDEX_NAME)
+
+    elif time.time() - snapshot["built_at"] > config.BROWSE_SNAPSHOT_TTL:
+        refresh_in_background(es, INDEX_NAME)
+
+    return snapshot
+
+
+def start_browse_refresher(es, INDEX_NAME):
+    """
+    Keeps the snapshot warm with a background thread (once per process).
+    """
+    if INDEX_NAME in refresher_threads and refresher_threads[INDEX_NAME].is_alive():
+        return
+
+    def run():
+        while True:
+            refresh_browse_snapshot(es, INDEX_NAME)
+            time.sleep(config.BROWSE_SNAPSHOT_TTL)
+
+    thread = threading.Thread(target=run, name="browse-snapshot-refresher", daemon=True)
+    thread.start()
+    refresher_threads[INDEX_NAME] = thread
+
+
+def get_browse_categories(es, INDEX_NAME, limit=25):
+    return get_browse_snapshot(es, INDEX_NAME)["categories"][:limit]
+
+
+# ----------------- LOAD MORE -----------------
+def open_pit(es, INDEX_NAME):
+    return es.open_point_in_time(index=INDEX_NAME, keep_alive=config.BROWSE_PIT_KEEP_ALIVE)["id"]
+
+
+def close_pit(es, pit_id):
+    try:
+        es.close_point_in_time(id=pit_id)
+    except Exception as e:
+        print("Closing browse PIT failed: ", e)
+
+
+def shared_pit(es, INDEX_NAME, expired=None):
+    """
+    Returns the PIT of the current snapshot generation, opening it on first
+    use or when `expired` (a PIT ES no longer knows) is still the current one.
+    """
+    get_browse_snapshot(es, INDEX_NAME)
+
+    with pit_lock:
+        snapshot = browse_snapshots[INDEX_NAME]
+        if snapshot["pit"] is None or snapshot["pit"] == expired:
+            snapshot["pit"] = open_pit(es, INDEX_NAME)
+            inc("browse_pit_opened_total")
+
+        return snapshot["pit"]
+
+
+def search_after_page(es, INDEX_NAME, search_after, size):
+    """
+    Reads the next `size` items after the sort values `search_after` over
+    the shared PIT.
+
+    Returns:
+        tuple: (hits, next state or None when the catalog is exhausted).
+    """
+    pit_id = shared_pit(es, INDEX_NAME)
+
+    try:
+        with span("browse_search_after"):
+            response = es.search(body=browse_page_query(pit_id, size, config.BROWSE_PIT_KEEP_ALIVE, search_after))
+    except NotFoundError:
+        # PIT expired (idle past its keep-alive) or closed by a snapshot refresh → continue on the current one
+        inc("browse_pit_expired_total")
+        pit_id = shared_pit(es, INDEX_NAME, expired=pit_id)
+        with span("browse_search_after"):
+            response = es.search(body=browse_page_query(pit_id, size, config.BROWSE_PIT_KEEP_ALIVE, search_after))
+
+    hits = response["hits"]["hits"]
+
+    # ES may hand back a new ID for the same PIT
+    if response.get("pit_id", pit_id) != pit_id:
+        with pit_lock:
+            if browse_snapshots[INDEX_NAME]["pit"] == pit_id:
+                browse_snapshots[INDEX_NAME]["pit"] = response["pit_id"]
+
+    if len(hits) < size:
+        return hits, None
+
+    return hits, {"search_after": hits[-1]["sort"]}
+
+
+@traced("browse_page")
+def browse_page(es, INDEX_NAME, cursor=None, size=15):
+    """
+    Returns one browse page and the opaque cursor of the next one.
+
+    Pages inside the snapshot are served from memory; the page crossing its
+    end and everything after it come from `search_after` over a PIT.
+
+    Args:
+        cursor (str): Cursor returned by the previous call, None for the first page.
+
+    Returns:
+        tuple: (hits, next cursor or None when there is nothing more).
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    # Identical concurrent pages (e.g. a burst of first-page loads) share one read
+    return browse_flights.do((INDEX_NAME, cursor, size), run_browse_page, es, INDEX_NAME, cursor, size)
+
+
+def browse_state(cursor):
+    """
+    Cursor state: an `offset` into the snapshot, or the `search_after`
+    sort values of the last item shown.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    if not cursor:
+        return {"offset": 0}
+
+    state = decode_cursor(cursor)
+    if "offset" in state:
+        offset = state["offset"]
+        valid = isinstance(offset, int) and not isinstance(offset, bool) and offset >= 0
+    else:
+        valid = isinstance(state.get("search_after"), list)
+
+    if not valid:
+        raise ValueError("Invalid cursor")
+
+    return state
+
+
+def run_browse_page(es, INDEX_NAME, cursor, size):
+    state = browse_state(cursor)
+    hits = []
+
+    if "offset" in state:
+        snapshot = get_browse_snapshot(es, INDEX_NAME)
+        offset = state["offset"]
+        hits = snapshot["items"][offset:offset + size]
+        shown = offset + len(hits)
+
+        if len(hits) == size and (shown < len(snapshot["items"]) or not snapshot["exhausted"]):
+            return hits, encode_cursor({"offset": shown})
+        if snapshot["exhausted"]:
+            return hits, None
+
+        state = {"search_after": snapshot["items"][shown - 1]["sort"]}
+
+    more, next_state = search_after_page(es, INDEX_NAME, state.get("search_after"), size - len(hits))
+    return hits + more, encode_cursor(next_state)
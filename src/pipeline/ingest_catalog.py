@@ -0,0 +1,388 @@
+"""
+Streaming catalog ingestion into the inventory index.
+
+Reads a catalog file (CSV or JSONL) row by row, builds inventory documents,
+encodes their embedding text in large batches and pushes them with
+`helpers.parallel_bulk`. Progress is checkpointed so an interrupted run can
+resume where it stopped.
+
+Usage:
+    python -m src.pipeline.ingest_catalog --file data/flipkart_com-ecommerce_sample.csv
+"""
+import argparse
+import ast
+import csv
+import itertools
+import json
+import os
+from collections import deque
+from time import time
+
+from elasticsearch import helpers
+
+from config import config
+from src.services.caching_service.cache_generation import bump_catalog_generation
+from src.services.elastic_query_service import inventory_index_body
+
+
+# ----------------- ROW → DOCUMENT -----------------
+def parse_category_hierarchy(cat_tree):
+    """
+    Extract category hierarchy from product_category_tree
+    """
+    try:
+        tree = ast.literal_eval(cat_tree)[0]
+        parts = [p.strip() for p in tree.split(">>")]
+    except Exception:
+        parts = []
+
+    return {
+        "category": parts[0] if len(parts) > 0 else None,
+        "sub_category": parts[1] if len(parts) > 1 else None,
+        "sub_sub_category": parts[2] if len(parts) > 2 else None,
+        "sub_sub_sub_category": parts[3] if len(parts) > 3 else None,
+    }
+
+
+def extract_first_image(image_field):
+    try:
+        images = ast.literal_eval(image_field)
+        return images[0] if images else None
+    except Exception:
+        return None
+
+
+def to_number(value):
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def to_bool(value):
+    if value in (None, ""):
+        return None
+    return str(value).strip().lower() in ("1", "true", "yes", "y")
+
+
+def build_auto_complete(doc):
+    fields = [
+        doc.get("name"),
+        doc.get("brand"),
+        doc.get("category"),
+        doc.get("sub_category"),
+        doc.get("sub_sub_category"),
+        doc.get("sub_sub_sub_category"),
+    ]
+    return " ".join([f for f in fields if f])
+
+
+def build_embedding_text(doc):
+    return " ".join([
+        f'Item *{doc.get("name") or ""}* is of category hierarchy',
+        f'{doc.get("category") or ""} and',
+        f'{doc.get("sub_category") or ""} and',
+        f'{doc.get("sub_sub_category") or ""} and',
+        doc.get("sub_sub_sub_category") or ""
+    ])
+
+
+def row_to_document(row):
+    """
+    Builds an inventory document from a raw Flipkart row (or an already
+    normalized JSONL record). Returns None for rows without a product ID.
+    """
+    pid = row.get("pid") or row.get("product_id")
+    if not pid:
+        return None
+
+    if "product_category_tree" in row:
+        cats = parse_category_hierarchy(row["product_category_tree"])
+    else:
+        cats = {
+            level: row.get(level)
+            for level in ["category", "sub_category", "sub_sub_category", "sub_sub_sub_category"]
+        }
+
+    image_url = row.get("item_image_url")
+    if image_url is None and row.get("image"):
+        image_url = extract_first_image(row["image"])
+
+    price = to_number(row.get("retail_price", row.get("price")))
+
+    doc = {
+        "product_id": pid,
+        "name": row.get("product_name", row.get("name")),
+        "brand": row.get("brand") or None,
+        "price": int(price) if price is not None else None,
+        "discounted_price": to_number(row.get("discounted_price")),
+        # Optional stock flag; products without it are treated as in stock
+        "in_stock": to_bool(row.get("in_stock")),
+        # Optional product rating ("No rating available" → None), used by the browse sort
+        "rating": to_number(row.get("overall_rating", row.get("product_rating", row.get("rating")))),
+        "item_image_url": image_url,
+        "description": row.get("description"),
+        **cats
+    }
+
+    doc["auto_complete_field"] = build_auto_complete(doc)
+    doc["embedding_text"] = build_embedding_text(doc)
+
+    return doc
+
+
+# ----------------- STREAMING STAGES -----------------
+def read_catalog_rows(path):
+    """
+    Yields raw catalog rows from a CSV or JSONL file without loading it in memory.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def batched(iterable, n):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, n)):
+        yield batch
+
+
+def embed_documents(numbered_docs, model, batch_size, normalize=False):
+    """
+    Encodes `embedding_text` for documents in large batches.
+
+    Yields:
+        tuple: (row_number, document with `embedding`)
+    """
+    for batch in batched(numbered_docs, batch_size):
+        texts = [doc["embedding_text"] for _, doc in batch]
+        vectors = model.encode(
+            texts,
+            batch_size=min(batch_size, 256),
+            normalize_embeddings=normalize
+        )
+
+        for (row_number, doc), vector in zip(batch, vectors):
+            doc["embedding"] = vector.tolist()
+            yield row_number, doc
+
+
+# ----------------- CHECKPOINTING -----------------
+def load_checkpoint(checkpoint_path, catalog_path):
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return 0
+
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+
+    if checkpoint.get("file") != os.path.abspath(catalog_path):
+        return 0
+
+    return checkpoint.get("rows_done", 0)
+
+
+def save_checkpoint(checkpoint_path, catalog_path, rows_done):
+    if not checkpoint_path:
+        return
+
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"file": os.path.abspath(catalog_path), "rows_done": rows_done}, f)
+
+    os.replace(tmp_path, checkpoint_path)
+
+
+# ----------------- INDEX -----------------
+def create_inventory_index(es, INDEX_NAME, similarity=config.EMBEDDING_SIMILARITY, quantized=False, recreate=False):
+
+    if recreate and es.indices.exists(index=INDEX_NAME):
+        es.indices.delete(index=INDEX_NAME)
+
+    if es.indices.exists(index=INDEX_NAME):
+        print("⚠️ Index already exists")
+        return False
+
+    es.indices.create(
+        index=INDEX_NAME,
+        body=inventory_index_body(
+            dims=config.EMBEDDING_DIMS,
+            similarity=similarity,
+            quantized=quantized
+        )
+    )
+    print("✅ Index created")
+    return True
+
+
+# ----------------- PIPELINE -----------------
+def ingest_catalog(
+    path,
+    es,
+    model,
+    INDEX_NAME=config.INVENTORY_INDEX,
+    checkpoint_path=None,
+    embed_batch_size=config.INGEST_EMBED_BATCH_SIZE,
+    chunk_size=config.INGEST_BULK_CHUNK_SIZE,
+    thread_count=config.INGEST_BULK_THREADS,
+    similarity=config.EMBEDDING_SIMILARITY,
+    report_every=5000
+):
+    """
+    Streams a catalog file into Elasticsearch.
+
+    rows → documents → batched embeddings → parallel_bulk, all as generators,
+    so memory stays bounded by the batch sizes regardless of catalog size.
+    The checkpoint records how many leading rows are fully acknowledged by
+    ES, and stops advancing at the first failed row; a rerun with the same
+    checkpoint skips the acknowledged rows and retries from that failure
+    (re-indexing later rows is idempotent: product IDs are document IDs). A sync that indexed
+    anything bumps the catalog generation, invalidating cached rankings.
+
+    Returns:
+        dict: Ingestion summary (indexed, failed, skipped, first_failed_row,
+        seconds, docs_per_sec, catalog_generation).
+    """
+    rows_done = load_checkpoint(checkpoint_path, path)
+    if rows_done:
+        print(f"↩️ Resuming after {rows_done} rows")
+
+    rows = itertools.islice(enumerate(read_catalog_rows(path), start=1), rows_done, None)
+
+    pending_rows = deque()
+    skipped = 0
+
+    def numbered_documents():
+        nonlocal skipped
+        for row_number, row in rows:
+            doc = row_to_document(row)
+            if doc is None:
+                skipped += 1
+                continue
+            yield row_number, doc
+
+    def actions():
+        # dot_product similarity requires unit-length vectors
+        embedded = embed_documents(
+            numbered_documents(),
+            model,
+            embed_batch_size,
+            normalize=similarity == "dot_product"
+        )
+        for row_number, doc in embedded:
+            pending_rows.append(row_number)
+            yield {
+                "_index": INDEX_NAME,
+                "_id": doc["product_id"],
+                "_source": doc
+            }
+
+    success_count = 0
+    failure_count = 0
+    processed = 0
+    # Last row of the leading run of acknowledged rows (the checkpoint)
+    acked_through = rows_done
+    first_failed_row = None
+    start_time = time()
+
+    # parallel_bulk yields results in submission order → acked rows form a prefix
+    for ok, info in helpers.parallel_bulk(
+        es,
+        actions(),
+        thread_count=thread_count,
+        chunk_size=chunk_size,
+        raise_on_error=False,
+        raise_on_exception=False
+    ):
+        row_number = pending_rows.popleft()
+
+        if ok:
+            success_count += 1
+            if first_failed_row is None:
+                acked_through = row_number
+        else:
+            failure_count += 1
+            first_failed_row = first_failed_row or row_number
+            print(f"❌ Failed row {row_number}: {str(info)[:120]}")
+
+        processed = success_count + failure_count
+        if processed % chunk_size == 0:
+            save_checkpoint(checkpoint_path, path, acked_through)
+
+        if processed % report_every == 0:
+            elapsed = time() - start_time
+            print(f"⚡ {processed} docs | {processed / elapsed:.1f} docs/sec")
+
+    if processed:
+        save_checkpoint(checkpoint_path, path, acked_through)
+
+    elapsed = time() - start_time
+    summary = {
+        "indexed": success_count,
+        "failed": failure_count,
+        "skipped": skipped,
+        "first_failed_row": first_failed_row,
+        "seconds": round(elapsed, 2),
+        "docs_per_sec": round(processed / elapsed, 2) if elapsed > 0 else 0.0
+    }
+
+    # 🔑 New catalog generation → cached rankings from before this sync become misses
+    if success_count:
+        summary["catalog_generation"] = bump_catalog_generation(es, INDEX_NAME)
+
+    print("\n================ INGESTION SUMMARY ================")
+    print(f"✅ Successfully indexed : {summary['indexed']}")
+    print(f"❌ Failed documents     : {summary['failed']}")
+    print(f"⏭️  Skipped rows         : {summary['skipped']}")
+    if first_failed_row is not None:
+        print(f"↩️  Checkpoint held before row {first_failed_row}: rerun to retry the failed rows")
+    print(f"⏱️  Total time (sec)     : {summary['seconds']}")
+    print(f"⚡ Throughput (docs/sec): {summary['docs_per_sec']}")
+    if "catalog_generation" in summary:
+        print(f"🔄 Catalog generation   : {summary['catalog_generation']}")
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a catalog file into the inventory index.")
+    parser.add_argument("--file", required=True, help="Catalog file (.csv or .jsonl)")
+    parser.add_argument("--index", default=config.INVENTORY_INDEX)
+    parser.add_argument("--checkpoint", default=".ingest_checkpoint.json")
+    parser.add_argument("--embed-batch-size", type=int, default=config.INGEST_EMBED_BATCH_SIZE)
+    parser.add_argument("--chunk-size", type=int, default=config.INGEST_BULK_CHUNK_SIZE)
+    parser.add_argument("--threads", type=int, default=config.INGEST_BULK_THREADS)
+    parser.add_argument("--similarity", default=config.EMBEDDING_SIMILARITY, choices=["cosine", "dot_product", "l2_norm"])
+    parser.add_argument("--quantized", action="store_true", help="Use int8 quantized HNSW for the embedding field")
+    parser.add_argument("--recreate", action="store_true", help="Drop and recreate the index first")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+    from src.services.startup_service import create_es_client
+
+    es = create_es_client()
+    model = SentenceTransformer(config.EMBEDDING_MODEL_NAME)
+
+    create_inventory_index(es, args.index, similarity=args.similarity, quantized=args.quantized, recreate=args.recreate)
+
+    if args.recreate and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    ingest_catalog(
+        args.file,
+        es,
+        model,
+        INDEX_NAME=args.index,
+        checkpoint_path=args.checkpoint,
+        embed_batch_size=args.embed_batch_size,
+        chunk_size=args.chunk_size,
+        thread_count=args.threads,
+        similarity=args.similarity
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Offline item-to-item recommendation table for the PDP.
+
+Precomputes the top-K most similar products for every product from the
+stored embeddings (the export of `vector_index_service`), using blocked
+matrix products so memory stays bounded by the block sizes. The table is
+written as an int32 row-index matrix next to the fixed-width product IDs of
+its rows and their sort order, all served through memory maps: a PDP lookup
+is a binary search (`searchsorted`) plus one row read, and no worker holds
+an ID → row dict of its own.
+
+Usage:
+    python -m src.recommendations.item_neighbours --index-dir data/vector_index --k 20
+"""
+import argparse
+import os
+import threading
+
+import numpy as np
+
+from config import config
+from src.services.vector_index_service import load_catalog_export
+
+NEIGHBOURS_FILE = "item_neighbours.npy"
+# Product ID of every row (fixed-width bytes) and the rows in product ID order
+IDS_FILE = "item_neighbour_ids.npy"
+ID_ORDER_FILE = "item_neighbour_id_order.npy"
+
+
+def merge_top_k(top_scores, top_rows, scores, rows, k):
+    """
+    Merges a new block of candidate scores into the running per-row top-k.
+    """
+    all_scores = np.concatenate([top_scores, scores], axis=1)
+    all_rows = np.concatenate([top_rows, np.broadcast_to(rows, scores.shape)], axis=1)
+
+    keep = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+    return (
+        np.take_along_axis(all_scores, keep, axis=1),
+        np.take_along_axis(all_rows, keep, axis=1)
+    )
+
+
+def build_item_neighbours(index_dir, out_dir=None, k=20, same_category=False, row_block=1024, col_block=16384):
+    """
+    Computes the top-k neighbours of every row by cosine similarity.
+
+    Args:
+        same_category (bool): Only recommend products of the same top-level category.
+    """
+    out_dir = out_dir or index_dir
+    embeddings, catalog = load_catalog_export(index_dir)
+    n_rows = len(embeddings)
+    k = min(k, n_rows - 1)
+
+    if same_category:
+        categories = np.asarray(catalog.codes[:, 0], dtype=np.int32)
+
+    neighbours = np.lib.format.open_memmap(
+        os.path.join(out_dir, NEIGHBOURS_FILE), mode="w+", dtype=np.int32, shape=(n_rows, k)
+    )
+
+    for row_start in range(0, n_rows, row_block):
+        row_end = min(row_start + row_block, n_rows)
+        block = np.asarray(embeddings[row_start:row_end], dtype=np.float32)
+
+        top_scores = np.full((len(block), k), -np.inf, dtype=np.float32)
+        top_rows = np.full((len(block), k), -1, dtype=np.int32)
+
+        for col_start in range(0, n_rows, col_block):
+            col_end = min(col_start + col_block, n_rows)
+            cols = np.arange(col_start, col_end, dtype=np.int32)
+
+            scores = block @ np.asarray(embeddings[col_start:col_end], dtype=np.float32).T
+
+            # Never recommend the product itself
+            self_rows = np.arange(row_start, row_end)
+            in_block = (self_rows >= col_start) & (self_rows < col_end)
+            scores[np.nonzero(in_block)[0], self_rows[in_block] - col_start] = -np.inf
+
+            if same_category:
+                mismatch = categories[row_start:row_end, None] != categories[None, col_start:col_end]
+                scores[mismatch] = -np.inf
+
+            top_scores, top_rows = merge_top_k(top_scores, top_rows, scores, cols, k)
+
+        order = np.argsort(-top_scores, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        top_rows = np.take_along_axis(top_rows, order, axis=1)
+
+        # -1 marks an empty slot (e.g. a category with fewer than k products)
+        top_rows[~np.isfinite(top_scores)] = -1
+        neighbours[row_start:row_end] = top_rows
+
+    neighbours.flush()
+
+    product_ids = np.asarray(catalog.ids)
+    np.save(os.path.join(out_dir, IDS_FILE), product_ids)
+    np.save(os.path.join(out_dir, ID_ORDER_FILE), np.argsort(product_ids, kind="stable").astype(np.int32))
+
+    print(f"✅ Built item-to-item table: {n_rows} products × {k} neighbours")
+
+
+class ItemNeighbourTable:
+    """
+    Memory-mapped product_id → top-K similar product_ids lookup.
+    """
+
+    def __init__(self, table_dir):
+        self.product_ids = np.load(os.path.join(table_dir, IDS_FILE), mmap_mode="r")
+        self.id_order = np.load(os.path.join(table_dir, ID_ORDER_FILE), mmap_mode="r")
+        self.neighbours = np.load(os.path.join(table_dir, NEIGHBOURS_FILE), mmap_mode="r")
+
+    def row_of(self, product_id):
+        """
+        Returns the table row of `product_id`, or None if it is not in the table.
+        """
+        key = str(product_id).encode("utf-8")
+        if len(key) > self.product_ids.dtype.itemsize:
+            return None
+
+        i = int(np.searchsorted(self.product_ids, key, sorter=self.id_order))
+        if i < len(self.id_order) and self.product_ids[self.id_order[i]] == key:
+            return int(self.id_order[i])
+
+        return None
+
+    def __contains__(self, product_id):
+        return self.row_of(product_id) is not None
+
+    def similar_items(self, product_id, n):
+        row = self.row_of(product_id)
+        if row is None:
+            return []
+
+        return [
+            self.product_ids[neighbour].decode("utf-8")
+            for neighbour in self.neighbours[row][:n]
+            if neighbour >= 0
+        ]
+
+
+item_neighbour_table = None
+item_neighbour_table_lock = threading.Lock()
+
+
+def get_item_neighbour_table():
+    """
+    Lazily opens the table in ITEM_NEIGHBOURS_DIR; None if it was not built.
+    """
+    global item_neighbour_table
+
+    if item_neighbour_table is None and os.path.exists(os.path.join(config.ITEM_NEIGHBOURS_DIR, NEIGHBOURS_FILE)):
+        with item_neighbour_table_lock:
+            if item_neighbour_table is None:
+                item_neighbour_table = ItemNeighbourTable(config.ITEM_NEIGHBOURS_DIR)
+
+    return item_neighbour_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the PDP item-to-item recommendation table.")
+    parser.add_argument("--index-dir", default=config.LOCAL_VECTOR_INDEX_DIR, help="Embedding export directory")
+    parser.add_argument("--out", default=config.ITEM_NEIGHBOURS_DIR)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--same-category", action="store_true", help="Only recommend within the same category")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    build_item_neighbours(args.index_dir, args.out, k=args.k, same_category=args.same_category)
+
+
+if __name__ == "__main__":
+    main()
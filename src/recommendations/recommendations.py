@@ -1,8 +1,78 @@
 from src.services.inventory_search_service import search_inventory
+from src.services.async_inventory_search_service import search_inventory_async
+from src.services.elastic_query_service import get_items_by_id_query
+from src.recommendations.item_neighbours import get_item_neighbour_table
+from src.services.circuit_breaker_service import AsyncGuardedClient, GuardedClient, is_failure
+from src.services.deadline_service import deadline
+from src.services.metrics_service import inc, span, traced
+from src.services.singleflight_service import AsyncSingleFlight, SingleFlight
 from config import config
 
+pdp_flights = SingleFlight("pdp")
+pdp_flights_async = AsyncSingleFlight("pdp")
+
+
+def precomputed_recommendation_ids(item_pid, num_recs):
+    """
+    Returns the precomputed neighbours of `item_pid`, or [] for unknown
+    (e.g. newly added) products or when the table was not built.
+    """
+    table = get_item_neighbour_table()
+    if table is None:
+        return []
+
+    # Over-fetch slightly so delisted neighbours can be skipped
+    return table.similar_items(item_pid, num_recs + 2)
+
+
+def hits_from_docs(docs, num_recs):
+    return [doc for doc in docs if doc.get("found")][:num_recs]
+
+
+def table_hydrate_failed(e):
+    # ES trouble while hydrating the table hits → fall through to the (degrading) search
+    if not is_failure(e):
+        raise e
+
+    inc("pdp_recommendations_total", source="table_error")
+
+
+@traced("pdp_recommendations")
 def pdp_recommendations(item_name, item_pid, model, INDEX_NAME, es, num_recs=5):
 
+    # Latency budget of the whole PDP call, live-search fallback included
+    with deadline(config.PDP_DEADLINE_MS):
+        # Concurrent requests for the same PDP share one computation
+        return pdp_flights.do(
+            (INDEX_NAME, item_pid, num_recs),
+            run_pdp_recommendations, item_name, item_pid, model, INDEX_NAME, es, num_recs
+        )
+
+
+def run_pdp_recommendations(item_name, item_pid, model, INDEX_NAME, es, num_recs):
+
+    # ⚡ O(1) lookup in the offline item-to-item table, one mget to hydrate
+    with span("pdp_table_lookup"):
+        similar_ids = precomputed_recommendation_ids(item_pid, num_recs)
+
+    if similar_ids:
+        try:
+            with span("pdp_hydrate"):
+                items_response = GuardedClient(es).mget(
+                    index=INDEX_NAME,
+                    body=get_items_by_id_query(similar_ids)
+                )
+        except Exception as e:
+            table_hydrate_failed(e)
+        else:
+            final_results = hits_from_docs(items_response["docs"], num_recs)
+            if len(final_results) == num_recs:
+                inc("pdp_recommendations_total", source="table")
+                return final_results
+
+    inc("pdp_recommendations_total", source="search")
+
+    # Fallback: live search on the product name (served from local state if ES is down)
     results = search_inventory(
         query=item_name,
         _from=0,
@@ -19,3 +89,51 @@ def pdp_recommendations(item_name, item_pid, model, INDEX_NAME, es, num_recs=5):
 
     return final_results
 
+
+@traced("pdp_recommendations")
+async def pdp_recommendations_async(item_name, item_pid, model, INDEX_NAME, es, num_recs=5):
+
+    with deadline(config.PDP_DEADLINE_MS):
+        return await pdp_flights_async.do(
+            (INDEX_NAME, item_pid, num_recs),
+            run_pdp_recommendations_async, item_name, item_pid, model, INDEX_NAME, es, num_recs
+        )
+
+
+async def run_pdp_recommendations_async(item_name, item_pid, model, INDEX_NAME, es, num_recs):
+
+    with span("pdp_table_lookup"):
+        similar_ids = precomputed_recommendation_ids(item_pid, num_recs)
+
+    if similar_ids:
+        try:
+            with span("pdp_hydrate"):
+                items_response = await AsyncGuardedClient(es).mget(
+                    index=INDEX_NAME,
+                    body=get_items_by_id_query(similar_ids)
+                )
+        except Exception as e:
+            table_hydrate_failed(e)
+        else:
+            final_results = hits_from_docs(items_response["docs"], num_recs)
+            if len(final_results) == num_recs:
+                inc("pdp_recommendations_total", source="table")
+                return final_results
+
+    inc("pdp_recommendations_total", source="search")
+
+    results = await search_inventory_async(
+        query=item_name,
+        _from=0,
+        size=num_recs+2,
+        model=model,
+        INDEX_NAME=INDEX_NAME,
+        es=es,
+        _type=config.recommendation_type
+    )
+
+    final_results = [
+        x for x in results if x["_source"].get("product_id") != item_pid
+    ][:num_recs]
+
+    return final_results
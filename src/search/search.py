@@ -1,7 +1,12 @@
-from src.services.inventory_search_service import search_inventory
+from src.services.inventory_search_service import search_inventory, search_inventory_faceted
+from src.services.async_inventory_search_service import search_inventory_async, search_inventory_faceted_async
+from src.services.cursor_service import decode_cursor, encode_cursor
+from src.services.deadline_service import deadline
+from src.services.facet_service import normalize_filters
+from config import config
 
 
-def search_catalog(user_query, _from, size, model, INDEX_NAME, es):
+def search_catalog(user_query, _from, size, model, INDEX_NAME, es, filters=None):
 
     results = search_inventory(
         query=user_query,
@@ -9,7 +14,142 @@ def search_catalog(user_query, _from, size, model, INDEX_NAME, es):
         size=size,
         model=model,
         INDEX_NAME=INDEX_NAME,
-        es=es
+        es=es,
+        filters=filters
     )
 
-    return results
\ No newline at end of file
+    return results
+
+
+async def search_catalog_async(user_query, _from, size, model, INDEX_NAME, es, filters=None):
+
+    results = await search_inventory_async(
+        query=user_query,
+        _from=_from,
+        size=size,
+        model=model,
+        INDEX_NAME=INDEX_NAME,
+        es=es,
+        filters=filters
+    )
+
+    return results
+
+
+# ----------------- CURSOR PAGINATION -----------------
+def cursor_state(user_query, cursor, filters=None):
+    """
+    Cursor state: query `q`, offset `o`, filters `f` (if any), and while
+    inside the rerank window the product IDs already shown, `s`. Next pages
+    keep the filters of the first one.
+    """
+    if cursor:
+        state = decode_cursor(cursor)
+        if not isinstance(state.get("q"), str) or not isinstance(state.get("o"), int):
+            raise ValueError("Invalid cursor")
+        return state
+
+    if not user_query:
+        raise ValueError("Either user_query or cursor is required")
+
+    state = {"q": user_query, "o": 0}
+    filters = normalize_filters(filters)
+    if filters:
+        state["f"] = filters
+
+    return state
+
+
+def page_window(state, size, widen=False):
+    """
+    Returns the (_from, size) range to read for the next page.
+
+    Pages are served from the ranked list of the query: the cache entry,
+    or until the rerank writes it, the candidates the first page retrieved
+    (kept in L1). The background rerank only permutes its head
+    (RERANK_WINDOW items), so inside the head the range is read from the
+    top and already shown IDs are skipped. That way a rerank landing between
+    two pages never duplicates or drops an item.
+    """
+    offset = state["o"]
+    if offset >= config.RERANK_WINDOW:
+        return offset, size
+
+    return 0, (config.RERANK_WINDOW + size) if widen else (offset + size)
+
+
+def select_page(state, hits, size):
+    if state["o"] >= config.RERANK_WINDOW:
+        return hits[:size]
+
+    shown = set(state.get("s") or [])
+    return [hit for hit in hits if hit["_source"]["product_id"] not in shown][:size]
+
+
+def next_cursor(state, page, size):
+    offset = state["o"] + len(page)
+
+    if len(page) < size or offset >= config.CACHE_MAX_DEPTH:
+        return None
+
+    next_state = {"q": state["q"], "o": offset}
+    if state.get("f"):
+        next_state["f"] = state["f"]
+    if offset < config.RERANK_WINDOW:
+        next_state["s"] = (state.get("s") or []) + [hit["_source"]["product_id"] for hit in page]
+
+    return encode_cursor(next_state)
+
+
+def search_catalog_page(user_query, cursor, size, model, INDEX_NAME, es, filters=None):
+    """
+    Cursor-paginated search.
+
+    Pass `user_query` for the first page, then the returned cursor (an
+    opaque token) for each next page. Pages come from the deep ranked list
+    of the query, which is extended on demand up to CACHE_MAX_DEPTH, so deep
+    pages do not re-run retrieval and keep a stable order. `filters` apply
+    to the first page and are carried in the cursor.
+
+    Returns:
+        tuple: (hits, next cursor or None when there are no more results,
+        facet counts or None).
+
+    Raises:
+        ValueError: If the cursor or filters are malformed or neither
+        `user_query` nor `cursor` is given.
+    """
+    state = cursor_state(user_query, cursor, filters)
+
+    # One budget for the page, re-read included
+    with deadline(config.SEARCH_DEADLINE_MS):
+        _from, window = page_window(state, size)
+        hits, facets = search_inventory_faceted(state["q"], _from, window, model, INDEX_NAME, es, filters=state.get("f"))
+        page = select_page(state, hits, size)
+
+        if len(page) < size and len(hits) == window and _from == 0:
+            # The head was reordered since the last page → read all of it
+            _from, window = page_window(state, size, widen=True)
+            hits, facets = search_inventory_faceted(state["q"], _from, window, model, INDEX_NAME, es, filters=state.get("f"))
+            page = select_page(state, hits, size)
+
+    return page, next_cursor(state, page, size), facets
+
+
+async def search_catalog_page_async(user_query, cursor, size, model, INDEX_NAME, es, filters=None):
+    """
+    Async variant of `search_catalog_page` for an `AsyncElasticsearch` client.
+    """
+    state = cursor_state(user_query, cursor, filters)
+
+    with deadline(config.SEARCH_DEADLINE_MS):
+        _from, window = page_window(state, size)
+        hits, facets = await search_inventory_faceted_async(state["q"], _from, window, model, INDEX_NAME, es, filters=state.get("f"))
+        page = select_page(state, hits, size)
+
+        if len(page) < size and len(hits) == window and _from == 0:
+            _from, window = page_window(state, size, widen=True)
+            hits, facets = await search_inventory_faceted_async(state["q"], _from, window, model, INDEX_NAME, es, filters=state.get("f"))
+            page = select_page(state, hits, size)
+
+    return page, next_cursor(state, page, size), facets
@@ -1,24 +1,295 @@
-def prompt_for_reranking(original_query, data_to_rerank):
+"""
+Rerank prompts and the parsing of their replies.
 
-    optimised_data = "\n".join([f"ID: {item['product_id']} | Name: {item.get('name', '')} | Category Hierarchy: {' >> '.join([item.get('category',''), item.get('sub_category',''), item.get('sub_sub_category',''), item.get('sub_sub_sub_category')])}" for item in data_to_rerank])
+Candidates are sent compactly: each gets a short integer alias instead of
+its product ID, the category hierarchy shared by all candidates is stated
+once, and the remaining category paths are listed once in a legend and
+referenced by label. Each query's candidate list is capped at
+RERANK_PROMPT_TOKEN_BUDGET (approximate tokens): names are shortened first,
+then trailing candidates are left out (they keep their retrieval order
+behind the reranked ones).
 
-    prompt = f"""
+The LLM answers with aliases, which are mapped back to product IDs. Replies
+are parsed strictly but repaired where that is safe: surrounding text or
+code fences are ignored, a truncated array is read up to where it stops,
+unknown and repeated aliases are dropped and missing ones are appended in
+retrieval order. Parsed rankings are `LLMRanking`s, which record how many
+leading IDs the LLM actually ordered.
+"""
+import json
+import re
+
+from src.services.metrics_service import inc
+from config import config
+
+CATEGORY_FIELDS = ["category", "sub_category", "sub_sub_category", "sub_sub_sub_category"]
+
+# Rough tokens-per-character ratio of English product text
+CHARS_PER_TOKEN = 4
+
+ARRAY_START_PATTERN = re.compile(r"\[")
+ALIAS_PATTERN = re.compile(r"-?\d+")
+QUERY_ARRAY_PATTERN = re.compile(r'"?(\d+)"?\s*:\s*\[([^\]\[]*)\]?')
+
+
+class LLMRanking(list):
+    """
+    Product IDs ranked from an LLM reply. Only the first `llm_ranked` were
+    ordered by the LLM; the rest were appended in prompt / retrieval order
+    (missing from the reply, or cut from the prompt by the token budget).
+    """
+
+    def __init__(self, product_ids, llm_ranked):
+        super().__init__(product_ids)
+        self.llm_ranked = llm_ranked
+
+
+# ----------------- CANDIDATE ENCODING -----------------
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def category_path(item):
+    # Missing levels are skipped rather than rendered as empty segments
+    return tuple(item.get(field) for field in CATEGORY_FIELDS if item.get(field))
+
+
+def shared_prefix(paths):
+    if not paths:
+        return ()
+
+    prefix = paths[0]
+    for path in paths[1:]:
+        common = 0
+        while common < min(len(prefix), len(path)) and prefix[common] == path[common]:
+            common += 1
+        prefix = prefix[:common]
+
+    return prefix
+
+
+def shorten(name, max_chars):
+    name = " ".join(str(name or "").split())
+    return name if len(name) <= max_chars else name[:max_chars - 1].rstrip() + "…"
+
+
+def format_candidate_lines(data_to_rerank, name_chars):
+    """
+    Returns (header lines, one line per candidate) for `data_to_rerank`.
+    """
+    paths = [category_path(item) for item in data_to_rerank]
+    prefix = shared_prefix(paths)
+
+    # Each distinct remaining path is spelled out once
+    labels = {}
+    for path in paths:
+        rest = path[len(prefix):]
+        if rest and rest not in labels:
+            labels[rest] = f"C{len(labels) + 1}"
+
+    header = []
+    if prefix:
+        header.append(f"All results are in: {' > '.join(prefix)}")
+    if labels:
+        header.append("Categories: " + "; ".join(f"{label}={' > '.join(rest)}" for rest, label in labels.items()))
+
+    lines = []
+    for alias, (item, path) in enumerate(zip(data_to_rerank, paths), start=1):
+        label = labels.get(path[len(prefix):])
+        line = f"{alias}. {shorten(item.get('name'), name_chars)}"
+        lines.append(f"{line} [{label}]" if label else line)
+
+    return header, lines
+
+
+def format_candidates(data_to_rerank):
+    """
+    Encodes candidates for a rerank prompt within RERANK_PROMPT_TOKEN_BUDGET.
+
+    Returns:
+        tuple: (candidate text, product IDs in alias order). Alias `i` stands
+        for the i-th returned ID; candidates cut by the budget are not listed.
+    """
+    candidates = list(data_to_rerank)
+    name_chars = config.RERANK_NAME_MAX_CHARS
+
+    while True:
+        header, lines = format_candidate_lines(candidates, name_chars)
+        text = "\n".join(header + lines)
 
-    Here is user's original query: {original_query}
+        if estimate_tokens(text) <= config.RERANK_PROMPT_TOKEN_BUDGET or len(candidates) <= 1:
+            break
 
-    Here is the list of search results to be ranked:
-    {optimised_data}
+        # Shorter names first, then fewer candidates
+        if name_chars > config.RERANK_NAME_MIN_CHARS:
+            name_chars = max(config.RERANK_NAME_MIN_CHARS, name_chars * 3 // 4)
+        else:
+            candidates = candidates[:-1]
 
-    In your response, just share the re-ranked list (array) of product IDs in order of relevance, and say nothing else. For example: [ID1, ID2, ID3, ID4]
-    - No markdown
-    - No ```code``` blocks or ```JSON``` blocks
-    - No additional text
-    - No explanations
-    - No creation of new product IDs
-    - Do no remove any product ID from the provided list; all should be returned & reranked in new improved order.
+    if len(candidates) < len(data_to_rerank):
+        inc("rerank_prompt_truncated_total")
+
+    return text, [item["product_id"] for item in candidates]
+
+
+# ----------------- PROMPTS -----------------
+RANKING_RULES = """
+    - Answer with the candidate numbers only, no markdown, no code blocks, no explanations
+    - Use every number exactly once; never invent numbers
     - Organise the results very well, for example, if there are 10 relevant results of two types of brands, then group them together in the ranking, brand-wise.
     - Relevance should be the only criteria for ranking. Most relevant result on top and rest to follow.
+"""
+
+
+def prompt_for_reranking(original_query, data_to_rerank):
+    """
+    Returns:
+        tuple: (prompt, product IDs in alias order) – pass the IDs to
+        `parse_ranking_reply` together with the LLM's reply.
+    """
+    candidates, prompt_ids = format_candidates(data_to_rerank)
+
+    prompt = f"""
+    Query: {original_query}
+
+    Search results, numbered:
+    {candidates}
 
+    Re-rank the results by relevance to the query. Reply with a JSON array of the result numbers, most relevant first. For example: [3, 1, 2]
+    {RANKING_RULES}
     """
 
-    return prompt
\ No newline at end of file
+    return prompt, prompt_ids
+
+
+def prompt_for_batch_reranking(queries_to_rerank):
+    """
+    Builds one prompt that reranks several (query, results) pairs at once.
+
+    Args:
+        queries_to_rerank (list[tuple]): (original_query, data_to_rerank) pairs.
+
+    Returns:
+        tuple: (prompt, list of product IDs in alias order, one per query).
+    """
+    encoded = [format_candidates(data_to_rerank) for _, data_to_rerank in queries_to_rerank]
+
+    sections = "\n\n".join([
+        f"""### Query {i}: {original_query}
+    {candidates}"""
+        for i, ((original_query, _), (candidates, _)) in enumerate(zip(queries_to_rerank, encoded), start=1)
+    ])
+
+    prompt = f"""
+    Below are {len(queries_to_rerank)} independent queries, each followed by its own numbered search results.
+
+    {sections}
+
+    Re-rank each query's results by relevance to that query only. Reply with one JSON object mapping each query number to the array of its result numbers, most relevant first. For example: {{"1": [2, 1, 3], "2": [1, 2]}}
+    {RANKING_RULES}
+    """
+
+    return prompt, [prompt_ids for _, prompt_ids in encoded]
+
+
+# ----------------- REPLY PARSING -----------------
+def aliases_in(text):
+    return [int(token) for token in ALIAS_PATTERN.findall(text)]
+
+
+def repair_ranking(aliases, prompt_ids):
+    """
+    Maps aliases back to product IDs: unknown and repeated aliases are
+    dropped, missing ones are appended in prompt order.
+
+    Returns:
+        LLMRanking: Product IDs, with the LLM-ordered prefix length.
+
+    Raises:
+        ValueError: If no alias is usable.
+    """
+    seen = list(dict.fromkeys(alias for alias in aliases if 1 <= alias <= len(prompt_ids)))
+
+    if not seen and prompt_ids:
+        raise ValueError("Rerank reply contains no known result numbers")
+
+    dropped = len(aliases) - len(seen)
+    ranked = set(seen)
+    missing = [alias for alias in range(1, len(prompt_ids) + 1) if alias not in ranked]
+
+    if dropped:
+        inc("rerank_reply_repairs_total", kind="invalid_or_duplicate")
+    if missing:
+        inc("rerank_reply_repairs_total", kind="missing")
+
+    return LLMRanking([prompt_ids[alias - 1] for alias in seen + missing], len(seen))
+
+
+def parse_ranking_reply(reply, prompt_ids):
+    """
+    Parses a single-query reply (a JSON array of aliases).
+
+    Text around the array is ignored and a truncated array is read up to
+    where it stops.
+
+    Returns:
+        LLMRanking: Product IDs, reranked, covering every ID in `prompt_ids`.
+
+    Raises:
+        ValueError: If the reply holds no usable ranking.
+    """
+    start = ARRAY_START_PATTERN.search(reply)
+    if start is None:
+        raise ValueError("Rerank reply contains no array")
+
+    body = reply[start.end():].split("]", 1)[0]
+    return repair_ranking(aliases_in(body), prompt_ids)
+
+
+def parse_batch_ranking_reply(reply, prompt_ids_per_query):
+    """
+    Parses a batched reply (a JSON object of query number → alias array).
+
+    Falls back to reading `"n": [...]` pairs one by one when the object is
+    not valid JSON (e.g. truncated).
+
+    Returns:
+        list: Reranked product IDs per query, or None for a query whose
+        ranking is missing or unusable.
+    """
+    arrays = {}
+    try:
+        parsed = json.loads(reply)
+        if isinstance(parsed, dict):
+            arrays = {
+                str(number): aliases_in(json.dumps(ranking))
+                for number, ranking in parsed.items()
+                if isinstance(ranking, list)
+            }
+    except json.JSONDecodeError:
+        pass
+
+    if not arrays:
+        arrays = {number: aliases_in(body) for number, body in QUERY_ARRAY_PATTERN.findall(reply)}
+
+    rankings = []
+    for number, prompt_ids in enumerate(prompt_ids_per_query, start=1):
+        try:
+            rankings.append(repair_ranking(arrays[str(number)], prompt_ids))
+        except (KeyError, ValueError):
+            inc("rerank_reply_repairs_total", kind="query_missing")
+            rankings.append(None)
+
+    return rankings
+
+
+def complete_ranking(ranked_ids, data_to_rerank):
+    """
+    Appends candidates the prompt left out (token budget) behind the
+    reranked ones, in retrieval order.
+    """
+    ranked = set(ranked_ids)
+    return LLMRanking(
+        list(ranked_ids) + [item["product_id"] for item in data_to_rerank if item["product_id"] not in ranked],
+        getattr(ranked_ids, "llm_ranked", len(ranked_ids))
+    )
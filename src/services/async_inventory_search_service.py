@@ -0,0 +1,219 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from elasticsearch import AsyncElasticsearch
+
+from src.services.caching_service.cache_keys import cache_type
+from src.services.caching_service.get_cache import get_cache_entry_async, get_cached_page_async, get_l1_entry_async, past_end
+from src.services.caching_service.cache_generation import get_catalog_generation_async
+from src.services.caching_service.set_cache import extend_cached_results_async, set_provisional_entry
+from src.services.circuit_breaker_service import AsyncGuardedClient, is_failure
+from src.services.deadline_service import deadline
+from src.services.embedding_service import encode_query, encode_timeout, submit_encode
+from src.services.facet_service import facet_counts, normalize_filters
+from src.services.inventory_search_service import (
+    degraded_results,
+    has_intent,
+    hybrid_query,
+    infer_search_context_async,
+    rewrite_allowed,
+)
+from src.services.local_reranking_service import rerank_hits
+from src.services.metrics_service import inc, span, traced
+from src.services.queue_service import enqueue_rerank, use_durable_queue
+from src.services.retrieval_service import vector_search_async
+from src.services.singleflight_service import AsyncSingleFlight
+from src.services.startup_service import es_client_options
+from src.services.suggestion_service import record_query
+from config import config
+
+# Dedicated pool so CPU-bound encoding never blocks the event loop
+encode_executor = ThreadPoolExecutor(
+    max_workers=config.ASYNC_ENCODE_WORKERS,
+    thread_name_prefix="encode"
+)
+
+search_flights = AsyncSingleFlight("search")
+
+
+def create_async_es_client():
+    return AsyncElasticsearch(config.ELASTICSEARCH_URL, **es_client_options())
+
+
+async def encode_query_async(model, text):
+    if config.ENCODE_BATCHING:
+        # Awaits the micro-batcher directly; shielded because the future may be shared
+        timeout = encode_timeout()
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(submit_encode(model, text))), timeout)
+        except asyncio.TimeoutError:
+            inc("encode_timeouts_total")
+            raise TimeoutError(f"Query encode did not finish within {timeout * 1000:.0f} ms")
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(encode_executor, encode_query, model, text)
+
+
+async def search_inventory_async(query, _from, size, model, INDEX_NAME, es, _type=config.search_type, filters=None):
+    """
+    Runs `search_inventory_faceted_async` and returns the hits only.
+    """
+    return (await search_inventory_faceted_async(query, _from, size, model, INDEX_NAME, es, _type, filters))[0]
+
+
+@traced("search_inventory")
+async def search_inventory_faceted_async(query, _from, size, model, INDEX_NAME, es, _type=config.search_type, filters=None):
+    """
+    Async variant of `search_inventory_faceted` built on `AsyncElasticsearch`.
+
+    Runs the same pipeline, but the query embedding is computed speculatively
+    in an executor while the cache lookup is in flight, and is cancelled on a
+    cache hit. On a miss this overlaps the cache round trips with model
+    inference. Reranking is still enqueued for the background worker, which
+    writes the cache with its own sync client. Concurrent identical requests
+    await one shared task. Deadline, circuit breaker, fallbacks, filters and
+    facets work as in `search_inventory_faceted`.
+
+    Args:
+        query (str): Raw user search query.
+        _from (int): Pagination offset.
+        size (int): Number of results to return.
+        model: SentenceTransformer-compatible embedding model.
+        INDEX_NAME (str): Elasticsearch index name.
+        es: AsyncElasticsearch client instance.
+        _type (str): Search type identifier used for caching and reranking.
+        filters (dict): Optional brand / category / price / stock filters.
+
+    Returns:
+        tuple: (top `size` search results ordered by relevance, facet counts
+        or None when unavailable).
+
+    Raises:
+        ValueError: If `filters` are invalid.
+    """
+
+    # Normalize query and filters for cache consistency and embedding stability
+    normalized_query = query.strip().lower()
+    filters = normalize_filters(filters)
+
+    # First pages only: one count per search for the typeahead ranking
+    if _type == config.search_type and _from == 0:
+        record_query(normalized_query)
+
+    with deadline(config.SEARCH_DEADLINE_MS):
+        try:
+            # ⚡ Identical in-flight requests await the same task instead of re-running the pipeline
+            return await search_flights.do(
+                (INDEX_NAME, normalized_query, cache_type(_type, filters), _from, size),
+                run_search_inventory_async, normalized_query, _from, size, model, INDEX_NAME, es, _type, filters
+            )
+        except Exception as e:
+            if not is_failure(e):
+                raise
+            return degraded_results(normalized_query, _type, _from, size, INDEX_NAME, e, filters), None
+
+
+async def run_search_inventory_async(normalized_query, _from, size, model, INDEX_NAME, es, _type, filters=None):
+
+    # Request-path ES calls: circuit breaker + timeouts bounded by the deadline
+    es = AsyncGuardedClient(es)
+
+    # Each filter set has its own cache entry (and rerank job)
+    scope = cache_type(_type, filters)
+
+    # ⚡ L1 hits are answered without starting any speculative work
+    cache_entry = await get_l1_entry_async(normalized_query, scope, es)
+
+    encode_task = None
+    try:
+        if not cache_entry:
+            # Speculatively encode while the cache GET is in flight
+            encode_task = asyncio.ensure_future(encode_query_async(model, normalized_query))
+            with span("cache_lookup"):
+                cache_entry = await get_cache_entry_async(normalized_query, scope, es)
+
+        if cache_entry and _from + size > cache_entry["depth"]:
+            # Deeper page than cached → controlled extension of the ranked list,
+            # under its own budget: up to CACHE_MAX_DEPTH deep does not fit in the search's.
+            # None if the cache document is gone → fresh search
+            with span("cache_extend"), deadline(config.CACHE_EXTEND_DEADLINE_MS, override=True):
+                cache_entry = await extend_cached_results_async(
+                    normalized_query, scope, cache_entry, _from + size, model, INDEX_NAME, es,
+                    encode=encode_query_async
+                )
+
+        cached_hits = None
+        if cache_entry:
+            with span("cache_page"):
+                cached_hits = await get_cached_page_async(cache_entry, _from, size, es)
+    except BaseException:
+        # Failing over (e.g. to `degraded_results`) → never leave the speculative encode running detached
+        if encode_task:
+            encode_task.cancel()
+        raise
+
+    # Past the end of an exhausted entry → an empty page, not a re-search
+    if cache_entry and (cached_hits or past_end(cache_entry, _from)):
+        if encode_task:
+            encode_task.cancel()
+        inc("search_cache_requests_total", type=_type, result="hit")
+        return cached_hits, (cache_entry.get("search_context") or {}).get("facets")
+
+    inc("search_cache_requests_total", type=_type, result="miss")
+
+    if encode_task is None:
+        encode_task = asyncio.ensure_future(encode_query_async(model, normalized_query))
+
+    # Only the part of the encode not overlapped with the cache lookup
+    with span("encode_query"):
+        query_vector = await encode_task
+
+    # Infer category intent and rewrite the query (optional stages, budget permitting)
+    search_context, shortened = await infer_search_context_async(normalized_query, query_vector, INDEX_NAME, es, encode_executor)
+    if filters:
+        search_context["filters"] = filters
+
+    if has_intent(search_context) and rewrite_allowed():
+        with span("encode_revised"):
+            revised_query_vector = await encode_query_async(model, search_context["revised_query"])
+        search_context["embedded_query"] = search_context["revised_query"]
+    else:
+        revised_query_vector = query_vector
+        search_context["embedded_query"] = normalized_query
+        shortened = shortened or has_intent(search_context)
+
+    # Perform hybrid retrieval with semantic, lexical, and category signals
+    body = hybrid_query(revised_query_vector, search_context, _from, size)
+    with span("hybrid_search"):
+        response = await vector_search_async(es, INDEX_NAME, body, encode_executor)
+    hits = response["hits"]["hits"]
+
+    facets = None
+    if _type == config.search_type:
+        with span("facets"):
+            facets = search_context["facets"] = facet_counts([hit["_source"] for hit in hits])
+
+    if config.INLINE_RERANKER == "local":
+        with span("inline_rerank"):
+            hits = rerank_hits(normalized_query, hits, search_context)
+
+    # Trigger asynchronous re-ranking (worker uses its own sync client); a shortened pipeline is re-run there in full
+    if shortened:
+        search_context["shortened"] = True
+
+    # ⚡ Until the worker caches the reranked entry, next pages slice these candidates
+    set_provisional_entry(
+        normalized_query, scope, hits, len(hits) < body["size"], search_context,
+        (await get_catalog_generation_async(es))["generation"]
+    )
+
+    result_for_reranking = [item["_source"] for item in hits]
+    with span("enqueue_rerank"):
+        if use_durable_queue():
+            # SQLite insert (may wait on the database lock) → off the event loop
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, enqueue_rerank, normalized_query, result_for_reranking, scope, None, search_context)
+        else:
+            enqueue_rerank(normalized_query, result_for_reranking, scope, None, search_context)
+
+    return hits[_from:_from + size], facets
@@ -0,0 +1,136 @@
+"""
+Catalog generation: a counter per inventory index, bumped by every catalog
+sync, that cache entries are stamped with.
+
+The counter lives in CATALOG_STATE_INDEX (one document per inventory index)
+so every process agrees on it; each process re-reads it at most every
+CATALOG_GENERATION_CHECK_INTERVAL seconds. A cache entry is fresh only if it
+carries the current generation, its results were retrieved after that
+generation was published, and it is younger than CACHE_ENTRY_TTL.
+"""
+import time
+
+from elasticsearch import NotFoundError
+
+from src.services.metrics_service import inc
+from config import config
+
+# INVENTORY_INDEX → {"generation", "updated_at", "checked_at"}
+catalog_generations = {}
+
+
+def generation_from_doc(doc):
+    source = doc.get("_source", {}) if doc else {}
+    return {
+        "generation": int(source.get("generation", 0)),
+        "updated_at": int(source.get("updated_at", 0)),
+        "checked_at": time.monotonic()
+    }
+
+
+def known_generation(INDEX_NAME):
+    """
+    Returns the last generation read for `INDEX_NAME` if it is still recent
+    enough to use, else None.
+    """
+    state = catalog_generations.get(INDEX_NAME)
+    if state and time.monotonic() - state["checked_at"] < config.CATALOG_GENERATION_CHECK_INTERVAL:
+        return state
+
+    return None
+
+
+def remember_generation(INDEX_NAME, doc=None, error=None):
+    if error is None:
+        catalog_generations[INDEX_NAME] = generation_from_doc(doc)
+    else:
+        # Keep serving with the last known generation; retry on the next interval
+        print("Reading catalog generation failed: ", error)
+        inc("errors_total", where="catalog_generation", error=type(error).__name__)
+        state = catalog_generations.get(INDEX_NAME) or generation_from_doc(None)
+        catalog_generations[INDEX_NAME] = {**state, "checked_at": time.monotonic()}
+
+    return catalog_generations[INDEX_NAME]
+
+
+def get_catalog_generation(es, INDEX_NAME=config.INVENTORY_INDEX):
+    """
+    Returns {"generation", "updated_at"} of the catalog in `INDEX_NAME`
+    (generation 0 before the first bump).
+    """
+    state = known_generation(INDEX_NAME)
+    if state:
+        return state
+
+    try:
+        doc = es.get(index=config.CATALOG_STATE_INDEX, id=INDEX_NAME)
+    except NotFoundError:
+        return remember_generation(INDEX_NAME)
+    except Exception as e:
+        return remember_generation(INDEX_NAME, error=e)
+
+    return remember_generation(INDEX_NAME, doc)
+
+
+async def get_catalog_generation_async(es, INDEX_NAME=config.INVENTORY_INDEX):
+    """
+    Async variant of `get_catalog_generation` for an `AsyncElasticsearch` client.
+    """
+    state = known_generation(INDEX_NAME)
+    if state:
+        return state
+
+    try:
+        doc = await es.get(index=config.CATALOG_STATE_INDEX, id=INDEX_NAME)
+    except NotFoundError:
+        return remember_generation(INDEX_NAME)
+    except Exception as e:
+        return remember_generation(INDEX_NAME, error=e)
+
+    return remember_generation(INDEX_NAME, doc)
+
+
+def bump_catalog_generation(es, INDEX_NAME=config.INVENTORY_INDEX):
+    """
+    Publishes a new catalog generation after a catalog sync; every cache
+    entry stamped with an older one becomes a miss.
+
+    Returns:
+        int: The new generation.
+    """
+    # Epoch seconds as integers → `long` under dynamic mapping (a float would lose precision)
+    now = int(time.time())
+    es.update(
+        index=config.CATALOG_STATE_INDEX,
+        id=INDEX_NAME,
+        script={
+            "source": "ctx._source.generation += 1; ctx._source.updated_at = params.now",
+            "params": {"now": now}
+        },
+        upsert={"generation": 1, "updated_at": now},
+        retry_on_conflict=3,
+        refresh=True
+    )
+
+    # Read it back (realtime GET) so this process sees it immediately
+    catalog_generations.pop(INDEX_NAME, None)
+    return get_catalog_generation(es, INDEX_NAME)["generation"]
+
+
+def stale_reason(entry, generation):
+    """
+    Returns why a cache entry must not be served ("generation" or
+    "expired"), or None if it is fresh. Entries written before stamping was
+    introduced count as expired.
+    """
+    created_at = entry.get("created_at")
+    if created_at is None:
+        return "expired"
+
+    if entry.get("catalog_generation") != generation["generation"] or created_at < generation["updated_at"]:
+        return "generation"
+
+    if time.time() - created_at > config.CACHE_ENTRY_TTL:
+        return "expired"
+
+    return None
@@ -0,0 +1,37 @@
+import hashlib
+import json
+
+# Separates a search type from the digest of its filter set in cache types
+SCOPE_SEPARATOR = ":"
+
+
+def cache_doc_id(query, _type):
+    """
+    Returns a stable document ID for a cached (query, _type) entry.
+
+    Using a deterministic ID turns cache writes into upserts and cache reads
+    into direct GETs, so one document exists per query and type.
+    """
+    normalized_query = " ".join(query.strip().lower().split())
+    return hashlib.sha1(f"{_type}\x1f{normalized_query}".encode("utf-8")).hexdigest()
+
+
+def cache_type(_type, filters=None):
+    """
+    Returns the type a (possibly filtered) search is cached under: `_type`
+    itself without filters, else `_type` plus a digest of the canonical
+    filter set. Everything keyed by (query, _type) – L1, the cache document
+    ID, rerank job dedup – thereby keeps each filter set apart.
+    """
+    if not filters:
+        return _type
+
+    digest = hashlib.sha1(json.dumps(filters, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return f"{_type}{SCOPE_SEPARATOR}{digest}"
+
+
+def base_type(_type):
+    """
+    The search type of a cache type (e.g. for metric labels and load shedding).
+    """
+    return _type.split(SCOPE_SEPARATOR, 1)[0]
@@ -0,0 +1,147 @@
+"""
+Background eviction for the cache index (CACHE_INDEX).
+
+Lookups already ignore stale entries; the sweeper removes them so the index
+does not grow without bound:
+- entries from an older catalog generation, or retrieved before the current
+  generation was published
+- entries older than CACHE_ENTRY_TTL
+- unstamped entries written before stamping existed, which includes the
+  duplicates left by random document IDs (current writes upsert one
+  document per query and type, see `cache_doc_id`)
+- the oldest entries beyond CACHE_MAX_ENTRIES
+
+Usage:
+    python -m src.services.caching_service.cache_sweeper
+"""
+import threading
+import time
+
+from src.services.caching_service.cache_generation import catalog_generations, get_catalog_generation
+from src.services.metrics_service import inc, span
+from config import config
+
+CACHE_INDEX = config.CACHE_INDEX
+
+# Oldest entries deleted per round when the index is over its bound
+TRIM_BATCH_SIZE = 10000
+MAX_TRIM_ROUNDS = 20
+
+sweeper_threads = {}
+
+
+def stale_entries_query(generation, now):
+    stale_before = max(int(now) - config.CACHE_ENTRY_TTL, generation["updated_at"])
+
+    return {
+        "bool": {
+            "should": [
+                {"bool": {"must_not": {"exists": {"field": "created_at"}}}},
+                {"bool": {"must_not": {"exists": {"field": "catalog_generation"}}}},
+                {"range": {"catalog_generation": {"lt": generation["generation"]}}},
+                {"range": {"created_at": {"lt": stale_before}}}
+            ],
+            "minimum_should_match": 1
+        }
+    }
+
+
+def delete_stale_entries(es, generation, now=None):
+    response = es.delete_by_query(
+        index=CACHE_INDEX,
+        query=stale_entries_query(generation, now or time.time()),
+        conflicts="proceed",
+        refresh=True
+    )
+    return response.get("deleted", 0)
+
+
+def trim_to_max_entries(es):
+    """
+    Deletes the oldest entries until at most CACHE_MAX_ENTRIES remain.
+    """
+    deleted = 0
+
+    for _ in range(MAX_TRIM_ROUNDS):
+        excess = es.count(index=CACHE_INDEX)["count"] - config.CACHE_MAX_ENTRIES
+        if excess <= 0:
+            break
+
+        # created_at of the newest entry to drop → delete everything up to it
+        response = es.search(
+            index=CACHE_INDEX,
+            size=min(excess, TRIM_BATCH_SIZE),
+            sort=[{"created_at": "asc"}],
+            _source=False
+        )
+        hits = response["hits"]["hits"]
+        if not hits:
+            break
+
+        deleted += es.delete_by_query(
+            index=CACHE_INDEX,
+            query={"range": {"created_at": {"lte": hits[-1]["sort"][0]}}},
+            conflicts="proceed",
+            refresh=True
+        ).get("deleted", 0)
+
+    return deleted
+
+
+def sweep_cache(es):
+    """
+    Runs one sweep.
+
+    Returns:
+        dict: Entries deleted as stale and to stay under CACHE_MAX_ENTRIES.
+    """
+    if not es.indices.exists(index=CACHE_INDEX):
+        return {"stale": 0, "trimmed": 0}
+
+    # Fresh read: the sweeper must not act on a generation older than the writers'
+    catalog_generations.pop(config.INVENTORY_INDEX, None)
+    generation = get_catalog_generation(es)
+
+    with span("cache_sweep"):
+        summary = {
+            "stale": delete_stale_entries(es, generation),
+            "trimmed": trim_to_max_entries(es)
+        }
+
+    inc("cache_sweeper_deleted_total", summary["stale"], reason="stale")
+    inc("cache_sweeper_deleted_total", summary["trimmed"], reason="max_entries")
+
+    return summary
+
+
+def start_cache_sweeper(es):
+    """
+    Sweeps the cache index every CACHE_SWEEP_INTERVAL seconds on a
+    background thread (once per process).
+    """
+    if CACHE_INDEX in sweeper_threads and sweeper_threads[CACHE_INDEX].is_alive():
+        return
+
+    def run():
+        while True:
+            time.sleep(config.CACHE_SWEEP_INTERVAL)
+            try:
+                sweep_cache(es)
+            except Exception as e:
+                print("Cache sweep failed: ", e)
+                inc("errors_total", where="cache_sweeper", error=type(e).__name__)
+
+    thread = threading.Thread(target=run, name="cache-sweeper", daemon=True)
+    thread.start()
+    sweeper_threads[CACHE_INDEX] = thread
+
+
+def main():
+    from src.services.startup_service import create_es_client
+
+    summary = sweep_cache(create_es_client())
+    print(f"🧹 Deleted {summary['stale']} stale and {summary['trimmed']} surplus cache entries")
+
+
+if __name__ == "__main__":
+    main()
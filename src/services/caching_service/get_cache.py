@@ -1,47 +1,216 @@
+from elasticsearch import NotFoundError
 from config import config
-from src.services.elastic_query_service import get_cache_query, get_items_by_id_query
+from src.services.elastic_query_service import get_items_by_id_query
+from src.services.caching_service.cache_generation import (
+    get_catalog_generation,
+    get_catalog_generation_async,
+    stale_reason,
+)
+from src.services.caching_service.cache_keys import base_type, cache_doc_id
+from src.services.caching_service.l1_cache import delete_l1_entry, get_l1_entry, set_l1_entry
+from src.services.metrics_service import inc
 
 CACHE_INDEX = config.CACHE_INDEX
 INVENTORY_INDEX = config.INVENTORY_INDEX
 
-def get_cached_results(query, _type, es):
 
-    sorted_hits = []
+def cache_entry_from_doc(cache_doc):
+    """
+    Builds a cache entry from a cache document GET response (None on a miss).
+    """
+    if not cache_doc or not cache_doc.get("found"):
+        return None
+
+    source = cache_doc["_source"]
+    cached_product_ids = source.get("cached_product_ids") or []
+    if not cached_product_ids:
+        return None
+
+    return {
+        "cached_product_ids": cached_product_ids,
+        "depth": source.get("depth", len(cached_product_ids)),
+        "exhausted": source.get("exhausted", False),
+        "search_context": source.get("search_context"),
+        "catalog_generation": source.get("catalog_generation"),
+        "created_at": source.get("created_at"),
+        "hits": {}
+    }
+
+
+def fresh_entry(query, _type, entry, generation):
+    """
+    Returns `entry` if it may be served, else None. A stale entry (older
+    catalog generation, or expired) is a miss: the search runs again and
+    its rerank overwrites the entry.
+    """
+    if not entry:
+        return None
 
-    query_to_get_cache = get_cache_query(query, _type)
-    response = es.search(
-        index=CACHE_INDEX,
-        body=query_to_get_cache
-    )
+    reason = stale_reason(entry, generation)
+    if reason:
+        inc("cache_invalidations_total", type=base_type(_type), reason=reason)
+        delete_l1_entry(query, _type)
+        return None
 
-    if response["hits"]["total"]["value"] > 0:
-        cached_product_ids = response["hits"]["hits"][0]["_source"]["cached_product_ids"]
+    return entry
+
+
+def get_cache_entry(query, _type, es):
+    """
+    Returns the cached ranking for (query, _type), or None on a miss.
+
+    The entry holds the deep ranked ID list (`cached_product_ids`), how deep
+    it is (`depth`), whether retrieval had no more results (`exhausted`), the
+    `search_context` needed to extend it, and a `hits` map of product_id → ES
+    hit for the items hydrated so far. L1 is checked first; an L2 hit is
+    promoted into L1. Entries from an older catalog generation or older than
+    CACHE_ENTRY_TTL are treated as misses.
+    """
+    generation = get_catalog_generation(es)
+
+    # ⚡ L1: in-process hit avoids the cache GET
+    entry = fresh_entry(query, _type, get_l1_entry(query, _type), generation)
+    if entry:
+        return entry
+
+    # 🔑 Direct realtime GET on the deterministic cache document ID
+    try:
+        cache_doc = es.get(
+            index=CACHE_INDEX,
+            id=cache_doc_id(query, _type),
+            realtime=True
+        )
+    except NotFoundError:
+        return None
+
+    entry = fresh_entry(query, _type, cache_entry_from_doc(cache_doc), generation)
+
+    # 🔑 Promote L2 hit into L1
+    set_l1_entry(query, _type, entry)
+
+    return entry
+
+
+async def get_l1_entry_async(query, _type, es):
+    """
+    Returns the fresh L1 entry for (query, _type), or None. Only reads ES
+    when the catalog generation is due for a re-check.
+    """
+    entry = get_l1_entry(query, _type)
+    if not entry:
+        return None
+
+    return fresh_entry(query, _type, entry, await get_catalog_generation_async(es))
+
+
+async def get_cache_entry_async(query, _type, es):
+    """
+    Async variant of `get_cache_entry` for an `AsyncElasticsearch` client.
+    """
+    entry = await get_l1_entry_async(query, _type, es)
+    if entry:
+        return entry
+
+    generation = await get_catalog_generation_async(es)
+
+    try:
+        cache_doc = await es.get(
+            index=CACHE_INDEX,
+            id=cache_doc_id(query, _type),
+            realtime=True
+        )
+    except NotFoundError:
+        return None
 
-        query_to_get_items = get_items_by_id_query(cached_product_ids)
-        items_response = es.search(
+    entry = fresh_entry(query, _type, cache_entry_from_doc(cache_doc), generation)
+    set_l1_entry(query, _type, entry)
+
+    return entry
+
+
+def missing_page_ids(entry, _from, size):
+    return [
+        pid
+        for pid in entry["cached_product_ids"][_from:_from + size]
+        if pid not in entry["hits"]
+    ]
+
+
+def assemble_page(entry, _from, size, docs=()):
+    """
+    Stores freshly fetched mget docs in the entry and returns the page hits.
+    """
+    hit_map = entry["hits"]
+    for doc in docs:
+        if doc.get("found"):
+            hit_map[doc["_id"]] = doc
+
+    # 🔑 Reorder hits exactly as LLM reranked IDs
+    return [
+        hit_map[pid]
+        for pid in entry["cached_product_ids"][_from:_from + size]
+        if pid in hit_map
+    ]
+
+
+def past_end(entry, _from):
+    """
+    True if `_from` is beyond the last result of an exhausted entry: the
+    page is empty, and a fresh search would not find more.
+    """
+    return bool(entry.get("exhausted")) and _from >= entry["depth"]
+
+
+def get_cached_page(entry, _from, size, es):
+    """
+    Returns the hits for one page of a cache entry.
+
+    Only the IDs on the requested page are hydrated, with a single mget for
+    those not already held in the entry.
+    """
+    docs = []
+
+    missing_ids = missing_page_ids(entry, _from, size)
+    if missing_ids:
+
+        # 🔑 product_id is the inventory document ID → mget instead of a terms search
+        items_response = es.mget(
             index=INVENTORY_INDEX,
-            body=query_to_get_items
+            body=get_items_by_id_query(missing_ids)
         )
+        docs = items_response["docs"]
+
+    return assemble_page(entry, _from, size, docs)
 
-        hits = items_response["hits"]["hits"]
-        if hits:
 
-            # 🔑 Map product_id → ES hit
-            hit_map = {
-                hit["_source"]["product_id"]: hit
-                for hit in hits
-            }
+async def get_cached_page_async(entry, _from, size, es):
+    """
+    Async variant of `get_cached_page` for an `AsyncElasticsearch` client.
+    """
+    docs = []
+
+    missing_ids = missing_page_ids(entry, _from, size)
+    if missing_ids:
+        items_response = await es.mget(
+            index=INVENTORY_INDEX,
+            body=get_items_by_id_query(missing_ids)
+        )
+        docs = items_response["docs"]
+
+    return assemble_page(entry, _from, size, docs)
+
+
+def get_cached_results(query, _type, es, _from=0, size=None):
+
+    sorted_hits = []
 
-            # 🔑 Reorder hits exactly as LLM reranked IDs
-            sorted_hits = [
-                hit_map[pid]
-                for pid in cached_product_ids
-                if pid in hit_map
-            ]
+    entry = get_cache_entry(query, _type, es)
+    if entry:
+        size = entry["depth"] - _from if size is None else size
+        sorted_hits = get_cached_page(entry, _from, size, es)
 
-    # Placeholder for actual caching logic
     return {
         "hits": {
             "hits": sorted_hits
         }
-    }
\ No newline at end of file
+    }
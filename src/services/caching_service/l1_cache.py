@@ -0,0 +1,42 @@
+from config import config
+from src.services.caching_service.local_cache import LocalCache
+from src.services.metrics_service import cache_samples, register_collector
+
+# 🔑 In-process L1: (query, _type) → cache entry (ranked IDs + hydrated hits)
+result_cache = LocalCache(
+    maxsize=config.L1_CACHE_SIZE,
+    ttl=config.L1_CACHE_TTL
+)
+
+
+register_collector(lambda: cache_samples("l1", result_cache))
+
+
+def get_l1_entry(query, _type):
+    return result_cache.get((query, _type))
+
+
+def set_l1_entry(query, _type, entry):
+    if entry and entry.get("cached_product_ids"):
+        result_cache.set((query, _type), entry)
+
+
+def delete_l1_entry(query, _type):
+    result_cache.delete((query, _type))
+
+
+def build_hit_map_from_sources(sources, INDEX_NAME=config.INVENTORY_INDEX):
+    """
+    Builds a product_id → ES-shaped hit map from already fetched documents.
+
+    Used by the rerank worker to warm the L1 cache without going back to ES.
+    """
+    return {
+        source["product_id"]: {
+            "_index": INDEX_NAME,
+            "_id": source["product_id"],
+            "_source": source
+        }
+        for source in sources
+        if source.get("product_id")
+    }
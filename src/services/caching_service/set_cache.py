@@ -1,21 +1,265 @@
+import time
+
+from elasticsearch import NotFoundError
+
 from config import config
-from src.services.llm_reranking_services import rerank_elasticsearch_results
+from src.services.ai_prompt_service import LLMRanking
+from src.services.reranking_service import get_reranker
+from src.services.elastic_query_service import search_query
+from src.services.embedding_service import encode_query
+from src.services.retrieval_service import vector_search, vector_search_async
+from src.services.caching_service.cache_generation import get_catalog_generation
+from src.services.caching_service.cache_keys import cache_doc_id
+from src.services.caching_service.l1_cache import build_hit_map_from_sources, delete_l1_entry, set_l1_entry
 
 CACHE_INDEX = config.CACHE_INDEX
 
-def set_cached_results(query, results_to_rerank, _type, es):
+def rerank_head(results_to_rerank):
+    # Only the head is reranked by the LLM; the tail keeps retrieval order
+    return results_to_rerank[:config.RERANK_WINDOW]
+
+
+def set_cached_results(query, results_to_rerank, _type, es, search_context=None, reranked_ids=None, retrieved_at=None):
+    """
+    Reranks retrieved results and stores the deep ranked ID list in the cache.
+
+    Only the head (`RERANK_WINDOW` items) is sent to the LLM; the remaining
+    results keep their retrieval order behind it, so the cache can serve
+    deep pages without reranking hundreds of items. `reranked_ids` can be
+    passed when the head was already reranked (e.g. in a batched LLM call).
+
+    The entry is stamped with the catalog generation and `created_at`, the
+    time the results were retrieved (`retrieved_at`, e.g. when the rerank
+    job was enqueued); results retrieved before a catalog sync are never
+    served under the generation it published.
+
+    `reranker` records who ordered the head: "llm", with `llm_ranked` the
+    number of leading IDs the LLM ordered itself, or "local" (local
+    reranker, including LLM fallbacks). Only LLM orderings are used to
+    train the local reranker.
+    """
 
-    reranked_ids = rerank_elasticsearch_results(query, results_to_rerank)
+    tail = results_to_rerank[config.RERANK_WINDOW:]
+
+    if reranked_ids is None:
+        reranker = get_reranker(config.BACKGROUND_RERANKER)
+        reranked_ids = reranker(query, rerank_head(results_to_rerank), search_context)
+    cached_product_ids = list(dict.fromkeys(
+        list(reranked_ids) + [item["product_id"] for item in tail]
+    ))
+    is_llm_ranking = isinstance(reranked_ids, LLMRanking)
 
     cache_object = {
         "user_query": query,
-        "cached_product_ids": reranked_ids,
-        "_type": _type
+        "cached_product_ids": cached_product_ids,
+        "depth": len(cached_product_ids),
+        "exhausted": len(results_to_rerank) < config.CACHE_DEPTH,
+        "search_context": search_context,
+        "_type": _type,
+        "reranker": "llm" if is_llm_ranking else "local",
+        "llm_ranked": reranked_ids.llm_ranked if is_llm_ranking else 0,
+        "catalog_generation": get_catalog_generation(es)["generation"],
+        # Integer epoch seconds → `long` under dynamic mapping
+        "created_at": int(retrieved_at or time.time())
     }
 
+    # 🔑 Deterministic ID → re-reranking the same query overwrites (upserts) its entry
     response = es.index(
         index=CACHE_INDEX,
+        id=cache_doc_id(query, _type),
         document=cache_object
     )
 
-    return response
\ No newline at end of file
+    # 🔑 Warm L1 with the reranked order so the next request skips ES entirely
+    set_l1_entry(query, _type, {
+        "cached_product_ids": cached_product_ids,
+        "depth": cache_object["depth"],
+        "exhausted": cache_object["exhausted"],
+        "search_context": search_context,
+        "catalog_generation": cache_object["catalog_generation"],
+        "created_at": cache_object["created_at"],
+        "hits": build_hit_map_from_sources(results_to_rerank)
+    })
+
+    return response
+
+
+def set_provisional_entry(query, _type, hits, exhausted, search_context, generation):
+    """
+    Warms L1 with the candidates a cache miss just retrieved (in their
+    inline order), until the rerank worker writes the real entry: next
+    pages of the query slice them instead of re-running retrieval.
+
+    The entry is local to this process, never written to L2 and never
+    extended; the worker's `set_cached_results` replaces it.
+    """
+    product_ids = list(dict.fromkeys(hit["_source"]["product_id"] for hit in hits))
+
+    set_l1_entry(query, _type, {
+        "cached_product_ids": product_ids,
+        "depth": len(product_ids),
+        "exhausted": exhausted,
+        "search_context": search_context,
+        "catalog_generation": generation,
+        "created_at": int(time.time()),
+        "provisional": True,
+        "hits": {hit["_source"]["product_id"]: hit for hit in hits}
+    })
+
+
+def extension_target(entry, target_depth):
+    """
+    Returns the depth an entry should be extended to, or None if it cannot
+    (or need not) be extended.
+    """
+    depth = entry["depth"]
+
+    if entry.get("exhausted") or entry.get("provisional") or not entry.get("search_context") or target_depth <= depth:
+        return None
+
+    target_depth = min(
+        max(target_depth, depth + config.CACHE_EXTENSION_STEP),
+        config.CACHE_MAX_DEPTH
+    )
+
+    return target_depth if target_depth > depth else None
+
+
+def embedded_query(search_context):
+    """
+    Returns the text whose embedding retrieved an entry's ranking: the
+    rewritten query, or the plain one when there was no intent or the
+    rewrite was skipped. An extension must encode the same text, or its
+    `from=depth` cuts into a different ranking.
+    """
+    return search_context.get("embedded_query", search_context["revised_query"])
+
+
+def extension_query(entry, query_vector, target_depth):
+    search_context = entry["search_context"]
+    depth = entry["depth"]
+
+    return search_query(
+        query_vector,
+        depth,
+        target_depth - depth,
+        _source={"excludes": ["embedding"]},
+        cat_pred=search_context.get("cat_pred"),
+        sub_cat_pred=search_context.get("sub_cat_pred"),
+        sub_sub_cat_pred=search_context.get("sub_sub_cat_pred"),
+        sub_sub_sub_cat_pred=search_context.get("sub_sub_sub_cat_pred"),
+        filters=search_context.get("filters"),
+    )
+
+
+def apply_extension(entry, hits, target_depth):
+    """
+    Appends newly retrieved hits behind the existing ranking.
+
+    Returns:
+        tuple: (partial cache document update, extended cache entry)
+    """
+    depth = entry["depth"]
+
+    known_ids = set(entry["cached_product_ids"])
+    new_hits = [hit for hit in hits if hit["_source"]["product_id"] not in known_ids]
+
+    cached_product_ids = entry["cached_product_ids"] + [
+        hit["_source"]["product_id"] for hit in new_hits
+    ]
+    exhausted = len(hits) < target_depth - depth or len(cached_product_ids) >= config.CACHE_MAX_DEPTH
+
+    cache_update = {
+        "cached_product_ids": cached_product_ids,
+        "depth": len(cached_product_ids),
+        "exhausted": exhausted
+    }
+
+    hit_map = dict(entry["hits"])
+    hit_map.update({hit["_source"]["product_id"]: hit for hit in new_hits})
+
+    extended_entry = {
+        **cache_update,
+        "search_context": entry["search_context"],
+        "catalog_generation": entry.get("catalog_generation"),
+        "created_at": entry.get("created_at"),
+        "hits": hit_map
+    }
+
+    return cache_update, extended_entry
+
+
+def extend_cached_results(query, _type, entry, target_depth, model, INDEX_NAME, es):
+    """
+    Extends a cache entry to `target_depth` ranked IDs without a full re-search.
+
+    The stored `search_context` (embedded query, inferred hierarchy and
+    filters) is replayed for the missing range only; the new IDs are
+    appended behind the existing ranking and the entry is updated in both
+    cache tiers.
+
+    Returns:
+        dict: The (possibly) extended cache entry, or None if its cache
+        document is gone (e.g. swept while this process's L1 still held
+        it): the L1 copy is dropped and the caller runs a fresh search.
+    """
+    target_depth = extension_target(entry, target_depth)
+    if target_depth is None:
+        return entry
+
+    query_vector = encode_query(model, embedded_query(entry["search_context"]))
+    body = extension_query(entry, query_vector, target_depth)
+    hits = vector_search(es, INDEX_NAME, body)["hits"]["hits"]
+
+    cache_update, extended_entry = apply_extension(entry, hits, target_depth)
+
+    try:
+        es.update(
+            index=CACHE_INDEX,
+            id=cache_doc_id(query, _type),
+            doc=cache_update
+        )
+    except NotFoundError:
+        delete_l1_entry(query, _type)
+        return None
+
+    set_l1_entry(query, _type, extended_entry)
+
+    return extended_entry
+
+
+async def extend_cached_results_async(query, _type, entry, target_depth, model, INDEX_NAME, es, encode=None):
+    """
+    Async variant of `extend_cached_results` for an `AsyncElasticsearch` client.
+
+    `encode` is an awaitable `(model, text) -> vector` so encoding can run
+    off the event loop.
+    """
+    target_depth = extension_target(entry, target_depth)
+    if target_depth is None:
+        return entry
+
+    text = embedded_query(entry["search_context"])
+    if encode:
+        query_vector = await encode(model, text)
+    else:
+        query_vector = encode_query(model, text)
+
+    body = extension_query(entry, query_vector, target_depth)
+    response = await vector_search_async(es, INDEX_NAME, body)
+
+    cache_update, extended_entry = apply_extension(entry, response["hits"]["hits"], target_depth)
+
+    try:
+        await es.update(
+            index=CACHE_INDEX,
+            id=cache_doc_id(query, _type),
+            doc=cache_update
+        )
+    except NotFoundError:
+        delete_l1_entry(query, _type)
+        return None
+
+    set_l1_entry(query, _type, extended_entry)
+
+    return extended_entry
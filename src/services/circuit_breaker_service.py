@@ -0,0 +1,234 @@
+"""
+Circuit breaker for Elasticsearch calls on the request path.
+
+closed → open: after ES_BREAKER_FAILURE_THRESHOLD consecutive failures.
+A failure is a transport error (connection refused / reset, timeout), an
+overloaded or failing cluster (HTTP 429 / 5xx), or a call slower than
+ES_BREAKER_SLOW_CALL_MS. 4xx answers such as a 404 are normal results,
+and so is a timeout of a call whose timeout was cut short by the request's
+own deadline: it says the budget ran out, not that ES is unhealthy.
+
+open: calls are rejected immediately with `CircuitOpenError`, so callers
+fall back (local caches, browse snapshot) instead of queueing up behind a
+brownout.
+
+open → half-open: after ES_BREAKER_RESET_TIMEOUT seconds one probe call is
+let through; its success closes the breaker, its failure re-opens it.
+
+`GuardedClient` / `AsyncGuardedClient` wrap an ES client for the request
+path: every API call goes through the breaker, with its timeout capped to
+the request's remaining budget (see `deadline_service`).
+
+Usage:
+    es = GuardedClient(es)
+    response = es.search(index=INDEX_NAME, body=body)
+"""
+import asyncio
+import threading
+import time
+
+from elasticsearch import ApiError, ConnectionTimeout, TransportError
+
+from src.services.deadline_service import bounded_client, budget_timeout
+from src.services.metrics_service import inc, register_collector
+from config import config
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Client methods that do not talk to ES
+UNGUARDED_METHODS = {"options", "close"}
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a dependency whose breaker is open.
+    """
+
+
+def is_failure(e):
+    """
+    True if `e` means the dependency is unavailable or overloaded.
+    """
+    if isinstance(e, (CircuitOpenError, TransportError, TimeoutError, asyncio.TimeoutError)):
+        return True
+
+    if isinstance(e, ApiError):
+        return e.meta.status == 429 or e.meta.status >= 500
+
+    return False
+
+
+def is_timeout(e):
+    return isinstance(e, (ConnectionTimeout, TimeoutError, asyncio.TimeoutError))
+
+
+class CircuitBreaker:
+
+    def __init__(self, name, failure_threshold, slow_call_seconds, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def transition(self, state):
+        # Caller holds the lock
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        self.state = state
+        self.probing = False
+        inc("circuit_breaker_transitions_total", breaker=self.name, state=state)
+
+    def allow(self):
+        """
+        True if a call may go through now; in half-open state only one
+        probe at a time does.
+        """
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.transition(HALF_OPEN)
+
+            if self.state == CLOSED:
+                return True
+
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+
+        inc("circuit_breaker_rejections_total", breaker=self.name)
+        return False
+
+    def record(self, ok):
+        with self.lock:
+            if ok:
+                self.failures = 0
+                if self.state != CLOSED:
+                    self.transition(CLOSED)
+                return
+
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.transition(OPEN)
+
+    def release_probe(self):
+        with self.lock:
+            self.probing = False
+
+    def before_call(self):
+        """
+        Returns (start time, True if the call's timeout is capped by the
+        request's deadline).
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit breaker is open")
+        return time.perf_counter(), budget_timeout() is not None
+
+    def after_call(self, attempt, error=None):
+        started, budget_bound = attempt
+
+        if error is not None:
+            if budget_bound and is_timeout(error):
+                # Our own budget ran out: no health signal either way, but frees a half-open probe
+                inc("circuit_breaker_budget_timeouts_total", breaker=self.name)
+                self.release_probe()
+            elif is_failure(error):
+                self.record(False)
+            else:
+                # Not a health signal (e.g. 404), but releases a half-open probe
+                self.record(True)
+            return
+
+        slow = time.perf_counter() - started > self.slow_call_seconds
+        if slow:
+            inc("circuit_breaker_slow_calls_total", breaker=self.name)
+        self.record(not slow)
+
+    def call(self, fn, *args, **kwargs):
+        attempt = self.before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.after_call(attempt, e)
+            raise
+
+        self.after_call(attempt)
+        return result
+
+    async def call_async(self, fn, *args, **kwargs):
+        attempt = self.before_call()
+        try:
+            result = await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            # The caller went away; says nothing about ES, but frees a half-open probe
+            self.release_probe()
+            raise
+        except Exception as e:
+            self.after_call(attempt, e)
+            raise
+
+        self.after_call(attempt)
+        return result
+
+    def samples(self):
+        labels = {"breaker": self.name}
+        return [
+            ("circuit_breaker_state", "gauge", labels, STATE_VALUES[self.state]),
+            ("circuit_breaker_consecutive_failures", "gauge", labels, self.failures)
+        ]
+
+
+es_breaker = CircuitBreaker(
+    "elasticsearch",
+    failure_threshold=config.ES_BREAKER_FAILURE_THRESHOLD,
+    slow_call_seconds=config.ES_BREAKER_SLOW_CALL_MS / 1000,
+    reset_timeout=config.ES_BREAKER_RESET_TIMEOUT
+)
+
+register_collector(es_breaker.samples)
+
+
+class GuardedClient:
+    """
+    Proxy of a sync ES client whose API calls go through `breaker`, each
+    with a timeout bounded by the request's deadline. Namespaced clients
+    (`es.indices`, ...) and client methods are passed through unguarded.
+    """
+
+    def __init__(self, es, breaker=es_breaker):
+        self.es = es
+        self.breaker = breaker
+
+    def __getattr__(self, name):
+        attr = getattr(self.es, name)
+        if name.startswith("_") or name in UNGUARDED_METHODS or not callable(attr):
+            return attr
+
+        def guarded(*args, **kwargs):
+            return self.breaker.call(getattr(bounded_client(self.es), name), *args, **kwargs)
+
+        return guarded
+
+
+class AsyncGuardedClient(GuardedClient):
+    """
+    `GuardedClient` for an `AsyncElasticsearch` client.
+    """
+
+    def __getattr__(self, name):
+        attr = getattr(self.es, name)
+        if name.startswith("_") or name in UNGUARDED_METHODS or not callable(attr):
+            return attr
+
+        async def guarded(*args, **kwargs):
+            return await self.breaker.call_async(getattr(bounded_client(self.es), name), *args, **kwargs)
+
+        return guarded
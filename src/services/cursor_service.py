@@ -0,0 +1,33 @@
+import base64
+import binascii
+import json
+
+
+def encode_cursor(state):
+    """
+    Encodes pagination state as an opaque, URL-safe token (None → None).
+    """
+    if state is None:
+        return None
+
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a token made by `encode_cursor`.
+
+    Raises:
+        ValueError: If the token is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        state = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+    if not isinstance(state, dict):
+        raise ValueError("Invalid cursor")
+
+    return state
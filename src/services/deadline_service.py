@@ -0,0 +1,98 @@
+"""
+Per-request latency budgets.
+
+A deadline is set once at the entry point of a search or recommendation
+(`with deadline(config.SEARCH_DEADLINE_MS)`) and read by every stage below
+it through a context variable, so it follows the request across function
+calls, single-flight leaders and asyncio tasks without being passed around.
+Nested deadlines never extend the enclosing one, except for stages given
+their own budget on purpose (`override`).
+
+Stages use it to:
+- skip optional work when the budget runs low (`has_budget`)
+- cap ES request timeouts to what is left (`bounded_client`)
+
+Usage:
+    with deadline(config.SEARCH_DEADLINE_MS):
+        if has_budget(config.DEADLINE_INTENT_MIN_MS):
+            ...
+        response = bounded_client(es).search(...)
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+from config import config
+
+# Monotonic deadline of the request being served (per thread / asyncio task)
+current_deadline = contextvars.ContextVar("current_deadline", default=None)
+
+
+@contextmanager
+def deadline(budget_ms, override=False):
+    """
+    Runs the block under a deadline `budget_ms` from now (no deadline for
+    a budget of 0). An enclosing, earlier deadline is kept unless
+    `override` is set, which replaces it for the block (e.g. a deep-page
+    extension that cannot fit in the search budget).
+    """
+    if not budget_ms:
+        yield
+        return
+
+    ends_at = time.monotonic() + budget_ms / 1000
+    enclosing = current_deadline.get()
+    if enclosing is not None and not override:
+        ends_at = min(ends_at, enclosing)
+
+    token = current_deadline.set(ends_at)
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+
+def remaining():
+    """
+    Returns the seconds left before the deadline (negative once past it),
+    or None outside of a deadline.
+    """
+    ends_at = current_deadline.get()
+    if ends_at is None:
+        return None
+
+    return ends_at - time.monotonic()
+
+
+def has_budget(min_ms):
+    """
+    True if at least `min_ms` are left (always True without a deadline).
+    """
+    left = remaining()
+    return left is None or left * 1000 >= min_ms
+
+
+def budget_timeout():
+    """
+    Returns the ES request timeout (seconds) the remaining budget allows,
+    at least DEADLINE_MIN_ES_TIMEOUT_MS, or None without a deadline or when
+    the budget is not tighter than ES_REQUEST_TIMEOUT.
+    """
+    left = remaining()
+    if left is None or left >= config.ES_REQUEST_TIMEOUT:
+        return None
+
+    return max(left, config.DEADLINE_MIN_ES_TIMEOUT_MS / 1000)
+
+
+def bounded_client(es):
+    """
+    Returns `es` with its request timeout capped to the remaining budget
+    (see `budget_timeout`), or `es` itself when the budget does not cap it.
+    Works for sync and async clients.
+    """
+    timeout = budget_timeout()
+    if timeout is None:
+        return es
+
+    return es.options(request_timeout=timeout)
@@ -0,0 +1,302 @@
+"""
+Durable, cross-process rerank job queue backed by SQLite.
+
+Every app process sharing the database file sees the same jobs:
+- (query, _type) is the primary key, so a query pending or being reranked
+  anywhere is never enqueued twice;
+- workers lease jobs for a limited time; a crashed worker's lease expires
+  and the job is retried, up to RERANK_MAX_ATTEMPTS;
+- pending work survives restarts.
+
+Sharing works between processes of one host only: the database runs in WAL
+mode, whose shared-memory index needs a local filesystem, and SQLite's file
+locks are not reliable over NFS or other network filesystems. Replicas on
+different hosts must each use their own local file (or the memory backend).
+
+Each thread keeps one open connection per database file (`connection`), so
+an enqueue on the request path does not pay for opening the file.
+
+Usage:
+    python -m src.services.durable_queue_service inspect
+    python -m src.services.durable_queue_service list --status failed
+    python -m src.services.durable_queue_service requeue-failed
+    python -m src.services.durable_queue_service purge --status failed
+    python -m src.services.durable_queue_service drain
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rerank_jobs (
+    query TEXT NOT NULL,
+    type TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_until REAL,
+    last_error TEXT,
+    enqueued_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (query, type)
+);
+CREATE INDEX IF NOT EXISTS rerank_jobs_status ON rerank_jobs (status, enqueued_at);
+"""
+
+initialized_dbs = set()
+
+# Per-thread open connections: db_path → (pid, connection)
+thread_connections = threading.local()
+
+
+def connect(db_path=None):
+    db_path = db_path or config.RERANK_QUEUE_DB
+
+    if db_path not in initialized_dbs and os.path.dirname(db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous=NORMAL")
+
+    if db_path not in initialized_dbs:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        initialized_dbs.add(db_path)
+
+    return conn
+
+
+def connection(db_path=None):
+    """
+    Returns this thread's connection to `db_path`, opened on first use.
+    A connection inherited through `fork` is never reused by the child.
+    """
+    db_path = db_path or config.RERANK_QUEUE_DB
+
+    if not hasattr(thread_connections, "by_path"):
+        thread_connections.by_path = {}
+
+    pid, conn = thread_connections.by_path.get(db_path, (None, None))
+    if pid != os.getpid():
+        conn = connect(db_path)
+        thread_connections.by_path[db_path] = (os.getpid(), conn)
+
+    return conn
+
+
+def enqueue_job(query, _type, results, search_context=None, db_path=None):
+    """
+    Inserts a job unless (query, _type) is already pending or leased.
+    A previously failed job is reset to pending.
+
+    Returns:
+        bool: True if a job was enqueued.
+    """
+    now = time.time()
+    payload = json.dumps({"results": results, "search_context": search_context})
+
+    conn = connection(db_path)
+    cursor = conn.execute(
+        """
+        INSERT INTO rerank_jobs (query, type, payload, enqueued_at, updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (query, type) DO UPDATE SET
+            payload = excluded.payload,
+            status = 'pending',
+            attempts = 0,
+            lease_owner = NULL,
+            lease_until = NULL,
+            last_error = NULL,
+            enqueued_at = excluded.enqueued_at,
+            updated_at = excluded.updated_at
+        WHERE rerank_jobs.status = 'failed'
+        """,
+        (query, _type, payload, now, now)
+    )
+    return cursor.rowcount > 0
+
+
+def lease_jobs(owner, limit=1, lease_seconds=None, db_path=None):
+    """
+    Atomically leases up to `limit` pending (or lease-expired) jobs.
+
+    Returns:
+        list[dict]: Jobs with query, _type, results, search_context,
+        enqueued_at and attempts.
+    """
+    now = time.time()
+    lease_seconds = lease_seconds or config.RERANK_LEASE_SECONDS
+
+    conn = connection(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+
+        # Expired leases that already used all attempts → failed (crash loop)
+        conn.execute(
+            """
+            UPDATE rerank_jobs
+            SET status = 'failed', lease_owner = NULL, lease_until = NULL,
+                last_error = 'lease expired', updated_at = ?
+            WHERE status = 'leased' AND lease_until < ? AND attempts >= ?
+            """,
+            (now, now, config.RERANK_MAX_ATTEMPTS)
+        )
+
+        rows = conn.execute(
+            """
+            SELECT query, type, payload, attempts, enqueued_at FROM rerank_jobs
+            WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?)
+            ORDER BY enqueued_at
+            LIMIT ?
+            """,
+            (now, limit)
+        ).fetchall()
+
+        conn.executemany(
+            """
+            UPDATE rerank_jobs
+            SET status = 'leased', lease_owner = ?, lease_until = ?, attempts = attempts + 1, updated_at = ?
+            WHERE query = ? AND type = ?
+            """,
+            [(owner, now + lease_seconds, now, row["query"], row["type"]) for row in rows]
+        )
+        conn.execute("COMMIT")
+    except BaseException:
+        # The connection is reused by this thread: never leave it inside a transaction
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+    jobs = []
+    for row in rows:
+        payload = json.loads(row["payload"])
+        jobs.append({
+            "query": row["query"],
+            "_type": row["type"],
+            "results": payload["results"],
+            "search_context": payload.get("search_context"),
+            "enqueued_at": row["enqueued_at"],
+            "attempts": row["attempts"] + 1
+        })
+
+    return jobs
+
+
+def complete_job(query, _type, owner, db_path=None):
+    conn = connection(db_path)
+    conn.execute(
+        "DELETE FROM rerank_jobs WHERE query = ? AND type = ? AND lease_owner = ?",
+        (query, _type, owner)
+    )
+
+
+def fail_job(query, _type, owner, error, db_path=None):
+    """
+    Releases a leased job for retry, or marks it failed once it has used
+    up RERANK_MAX_ATTEMPTS.
+    """
+    conn = connection(db_path)
+    conn.execute(
+        """
+        UPDATE rerank_jobs
+        SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+            lease_owner = NULL, lease_until = NULL, last_error = ?, updated_at = ?
+        WHERE query = ? AND type = ? AND lease_owner = ?
+        """,
+        (config.RERANK_MAX_ATTEMPTS, str(error)[:500], time.time(), query, _type, owner)
+    )
+
+
+def queue_stats(db_path=None):
+    now = time.time()
+
+    conn = connection(db_path)
+    counts = {
+        row["status"]: row["n"]
+        for row in conn.execute("SELECT status, COUNT(*) AS n FROM rerank_jobs GROUP BY status")
+    }
+    expired = conn.execute(
+        "SELECT COUNT(*) FROM rerank_jobs WHERE status = 'leased' AND lease_until < ?", (now,)
+    ).fetchone()[0]
+    oldest = conn.execute(
+        "SELECT MIN(enqueued_at) FROM rerank_jobs WHERE status != 'failed'"
+    ).fetchone()[0]
+
+    return {
+        "pending": counts.get("pending", 0),
+        "leased": counts.get("leased", 0),
+        "expired_leases": expired,
+        "failed": counts.get("failed", 0),
+        "oldest_age_sec": now - oldest if oldest else 0.0
+    }
+
+
+def list_jobs(status=None, limit=20, db_path=None):
+    conn = connection(db_path)
+    rows = conn.execute(
+        f"""
+        SELECT query, type, status, attempts, lease_owner, lease_until, last_error, enqueued_at
+        FROM rerank_jobs {'WHERE status = ?' if status else ''}
+        ORDER BY enqueued_at LIMIT ?
+        """,
+        (status, limit) if status else (limit,)
+    ).fetchall()
+
+    return [dict(row) for row in rows]
+
+
+def requeue_failed(db_path=None):
+    conn = connection(db_path)
+    cursor = conn.execute(
+        "UPDATE rerank_jobs SET status = 'pending', attempts = 0, updated_at = ? WHERE status = 'failed'",
+        (time.time(),)
+    )
+    return cursor.rowcount
+
+
+def purge_jobs(status, db_path=None):
+    conn = connection(db_path)
+    return conn.execute("DELETE FROM rerank_jobs WHERE status = ?", (status,)).rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and operate the durable rerank queue.")
+    parser.add_argument("command", choices=["inspect", "list", "requeue-failed", "purge", "drain"])
+    parser.add_argument("--status", choices=["pending", "leased", "failed"])
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--db", default=config.RERANK_QUEUE_DB)
+    args = parser.parse_args()
+
+    if args.command == "inspect":
+        print(json.dumps(queue_stats(args.db), indent=2))
+
+    elif args.command == "list":
+        for job in list_jobs(args.status, args.limit, args.db):
+            print(json.dumps(job))
+
+    elif args.command == "requeue-failed":
+        print(f"↩️ Requeued {requeue_failed(args.db)} failed jobs")
+
+    elif args.command == "purge":
+        if not args.status:
+            parser.error("purge requires --status")
+        print(f"🗑️ Purged {purge_jobs(args.status, args.db)} {args.status} jobs")
+
+    elif args.command == "drain":
+        # Process everything pending in the foreground, then exit
+        from src.services.queue_service import drain_durable_queue
+        from src.services.startup_service import create_es_client
+
+        es = create_es_client()
+        print(f"✅ Drained {drain_durable_queue(es, args.db)} jobs")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,54 @@
-def search_query(query_vector, _from, size, _source = {"excludes": ["embedding"]}, cat_pred = None, sub_cat_pred = None, sub_sub_cat_pred = None, sub_sub_sub_cat_pred = None):
+from config import config
+from src.services.facet_service import PRICE_FIELD, TERM_FILTER_FIELDS
+
+
+def knn_depth_params(depth):
+    """
+    Scales kNN `k` / `num_candidates` with the deepest rank requested, so
+    every page up to `depth` is reachable through the vector clause.
+    """
+    k = max(config.KNN_MIN_K, depth)
+    num_candidates = min(
+        max(config.KNN_MIN_NUM_CANDIDATES, int(k * config.KNN_NUM_CANDIDATES_FACTOR)),
+        config.KNN_MAX_NUM_CANDIDATES
+    )
+
+    return min(k, num_candidates), num_candidates
+
+
+def filter_clauses(filters):
+    """
+    Non-scoring (cacheable) ES clauses for canonical search filters, see
+    `facet_service.normalize_filters`.
+    """
+    if not filters:
+        return []
+
+    clauses = [
+        {"terms": {field: filters[field]}}
+        for field in TERM_FILTER_FIELDS
+        if filters.get(field)
+    ]
+
+    price_range = {}
+    if filters.get("min_price") is not None:
+        price_range["gte"] = filters["min_price"]
+    if filters.get("max_price") is not None:
+        price_range["lte"] = filters["max_price"]
+    if price_range:
+        clauses.append({"range": {PRICE_FIELD: price_range}})
+
+    # Products without stock information count as in stock
+    if filters.get("in_stock"):
+        clauses.append({"bool": {"must_not": {"term": {"in_stock": False}}}})
+
+    return clauses
+
+
+def search_query(query_vector, _from, size, _source = {"excludes": ["embedding"]}, cat_pred = None, sub_cat_pred = None, sub_sub_cat_pred = None, sub_sub_sub_cat_pred = None, filters = None):
+
+    k, num_candidates = knn_depth_params(_from + size)
+    clauses = filter_clauses(filters)
 
     body = {
         "_source": _source,
@@ -7,11 +57,20 @@ def search_query(query_vector, _from, size, _source = {"excludes": ["embedding"]
         "knn": {
             "field": "embedding",
             "query_vector": query_vector,
-            "k": 75,
-            "num_candidates": 100
-        }
+            "k": k,
+            "num_candidates": num_candidates
+        },
+        # 🔑 Tie-break on product_id → identical scores keep one order across pages
+        "sort": [
+            {"_score": "desc"},
+            {"product_id": "asc"}
+        ]
     }
 
+    # 🔑 Pre-filter: kNN only considers matching documents (k stays reachable)
+    if clauses:
+        body["knn"]["filter"] = clauses
+
     if cat_pred and sub_cat_pred and sub_sub_cat_pred and sub_sub_sub_cat_pred:
         body["query"] = {
             "bool": {
@@ -53,6 +112,9 @@ def search_query(query_vector, _from, size, _source = {"excludes": ["embedding"]
             }
         }
 
+        if clauses:
+            body["query"]["bool"]["filter"] = clauses
+
     return body
 
 
@@ -86,13 +148,33 @@ def browse_items_query(size = 15, _source = {"excludes": ["embedding"]}):
     return body
 
 
-def get_items_by_id_query(product_ids, _source = {"excludes": ["embedding"]}):
+# Curated browse order: in-stock first (a missing flag counts as in stock),
+# best rated next, then product_id as the unique tiebreaker. Every key is a
+# document field, so `search_after` values stay valid on any PIT.
+BROWSE_SORT = [
+    {"in_stock": {"order": "desc", "missing": "_first", "unmapped_type": "boolean"}},
+    {"rating": {"order": "desc", "missing": "_last", "unmapped_type": "float"}},
+    {"product_id": "asc"}
+]
+
+
+def browse_snapshot_query(size = 60, category_count = 100, _source = {"excludes": ["embedding"]}):
+
+    # First browse page and category counts in one request; sorted like
+    # `browse_page_query` so "load more" continues where the snapshot ends
     body = {
         "_source": _source,
-        "size": len(product_ids),
+        "size": size,
         "query": {
-            "terms": {
-                "product_id": product_ids
+            "match_all": {}
+        },
+        "sort": BROWSE_SORT,
+        "aggs": {
+            "categories": {
+                "terms": {
+                    "field": "category",
+                    "size": category_count
+                }
             }
         }
     }
@@ -100,25 +182,109 @@ def get_items_by_id_query(product_ids, _source = {"excludes": ["embedding"]}):
     return body
 
 
-def get_cache_query(query, _type):
+def browse_page_query(pit_id, size = 15, keep_alive = "5m", search_after = None, _source = {"excludes": ["embedding"]}):
+
     body = {
-        "size": 1,
-        "query": {
-            "bool": {
-                "must": [
-                    {
-                        "term": {
-                            "user_query.keyword": query
-                        }
+        "_source": _source,
+        "size": size,
+        "pit": {
+            "id": pit_id,
+            "keep_alive": keep_alive
+        },
+        "sort": BROWSE_SORT,
+        "track_total_hits": False
+    }
+
+    if search_after:
+        body["search_after"] = search_after
+
+    return body
+
+
+def get_items_by_id_query(product_ids, _source = {"excludes": ["embedding"]}):
+    body = {
+        "docs": [
+            {
+                "_id": product_id,
+                "_source": _source
+            }
+            for product_id in product_ids
+        ]
+    }
+
+    return body
+
+
+def inventory_index_body(dims = 384, similarity = "cosine", quantized = False):
+
+    embedding_field = {
+        "type": "dense_vector",
+        "dims": dims,
+        "index": True,
+        "similarity": similarity
+    }
+
+    # int8 quantized HNSW cuts vector memory ~4x at a small recall cost
+    if quantized:
+        embedding_field["index_options"] = {
+            "type": "int8_hnsw"
+        }
+
+    body = {
+        "settings": {
+            "analysis": {
+                "filter": {
+                    "autocomplete_filter": {
+                        "type": "edge_ngram",
+                        "min_gram": 2,
+                        "max_gram": 20
+                    }
+                },
+                "analyzer": {
+                    "name_analyzer": {
+                        "type": "custom",
+                        "tokenizer": "standard",
+                        "filter": ["lowercase", "asciifolding"]
                     },
-                    {
-                        "term": {
-                            "_type.keyword": _type
+                    "autocomplete_analyzer": {
+                        "type": "custom",
+                        "tokenizer": "standard",
+                        "filter": ["lowercase", "asciifolding", "autocomplete_filter"]
+                    }
+                }
+            }
+        },
+        "mappings": {
+            "properties": {
+                "catalog_id": {"type": "integer"},
+                "product_id": {"type": "keyword"},
+                "name": {
+                    "type": "text",
+                    "analyzer": "name_analyzer",
+                    "fields": {
+                        "autocomplete": {
+                            "type": "text",
+                            "analyzer": "autocomplete_analyzer",
+                            "search_analyzer": "name_analyzer"
                         }
                     }
-                ]
+                },
+                "category": {"type": "keyword"},
+                "sub_category": {"type": "keyword"},
+                "sub_sub_category": {"type": "keyword"},
+                "sub_sub_sub_category": {"type": "keyword"},
+                "brand": {"type": "keyword"},
+                "price": {"type": "integer"},
+                "discounted_price": {"type": "float"},
+                "in_stock": {"type": "boolean"},
+                "rating": {"type": "float"},
+                "item_image_url": {"type": "keyword", "index": False},
+                "description": {"type": "text"},
+                "auto_complete_field": {"type": "search_as_you_type"},
+                "embedding_text": {"type": "text", "index": False},
+                "embedding": embedding_field
             }
         }
     }
 
-    return body
\ No newline at end of file
+    return body
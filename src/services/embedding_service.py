@@ -0,0 +1,256 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from src.services.caching_service.local_cache import LocalCache
+from src.services.deadline_service import remaining
+from src.services.metrics_service import SIZE_BUCKETS, cache_samples, inc, observe, register_collector
+from config import config
+
+# 🔑 Shared in-process cache: normalized text → embedding (list of floats)
+embedding_cache = LocalCache(
+    maxsize=config.EMBEDDING_CACHE_SIZE,
+    ttl=config.EMBEDDING_CACHE_TTL
+)
+
+# id(model) → EncodeBatcher
+encode_batchers = {}
+encode_batchers_lock = threading.Lock()
+
+
+def normalize_text(text):
+    """
+    Normalizes text used as embedding cache key.
+
+    The embedding model is uncased, so lowercasing and collapsing whitespace
+    does not change the resulting vector but improves cache reuse.
+    """
+    return " ".join(str(text).lower().split())
+
+
+def encode_query(model, text):
+    """
+    Returns the embedding of a single text, served from cache when possible.
+
+    Args:
+        model: SentenceTransformer-compatible embedding model.
+        text (str): Text to encode.
+
+    Returns:
+        list: Embedding vector as a list of floats.
+
+    Raises:
+        TimeoutError: If the micro-batched encode does not finish within
+            `encode_timeout()`.
+    """
+    if not config.ENCODE_BATCHING:
+        return encode_batch(model, [text])[0]
+
+    timeout = encode_timeout()
+    try:
+        return submit_encode(model, text).result(timeout)
+    except FutureTimeoutError:
+        inc("encode_timeouts_total")
+        raise TimeoutError(f"Query encode did not finish within {timeout * 1000:.0f} ms")
+
+
+def encode_timeout():
+    """
+    Returns how long (seconds) to wait for a micro-batched encode: the
+    remaining request budget, at least DEADLINE_MIN_ENCODE_TIMEOUT_MS, or
+    ENCODE_TIMEOUT outside of a deadline.
+    """
+    left = remaining()
+    if left is None:
+        return config.ENCODE_TIMEOUT
+
+    return max(left, config.DEADLINE_MIN_ENCODE_TIMEOUT_MS / 1000)
+
+
+def submit_encode(model, text):
+    """
+    Returns a `concurrent.futures.Future` of the embedding of `text`.
+
+    Cache hits resolve immediately; misses go to the model's micro-batcher
+    and are encoded together with whatever other callers submit within
+    ENCODE_BATCH_MAX_WAIT_MS. The future may be shared with other callers
+    of the same text, so it must not be cancelled.
+    """
+    key = normalize_text(text)
+
+    cached_vector = embedding_cache.get(key)
+    if cached_vector is not None:
+        future = Future()
+        future.set_result(cached_vector)
+        return future
+
+    return get_encode_batcher(model).submit(key)
+
+
+def encode_batch(model, texts):
+    """
+    Returns embeddings for a list of texts using a single model call.
+
+    Cached texts are answered from the embedding cache; all remaining
+    (deduplicated) texts are encoded together in one batched forward pass.
+
+    Args:
+        model: SentenceTransformer-compatible embedding model.
+        texts (list[str]): Texts to encode.
+
+    Returns:
+        list[list]: Embedding vectors, in the same order as `texts`.
+    """
+    keys = [normalize_text(text) for text in texts]
+
+    vectors = {}
+    missing = []
+    for key in keys:
+        if key in vectors or key in missing:
+            continue
+
+        cached_vector = embedding_cache.get(key)
+        if cached_vector is None:
+            missing.append(key)
+        else:
+            vectors[key] = cached_vector
+
+    if missing:
+        encoded = model.encode(missing, batch_size=config.EMBEDDING_BATCH_SIZE)
+        for key, vector in zip(missing, encoded):
+            vector = vector.tolist()
+            embedding_cache.set(key, vector)
+            vectors[key] = vector
+
+    return [vectors[key] for key in keys]
+
+
+# ----------------- MICRO-BATCHING -----------------
+class EncodeBatcher:
+    """
+    Cross-request micro-batcher for single-text encodes.
+
+    Callers from any thread submit a text and get a future; one background
+    thread collects submissions for up to ENCODE_BATCH_MAX_WAIT_MS (or until
+    ENCODE_BATCH_MAX_SIZE texts) and runs them as a single batched
+    `model.encode`. Requests that arrive while a batch is being encoded are
+    picked up by the next one, so under load batches grow without waiting.
+    Identical texts in flight share one future. A batch that fails fails its
+    futures, and a dead batcher thread is restarted on the next submit.
+    """
+
+    def __init__(self, model, max_batch=None, max_wait=None):
+        self.model = model
+        self.max_batch = max_batch or config.ENCODE_BATCH_MAX_SIZE
+        self.max_wait = config.ENCODE_BATCH_MAX_WAIT_MS / 1000.0 if max_wait is None else max_wait
+
+        self.requests = queue.SimpleQueue()
+        self.pending = {}
+        self.lock = threading.Lock()
+
+        self.thread = None
+        self.start()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="encode-batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, key):
+        with self.lock:
+            if not self.thread.is_alive():
+                print("Encode batcher thread died, restarting it")
+                inc("encode_batcher_restarts_total")
+                self.start()
+
+            future = self.pending.get(key)
+            if future is None:
+                future = self.pending[key] = Future()
+                self.requests.put((key, time.perf_counter()))
+
+        return future
+
+    def next_batch(self):
+        batch = [self.requests.get()]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                batch.append(self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def encode(self, batch):
+        keys = [key for key, queued_at in batch]
+
+        started = time.perf_counter()
+        observe("encode_batch_size", len(keys), buckets=SIZE_BUCKETS)
+        for key, queued_at in batch:
+            observe("encode_batch_wait_seconds", started - queued_at)
+
+        try:
+            encoded = self.model.encode(keys, batch_size=config.EMBEDDING_BATCH_SIZE)
+            vectors = [vector.tolist() for vector in encoded]
+            error = None
+        except Exception as e:
+            print("Batched encode failed: ", e)
+            vectors = [None] * len(keys)
+            error = e
+
+        observe("encode_batch_seconds", time.perf_counter() - started)
+
+        for key, vector in zip(keys, vectors):
+            if error is None:
+                embedding_cache.set(key, vector)
+
+            with self.lock:
+                future = self.pending.pop(key)
+
+            if error is None:
+                future.set_result(vector)
+            else:
+                future.set_exception(error)
+
+    def fail(self, batch, error):
+        for key, queued_at in batch:
+            with self.lock:
+                future = self.pending.pop(key, None)
+
+            if future is not None and not future.done():
+                future.set_exception(error)
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            try:
+                self.encode(batch)
+            except Exception as e:
+                # Never leave callers of the batch waiting; keep serving the next ones
+                print("Encode batcher failed: ", e)
+                inc("errors_total", where="encode_batcher", error=type(e).__name__)
+                self.fail(batch, e)
+
+
+def get_encode_batcher(model):
+    """
+    Returns the micro-batcher of `model`, started on first use.
+    """
+    batcher = encode_batchers.get(id(model))
+    if batcher is None:
+        with encode_batchers_lock:
+            batcher = encode_batchers.get(id(model))
+            if batcher is None:
+                batcher = encode_batchers[id(model)] = EncodeBatcher(model)
+
+    return batcher
+
+
+def embedding_cache_stats():
+    return embedding_cache.stats()
+
+
+register_collector(lambda: cache_samples("embedding", embedding_cache))
@@ -0,0 +1,133 @@
+"""
+Search filters and facet counts.
+
+Filters narrow a search before retrieval: they are applied as non-scoring
+clauses in the kNN `filter` and in the hybrid bool `filter` context (see
+`elastic_query_service.filter_clauses`), so ES pre-filters the kNN
+candidates instead of the app over-fetching and post-filtering. Supported:
+
+    {
+        "brand": ["..."],                 # any of
+        "category": ["..."],              # any of, likewise for every level
+        "sub_category": ["..."],
+        "sub_sub_category": ["..."],
+        "sub_sub_sub_category": ["..."],
+        "min_price": 500, "max_price": 2000,   # on discounted_price
+        "in_stock": True                  # products not marked out of stock
+    }
+
+Facets are counted over the ranked candidates retrieved for the query
+(CACHE_DEPTH deep), so they describe the results rather than the whole
+catalog, cost no extra ES request, and are cached with the entry.
+"""
+import bisect
+from collections import Counter
+
+from config import config
+
+TERM_FILTER_FIELDS = ["brand", "category", "sub_category", "sub_sub_category", "sub_sub_sub_category"]
+PRICE_FIELD = "discounted_price"
+
+
+# ----------------- FILTERS -----------------
+def normalize_filters(filters):
+    """
+    Validates filters and puts them in canonical form (sorted, de-duplicated
+    values, no empty entries), so equal filter sets share one cache entry.
+
+    Returns:
+        dict | None: Canonical filters, or None if nothing is filtered.
+
+    Raises:
+        ValueError: On unknown filters or invalid values.
+    """
+    if not filters:
+        return None
+
+    unknown = set(filters) - set(TERM_FILTER_FIELDS) - {"min_price", "max_price", "in_stock"}
+    if unknown:
+        raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}")
+
+    normalized = {}
+    for field in TERM_FILTER_FIELDS:
+        values = filters.get(field)
+        if isinstance(values, str):
+            values = [values]
+        values = sorted({str(value) for value in values or [] if str(value).strip()})
+        if values:
+            normalized[field] = values
+
+    for bound in ("min_price", "max_price"):
+        if filters.get(bound) is not None:
+            try:
+                normalized[bound] = float(filters[bound])
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid {bound}: {filters[bound]!r}")
+
+    if normalized.get("min_price", 0) > normalized.get("max_price", float("inf")):
+        raise ValueError("min_price is greater than max_price")
+
+    if filters.get("in_stock"):
+        normalized["in_stock"] = True
+
+    return normalized or None
+
+
+def matches_filters(source, filters):
+    """
+    Evaluates filters on a document `_source` locally (e.g. over the browse
+    snapshot when ES is unavailable); same semantics as the ES clauses.
+    """
+    if not filters:
+        return True
+
+    for field in TERM_FILTER_FIELDS:
+        if field in filters and source.get(field) not in filters[field]:
+            return False
+
+    price = source.get(PRICE_FIELD)
+    if "min_price" in filters and (price is None or price < filters["min_price"]):
+        return False
+    if "max_price" in filters and (price is None or price > filters["max_price"]):
+        return False
+
+    if filters.get("in_stock") and source.get("in_stock") is False:
+        return False
+
+    return True
+
+
+# ----------------- FACETS -----------------
+def price_bucket(price):
+    bounds = config.PRICE_FACET_BOUNDS
+    i = bisect.bisect_right(bounds, price)
+    return (bounds[i - 1] if i > 0 else 0, bounds[i] if i < len(bounds) else None)
+
+
+def facet_counts(sources):
+    """
+    Counts facet values over retrieved documents.
+
+    Returns:
+        dict: field → [{"value", "count"}] (top FACET_SIZE, most frequent
+        first) for brand and every category level, and "price" →
+        [{"from", "to", "count"}] in ascending buckets (`to` None = open).
+    """
+    facets = {}
+    for field in TERM_FILTER_FIELDS:
+        counts = Counter(source.get(field) for source in sources if source.get(field))
+        facets[field] = [
+            {"value": value, "count": count}
+            for value, count in counts.most_common(config.FACET_SIZE)
+        ]
+
+    prices = Counter(
+        price_bucket(source[PRICE_FIELD]) for source in sources
+        if isinstance(source.get(PRICE_FIELD), (int, float))
+    )
+    facets["price"] = [
+        {"from": low, "to": high, "count": prices[(low, high)]}
+        for low, high in sorted(prices, key=lambda bucket: bucket[0])
+    ]
+
+    return facets
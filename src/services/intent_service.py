@@ -0,0 +1,145 @@
+"""
+Precomputed category-centroid intent model.
+
+For every node of the category hierarchy (category, sub_category,
+sub_sub_category, sub_sub_sub_category) the mean normalized product embedding
+is stored as a centroid. A query is scored against all centroids with one
+matrix product, and the best *existing* hierarchy path (as seen in the
+catalog) is chosen, so invalid level combinations can never be predicted.
+
+Built from the embedding export of `vector_index_service`:
+    python -m src.services.intent_service --index-dir data/vector_index
+"""
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+
+from config import config
+from src.services.vector_index_service import HIERARCHY_FIELDS, load_catalog_export
+
+INTENT_MODEL_FILE = "intent_model.npz"
+INTENT_NAMES_FILE = "intent_names.json"
+
+
+def build_intent_model(index_dir, out_dir=None, block_size=8192):
+    """
+    Computes per-node centroids and the set of valid hierarchy paths.
+
+    Writes `intent_model.npz` (centroids float16, paths int32) and
+    `intent_names.json` (node names per level) to `out_dir`.
+    """
+    out_dir = out_dir or index_dir
+    embeddings, catalog = load_catalog_export(index_dir)
+
+    # Node IDs are global across levels; -1 marks a missing level
+    level_names = []
+    node_ids = np.full((len(embeddings), len(HIERARCHY_FIELDS)), -1, dtype=np.int32)
+    next_node_id = 0
+
+    for level, field in enumerate(HIERARCHY_FIELDS):
+        # Category codes index the sorted names of their level → offset them into global node IDs
+        names = catalog.names[field]
+        codes = np.asarray(catalog.codes[:, level])
+        node_ids[:, level] = np.where(codes >= 0, codes + next_node_id, -1)
+        level_names.append(names)
+        next_node_id += len(names)
+
+    sums = np.zeros((next_node_id, embeddings.shape[1]), dtype=np.float32)
+    for start in range(0, len(embeddings), block_size):
+        block = np.asarray(embeddings[start:start + block_size], dtype=np.float32)
+        block_nodes = node_ids[start:start + block_size]
+
+        for level in range(len(HIERARCHY_FIELDS)):
+            present = block_nodes[:, level] >= 0
+            np.add.at(sums, block_nodes[present, level], block[present])
+
+    centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    paths = np.unique(node_ids, axis=0)
+
+    np.savez(
+        os.path.join(out_dir, INTENT_MODEL_FILE),
+        centroids=centroids.astype(np.float16),
+        paths=paths
+    )
+    with open(os.path.join(out_dir, INTENT_NAMES_FILE), "w") as f:
+        json.dump(level_names, f)
+
+    print(f"✅ Built intent model: {next_node_id} nodes, {len(paths)} valid paths")
+
+
+class IntentModel:
+    """
+    Scores a query vector against all hierarchy centroids and returns the
+    best valid path.
+
+    Args:
+        model_dir (str): Directory containing the files written by
+            `build_intent_model`.
+    """
+
+    def __init__(self, model_dir):
+        arrays = np.load(os.path.join(model_dir, INTENT_MODEL_FILE))
+
+        with open(os.path.join(model_dir, INTENT_NAMES_FILE)) as f:
+            level_names = json.load(f)
+
+        self.centroids = arrays["centroids"].astype(np.float32)
+        self.paths = arrays["paths"]
+        self.node_names = [name for names in level_names for name in names]
+
+        # Missing levels point at a sentinel node that always scores 0
+        self.path_nodes = np.where(self.paths >= 0, self.paths, len(self.node_names))
+        self.path_levels = np.maximum((self.paths >= 0).sum(axis=1), 1)
+
+    def predict(self, query_vector):
+        """
+        Returns:
+            tuple: (cat_pred, sub_cat_pred, sub_sub_cat_pred, sub_sub_sub_cat_pred),
+            "" for levels the chosen path does not have.
+        """
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        node_scores = np.append(self.centroids @ query, 0.0)
+        path_scores = node_scores[self.path_nodes].sum(axis=1) / self.path_levels
+
+        best_path = self.paths[int(np.argmax(path_scores))]
+        return tuple(
+            self.node_names[node] if node >= 0 else ""
+            for node in best_path
+        )
+
+
+intent_model = None
+intent_model_lock = threading.Lock()
+
+
+def get_intent_model():
+    """
+    Lazily loads the intent model from INTENT_MODEL_DIR; None if not built.
+    """
+    global intent_model
+
+    if intent_model is None and os.path.exists(os.path.join(config.INTENT_MODEL_DIR, INTENT_MODEL_FILE)):
+        with intent_model_lock:
+            if intent_model is None:
+                intent_model = IntentModel(config.INTENT_MODEL_DIR)
+
+    return intent_model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the category-centroid intent model.")
+    parser.add_argument("--index-dir", default=config.LOCAL_VECTOR_INDEX_DIR, help="Embedding export directory")
+    parser.add_argument("--out", default=config.INTENT_MODEL_DIR)
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    build_intent_model(args.index_dir, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,293 @@
-from src.services.caching_service.get_cache import get_cached_results
+from src.browse.browse_snapshot import browse_snapshots
+from src.services.caching_service.cache_keys import cache_type
+from src.services.caching_service.get_cache import assemble_page, get_cache_entry, get_cached_page, past_end
+from src.services.caching_service.l1_cache import get_l1_entry
+from src.services.caching_service.cache_generation import get_catalog_generation
+from src.services.caching_service.set_cache import extend_cached_results, set_provisional_entry
+from src.services.circuit_breaker_service import GuardedClient, is_failure
+from src.services.deadline_service import deadline, has_budget
 from src.services.elastic_query_service import search_query
-from src.services.queue_service import rerank_queue, rerank_in_progress, rerank_lock
-import queue as py_queue
+from src.services.embedding_service import encode_query
+from src.services.facet_service import facet_counts, matches_filters, normalize_filters
+from src.services.queue_service import enqueue_rerank
+from src.services.retrieval_service import vector_search, vector_search_async
+from src.services.intent_service import get_intent_model
+from src.services.local_reranking_service import rerank_hits
+from src.services.metrics_service import inc, span, traced
+from src.services.singleflight_service import SingleFlight
+from src.services.suggestion_service import record_query
 from config import config
 
+INTENT_FIELDS = ["category", "sub_category", "sub_sub_category", "sub_sub_sub_category"]
 
-def search_inventory(query, _from, size, model, INDEX_NAME, es, _type=config.search_type):
+# No category intent → plain kNN retrieval on the query vector
+NO_INTENT = ("", "", "", "")
+
+search_flights = SingleFlight("search")
+
+
+def most_frequent_val(values: list[str]) -> str:
+    """
+    Returns the most frequently occurring non-null string value in a list.
+
+    Args:
+        values (list[str]): List of candidate string values.
+
+    Returns:
+        str: Most frequent value, or empty string if none are valid.
+    """
+    valid_values = [v for v in values if isinstance(v, str)]
+    return max(set(valid_values), key=valid_values.count) if valid_values else ""
+
+
+def predict_intent_from_hits(intent_hits):
+    # Infer most likely category hierarchy using frequency consensus
+    return tuple(
+        most_frequent_val([x["_source"].get(field) for x in intent_hits])
+        for field in INTENT_FIELDS
+    )
+
+
+def centroid_intent_model():
+    return get_intent_model() if config.INTENT_BACKEND == "centroid" else None
+
+
+def build_search_context(normalized_query, intent_preds):
+    """
+    Rewrites the query with the predicted category hierarchy.
+
+    Args:
+        normalized_query (str): Normalized user query.
+        intent_preds (tuple): Predicted (category, sub_category,
+            sub_sub_category, sub_sub_sub_category).
+
+    Returns:
+        dict: `revised_query` plus the predicted hierarchy
+        (`cat_pred`, `sub_cat_pred`, `sub_sub_cat_pred`, `sub_sub_sub_cat_pred`).
+    """
+    cat_pred, sub_cat_pred, sub_sub_cat_pred, sub_sub_sub_cat_pred = intent_preds
+
+    # Rewrite query with inferred hierarchy (RAG-style augmentation)
+    revised_query = (
+        f"Item *{normalized_query}* is of category hierarchy "
+        f"{cat_pred} and {sub_cat_pred} and {sub_sub_cat_pred} and {sub_sub_sub_cat_pred}"
+    )
+
+    return {
+        "revised_query": revised_query,
+        "cat_pred": cat_pred,
+        "sub_cat_pred": sub_cat_pred,
+        "sub_sub_cat_pred": sub_sub_cat_pred,
+        "sub_sub_sub_cat_pred": sub_sub_sub_cat_pred,
+    }
+
+
+def has_intent(search_context):
+    return any(search_context[key] for key in ("cat_pred", "sub_cat_pred", "sub_sub_cat_pred", "sub_sub_sub_cat_pred"))
+
+
+def skip_stage(stage, reason):
+    inc("search_stages_skipped_total", stage=stage, reason=reason)
+
+
+def intent_probe_allowed():
+    # The kNN intent probe is an ES round trip → only with enough budget left
+    if has_budget(config.DEADLINE_INTENT_MIN_MS):
+        return True
+
+    skip_stage("intent", "budget")
+    return False
+
+
+def intent_probe_failed(e):
+    # ES trouble during the probe → carry on without intent, anything else is a bug
+    if not is_failure(e):
+        raise e
+
+    skip_stage("intent", "error")
+    return NO_INTENT
+
+
+def rewrite_allowed():
+    # Encoding the rewritten query is a second model call
+    if has_budget(config.DEADLINE_REWRITE_MIN_MS):
+        return True
+
+    skip_stage("encode_revised", "budget")
+    return False
+
+
+def centroid_search_context(normalized_query, query_vector):
+    """
+    Returns the search context inferred by the precomputed centroid intent
+    model (sub-millisecond, no ES call), or None when that backend is off.
+    """
+    intent_model = centroid_intent_model()
+    if intent_model is None:
+        return None
+
+    with span("intent", backend="centroid"):
+        intent_preds = intent_model.predict(query_vector)
+    return build_search_context(normalized_query, intent_preds)
+
+
+def infer_search_context(normalized_query, query_vector, INDEX_NAME, es):
+    """
+    Infers category intent and builds the search context.
+
+    Uses the precomputed centroid intent model when available (no ES call),
+    otherwise a kNN probe over the nearest products. The probe is optional:
+    it is skipped when less than DEADLINE_INTENT_MIN_MS of the budget is
+    left or when ES fails, and the search goes on without category intent.
+
+    Returns:
+        tuple: (search context, True if the probe was skipped).
+    """
+    search_context = centroid_search_context(normalized_query, query_vector)
+    if search_context:
+        return search_context, False
+
+    if not intent_probe_allowed():
+        return build_search_context(normalized_query, NO_INTENT), True
+
+    try:
+        with span("intent", backend="knn"):
+            search_intent_response = vector_search(es, INDEX_NAME, intent_query(query_vector))
+    except Exception as e:
+        return build_search_context(normalized_query, intent_probe_failed(e)), True
+
+    intent_preds = predict_intent_from_hits(search_intent_response["hits"]["hits"])
+    return build_search_context(normalized_query, intent_preds), False
+
+
+async def infer_search_context_async(normalized_query, query_vector, INDEX_NAME, es, executor=None):
+    """
+    Async variant of `infer_search_context` for an `AsyncElasticsearch`
+    client; local ANN scoring of the probe runs in `executor`.
+    """
+    search_context = centroid_search_context(normalized_query, query_vector)
+    if search_context:
+        return search_context, False
+
+    if not intent_probe_allowed():
+        return build_search_context(normalized_query, NO_INTENT), True
+
+    try:
+        with span("intent", backend="knn"):
+            search_intent_response = await vector_search_async(es, INDEX_NAME, intent_query(query_vector), executor)
+    except Exception as e:
+        return build_search_context(normalized_query, intent_probe_failed(e)), True
+
+    intent_preds = predict_intent_from_hits(search_intent_response["hits"]["hits"])
+    return build_search_context(normalized_query, intent_preds), False
+
+
+def degraded_results(normalized_query, _type, _from, size, INDEX_NAME, error, filters=None):
+    """
+    Serves a search without ES after it failed, timed out or was rejected
+    by the circuit breaker: the query's L1 entry (even if stale, hydrated
+    hits only), else the in-memory browse snapshot (filtered locally).
+
+    Raises:
+        The original error if neither has anything for this page.
+    """
+    entry = get_l1_entry(normalized_query, cache_type(_type, filters))
+    hits = assemble_page(entry, _from, size) if entry else []
+    fallback = "l1_cache"
+
+    if not hits and browse_snapshots.get(INDEX_NAME):
+        items = [item for item in browse_snapshots[INDEX_NAME]["items"] if matches_filters(item["_source"], filters)]
+        hits = items[_from:_from + size]
+        fallback = "browse_snapshot"
+
+    if not hits:
+        inc("search_degraded_total", type=_type, fallback="none", error=type(error).__name__)
+        raise error
+
+    inc("search_degraded_total", type=_type, fallback=fallback, error=type(error).__name__)
+    return hits
+
+
+def intent_query(query_vector):
+    # Nearest neighbours used only to infer category intent
+    return search_query(query_vector, 0, 5, INTENT_FIELDS)
+
+
+def hybrid_query(revised_query_vector, search_context, _from, size):
+    # Hybrid retrieval with semantic, lexical, and category signals.
+    # Retrieve a deep candidate list once so the cache can serve later pages.
+    return search_query(
+        revised_query_vector,
+        0,
+        max(config.CACHE_DEPTH, _from + size),
+        _source={"excludes": ["embedding"]},
+        cat_pred=search_context["cat_pred"],
+        sub_cat_pred=search_context["sub_cat_pred"],
+        sub_sub_cat_pred=search_context["sub_sub_cat_pred"],
+        sub_sub_sub_cat_pred=search_context["sub_sub_sub_cat_pred"],
+        filters=search_context.get("filters"),
+    )
+
+
+def complete_shortened_search(normalized_query, search_context, es, model=None, INDEX_NAME=config.INVENTORY_INDEX):
+    """
+    Re-runs the retrieval of a shortened search (intent probe or query
+    rewrite skipped under the request's deadline) with the full pipeline.
+    Called by the rerank worker, off the request path and without a
+    deadline, so the cached entry holds the complete pipeline's results.
+
+    Returns:
+        tuple: (candidate sources in retrieval order, search context).
+
+    Raises:
+        RuntimeError: If the intent probe fails again (the job is retried
+        or re-enqueued by the next search instead of caching a shortened run).
+    """
+    if model is None:
+        from src.services.startup_service import get_model
+        model = get_model()
+
+    previous_context = search_context or {}
+
+    query_vector = encode_query(model, normalized_query)
+    search_context, shortened = infer_search_context(normalized_query, query_vector, INDEX_NAME, es)
+    if shortened:
+        raise RuntimeError(f"Intent probe failed for '{normalized_query}'")
+
+    if previous_context.get("filters"):
+        search_context["filters"] = previous_context["filters"]
+
+    search_context["embedded_query"] = search_context["revised_query"] if has_intent(search_context) else normalized_query
+    revised_query_vector = encode_query(model, search_context["embedded_query"])
+
+    hits = vector_search(es, INDEX_NAME, hybrid_query(revised_query_vector, search_context, 0, config.CACHE_DEPTH))["hits"]["hits"]
+
+    if "facets" in previous_context:
+        search_context["facets"] = facet_counts([hit["_source"] for hit in hits])
+
+    # Same head order as a full request path run hands to the reranker
+    if config.INLINE_RERANKER == "local":
+        hits = rerank_hits(normalized_query, hits, search_context)
+
+    return [hit["_source"] for hit in hits], search_context
+
+
+def search_inventory(query, _from, size, model, INDEX_NAME, es, _type=config.search_type, filters=None):
+    """
+    Runs `search_inventory_faceted` and returns the hits only.
+    """
+    return search_inventory_faceted(query, _from, size, model, INDEX_NAME, es, _type, filters)[0]
+
+
+@traced("search_inventory")
+def search_inventory_faceted(query, _from, size, model, INDEX_NAME, es, _type=config.search_type, filters=None):
     """
     Orchestrates the end-to-end AI-powered search flow for the inventory.
 
     This function performs hybrid semantic retrieval using Elasticsearch by:
     1. Normalizing and cache-checking the incoming query
     2. Generating semantic embeddings for the query
-    3. Inferring category intent via nearest-neighbor retrieval
+    3. Inferring category intent (centroid model or nearest-neighbor retrieval)
     4. Rewriting the query in a RAG-style manner using inferred hierarchy
     5. Executing a hybrid vector + keyword search
     6. Triggering asynchronous re-ranking without impacting user latency
@@ -21,6 +296,20 @@ def search_inventory(query, _from, size, model, INDEX_NAME, es, _type=config.sea
     asynchronously to allow relevance to improve over time while keeping
     search latency predictable.
 
+    Cache hits are served page by page from a deep ranked ID list; a page
+    beyond the cached depth extends that list instead of re-searching.
+    Concurrent identical requests (same normalized query, type and page)
+    share a single run of this pipeline.
+
+    The request runs under a SEARCH_DEADLINE_MS budget: optional stages are
+    skipped when it runs low, ES calls go through the circuit breaker with
+    timeouts bounded by it, and when ES fails the results come from local
+    state instead (see `degraded_results`).
+
+    Filters (see `facet_service`) pre-filter retrieval inside ES; each
+    filter set is cached separately. Facet counts of the retrieved
+    candidates are computed for searches and stored with the cache entry.
+
     Args:
         query (str): Raw user search query.
         _from (int): Pagination offset.
@@ -29,93 +318,119 @@ def search_inventory(query, _from, size, model, INDEX_NAME, es, _type=config.sea
         INDEX_NAME (str): Elasticsearch index name.
         es: Elasticsearch client instance.
         _type (str): Search type identifier used for caching and reranking.
+        filters (dict): Optional brand / category / price / stock filters.
 
     Returns:
-        list: Top `size` search results ordered by relevance.
+        tuple: (top `size` search results ordered by relevance, facet counts
+        or None when unavailable, e.g. for entries cached before facets).
+
+    Raises:
+        ValueError: If `filters` are invalid.
     """
 
-    # Normalize query for cache consistency and embedding stability
+    # Normalize query and filters for cache consistency and embedding stability
     normalized_query = query.strip().lower()
+    filters = normalize_filters(filters)
+
+    # First pages only: one count per search for the typeahead ranking
+    if _type == config.search_type and _from == 0:
+        record_query(normalized_query)
+
+    with deadline(config.SEARCH_DEADLINE_MS):
+        try:
+            # ⚡ Identical in-flight requests wait for the same result instead of re-running the pipeline
+            return search_flights.do(
+                (INDEX_NAME, normalized_query, cache_type(_type, filters), _from, size),
+                run_search_inventory, normalized_query, _from, size, model, INDEX_NAME, es, _type, filters
+            )
+        except Exception as e:
+            if not is_failure(e):
+                raise
+            return degraded_results(normalized_query, _type, _from, size, INDEX_NAME, e, filters), None
+
+
+def run_search_inventory(normalized_query, _from, size, model, INDEX_NAME, es, _type, filters=None):
+
+    # Request-path ES calls: circuit breaker + timeouts bounded by the deadline
+    request_es = GuardedClient(es)
+
+    # Each filter set has its own cache entry (and rerank job)
+    scope = cache_type(_type, filters)
 
     # Attempt cache lookup to avoid redundant vector computation and ES calls
-    cached_response = get_cached_results(normalized_query, _type, es)
-    if (
-        isinstance(cached_response, dict)
-        and "hits" in cached_response
-        and "hits" in cached_response["hits"]
-        and cached_response["hits"]["hits"]
-    ):
-        return cached_response["hits"]["hits"]
-
-    # Generate embedding for the normalized query
-    query_vector = model.encode(normalized_query).tolist()
-
-    # Retrieve nearest neighbors to infer category intent
-    search_intent_body = search_query(
-        query_vector,
-        0,
-        5,
-        ["category", "sub_category", "sub_sub_category", "sub_sub_sub_category"],
-    )
-    search_intent_response = es.search(index=INDEX_NAME, body=search_intent_body)
-    intent_hits = search_intent_response["hits"]["hits"]
+    with span("cache_lookup"):
+        cache_entry = get_cache_entry(normalized_query, scope, request_es)
 
-    # Extract hierarchical category signals from retrieved neighbors
-    all_cats = [x["_source"].get("category") for x in intent_hits]
-    all_sub_cats = [x["_source"].get("sub_category") for x in intent_hits]
-    all_sub_sub_cats = [x["_source"].get("sub_sub_category") for x in intent_hits]
-    all_sub_sub_sub_cats = [x["_source"].get("sub_sub_sub_category") for x in intent_hits]
+    if cache_entry and _from + size > cache_entry["depth"]:
+        # Deeper page than cached → controlled extension of the ranked list,
+        # under its own budget: up to CACHE_MAX_DEPTH deep does not fit in the search's.
+        # None if the cache document is gone → fresh search
+        with span("cache_extend"), deadline(config.CACHE_EXTEND_DEADLINE_MS, override=True):
+            cache_entry = extend_cached_results(
+                normalized_query, scope, cache_entry, _from + size, model, INDEX_NAME, request_es
+            )
 
-    def most_frequent_val(values: list[str]) -> str:
-        """
-        Returns the most frequently occurring non-null string value in a list.
+    if cache_entry:
+        with span("cache_page"):
+            cached_hits = get_cached_page(cache_entry, _from, size, request_es)
 
-        Args:
-            values (list[str]): List of candidate string values.
+        # Past the end of an exhausted entry → an empty page, not a re-search
+        if cached_hits or past_end(cache_entry, _from):
+            inc("search_cache_requests_total", type=_type, result="hit")
+            return cached_hits, (cache_entry.get("search_context") or {}).get("facets")
 
-        Returns:
-            str: Most frequent value, or empty string if none are valid.
-        """
-        valid_values = [v for v in values if isinstance(v, str)]
-        return max(set(valid_values), key=valid_values.count) if valid_values else ""
+    inc("search_cache_requests_total", type=_type, result="miss")
 
-    # Infer most likely category hierarchy using frequency consensus
-    cat_pred = most_frequent_val(all_cats)
-    sub_cat_pred = most_frequent_val(all_sub_cats)
-    sub_sub_cat_pred = most_frequent_val(all_sub_sub_cats)
-    sub_sub_sub_cat_pred = most_frequent_val(all_sub_sub_sub_cats)
+    # Generate (or reuse cached) embedding for the normalized query
+    with span("encode_query"):
+        query_vector = encode_query(model, normalized_query)
 
-    # Rewrite query with inferred hierarchy (RAG-style augmentation)
-    revised_query = (
-        f"Item *{normalized_query}* is of category hierarchy "
-        f"{cat_pred} and {sub_cat_pred} and {sub_sub_cat_pred} and {sub_sub_sub_cat_pred}"
-    )
-    revised_query_vector = model.encode(revised_query).tolist()
+    # Infer category intent and rewrite the query (optional stages, budget permitting)
+    search_context, shortened = infer_search_context(normalized_query, query_vector, INDEX_NAME, request_es)
+    if filters:
+        search_context["filters"] = filters
+
+    if has_intent(search_context) and rewrite_allowed():
+        with span("encode_revised"):
+            revised_query_vector = encode_query(model, search_context["revised_query"])
+        search_context["embedded_query"] = search_context["revised_query"]
+    else:
+        # kNN on the plain query vector (with category boosts if intent is known)
+        revised_query_vector = query_vector
+        search_context["embedded_query"] = normalized_query
+        shortened = shortened or has_intent(search_context)
 
     # Perform hybrid retrieval with semantic, lexical, and category signals
-    body = search_query(
-        revised_query_vector,
-        _from,
-        size + 30,
-        _source={"excludes": ["embedding"]},
-        cat_pred=cat_pred,
-        sub_cat_pred=sub_cat_pred,
-        sub_sub_cat_pred=sub_sub_cat_pred,
-        sub_sub_sub_cat_pred=sub_sub_sub_cat_pred,
+    body = hybrid_query(revised_query_vector, search_context, _from, size)
+    with span("hybrid_search"):
+        response = vector_search(request_es, INDEX_NAME, body)
+    hits = response["hits"]["hits"]
+
+    # Facets of the whole candidate list, cached with the entry
+    facets = None
+    if _type == config.search_type:
+        with span("facets"):
+            facets = search_context["facets"] = facet_counts([hit["_source"] for hit in hits])
+
+    # ⚡ Inline local rerank: even first-time queries get a reranked order
+    if config.INLINE_RERANKER == "local":
+        with span("inline_rerank"):
+            hits = rerank_hits(normalized_query, hits, search_context)
+
+    # Trigger asynchronous re-ranking (fire-and-forget). The worker re-runs
+    # a shortened pipeline in full before caching it
+    if shortened:
+        search_context["shortened"] = True
+
+    # ⚡ Until the worker caches the reranked entry, next pages slice these candidates
+    set_provisional_entry(
+        normalized_query, scope, hits, len(hits) < body["size"], search_context,
+        get_catalog_generation(request_es)["generation"]
     )
-    response = es.search(index=INDEX_NAME, body=body)
-
-    # Trigger asynchronous re-ranking (fire-and-forget)
-    result_for_reranking = [item["_source"] for item in response["hits"]["hits"]]
-    with rerank_lock:
-        key = (normalized_query, _type)
-        if key not in rerank_in_progress:
-            rerank_in_progress.add(key)
-            try:
-                rerank_queue.put_nowait((normalized_query, result_for_reranking, _type, es))
-            except py_queue.Full:
-                # Roll back state if enqueue fails
-                rerank_in_progress.discard(key)
-
-    # Return top-N results immediately without waiting for re-ranking
-    return response["hits"]["hits"][:size]
+
+    result_for_reranking = [item["_source"] for item in hits]
+    with span("enqueue_rerank"):
+        enqueue_rerank(normalized_query, result_for_reranking, scope, es, search_context)
+
+    # Return the requested page immediately without waiting for re-ranking
+    return hits[_from:_from + size], facets
@@ -1,28 +1,52 @@
-from openai import OpenAI
-from src.services.ai_prompt_service import prompt_for_reranking
-import json
+import threading
 
-# The client automatically picks up the OPENAI_API_KEY environment variable if not specified as client = OpenAI(api_key="your_api_key_here")
-client = OpenAI()
+from src.services.ai_prompt_service import (
+    complete_ranking,
+    parse_batch_ranking_reply,
+    parse_ranking_reply,
+    prompt_for_batch_reranking,
+    prompt_for_reranking,
+)
+from src.services.local_reranking_service import rerank_locally
+from src.services.metrics_service import inc, span
 
-def rerank_elasticsearch_results(original_query, data_to_rerank):
+client = None
+client_lock = threading.Lock()
 
-    parent_ids = [item['product_id'] for item in data_to_rerank]
+SYSTEM_PROMPT = """
+                You are an expert search result ranker.
+                Given the original user query and a list of search results, your task is to rank the results based on their relevance to the query.
+                The most relevant results should be ranked highest followed by less relevant ones.
+                """
+
+
+def get_client():
+    """
+    Returns the OpenAI client, created on first use so that importing this
+    module neither loads the SDK nor needs OPENAI_API_KEY.
+    """
+    global client
+
+    if client is None:
+        with client_lock:
+            if client is None:
+                from openai import OpenAI
+
+                # The client automatically picks up the OPENAI_API_KEY environment variable if not specified as client = OpenAI(api_key="your_api_key_here")
+                client = OpenAI()
+
+    return client
 
-    try:
 
-        prompt = prompt_for_reranking(original_query, data_to_rerank)
+def complete(prompt):
 
-        response = client.chat.completions.create(
+    with span("llm_call"):
+        response = get_client().chat.completions.create(
             model="gpt-5-mini",
             messages=[
                 {
                     "role": "system",
-                    "content": """
-                            You are an expert search result ranker.
-                            Given the original user query and a list of search results, your task is to rank the results based on their relevance to the query.
-                            The most relevant results should be ranked highest followed by less relevant ones.
-                            """
+                    "content": SYSTEM_PROMPT
                 },
                 {
                     "role": "user",
@@ -31,12 +55,70 @@ def rerank_elasticsearch_results(original_query, data_to_rerank):
             ]
         )
 
-        reranked_ids_str = response.choices[0].message.content.strip()
-        reranked_ids = json.loads(reranked_ids_str)
-    
+    return response.choices[0].message.content.strip()
+
+
+def rerank_elasticsearch_results(original_query, data_to_rerank, before_llm_call=None):
+    """
+    Reranks one query's results with an LLM call, falling back to the local
+    reranker on failure. `before_llm_call` (e.g. a rate limiter) runs right
+    before the call.
+    """
+
+    parent_ids = [item['product_id'] for item in data_to_rerank]
+
+    try:
+
+        prompt, prompt_ids = prompt_for_reranking(original_query, data_to_rerank)
+
+        if before_llm_call:
+            before_llm_call()
+        reranked_ids = complete_ranking(parse_ranking_reply(complete(prompt), prompt_ids), data_to_rerank)
+
     except Exception as e:
 
+        # Fall back to the local reranker instead of the raw retrieval order
         print(f"Error during reranking: {e}")
-        reranked_ids = parent_ids
+        inc("errors_total", where="llm_rerank", error=type(e).__name__)
+        reranked_ids = rerank_locally(original_query, data_to_rerank) if data_to_rerank else parent_ids
+
+    return reranked_ids
+
+
+def rerank_elasticsearch_results_batch(queries_to_rerank, before_llm_call=None):
+    """
+    Reranks several (query, results) pairs with a single LLM call.
+
+    Queries whose ranking is missing from (or unusable in) the batched reply
+    are retried individually; a failed call retries every query.
+    `before_llm_call` runs before every LLM call, retries included, so a
+    rate limiter sees each of them.
+
+    Returns:
+        list[list]: Reranked product IDs, one list per input pair.
+    """
+
+    if len(queries_to_rerank) == 1:
+        return [rerank_elasticsearch_results(*queries_to_rerank[0], before_llm_call)]
+
+    try:
+
+        prompt, prompt_ids_per_query = prompt_for_batch_reranking(queries_to_rerank)
+
+        if before_llm_call:
+            before_llm_call()
+        rankings = parse_batch_ranking_reply(complete(prompt), prompt_ids_per_query)
+        return [
+            complete_ranking(ranking, data_to_rerank) if ranking is not None
+            else rerank_elasticsearch_results(original_query, data_to_rerank, before_llm_call)
+            for ranking, (original_query, data_to_rerank) in zip(rankings, queries_to_rerank)
+        ]
+
+    except Exception as e:
 
-    return reranked_ids
\ No newline at end of file
+        print(f"Error during batched reranking, retrying per query: {e}")
+        inc("errors_total", where="llm_batch_rerank", error=type(e).__name__)
+        return [
+            rerank_elasticsearch_results(original_query, data_to_rerank, before_llm_call)
+            for original_query, data_to_rerank in queries_to_rerank
+        ]
@@ -0,0 +1,283 @@
+"""
+Fast local CPU reranker.
+
+Scores candidates with a linear model over a few vectorized features, with no
+network call, so it can run inline on the request path in milliseconds:
+- query / product-name token overlap
+- agreement with the inferred category hierarchy
+- brand mentioned in the query
+- brand grouping (share of candidates with the same brand)
+- retrieval score (embedding + hybrid ES score, or rank when unavailable)
+
+The retrieval score stands in for query / product embedding similarity:
+hits carry no product vectors (`embedding` is excluded from `_source`), and
+the kNN part of the ES score is that cosine similarity.
+
+Weights can be learned from the LLM orderings stored in the cache index
+(entries written with `reranker: "llm"`, LLM-ordered prefix only):
+    python -m src.services.local_reranking_service learn
+"""
+import argparse
+import json
+import os
+import re
+
+import numpy as np
+
+from config import config
+
+FEATURES = ["token_overlap", "hierarchy_agreement", "brand_in_query", "brand_share", "retrieval_score"]
+
+DEFAULT_WEIGHTS = {
+    "token_overlap": 1.0,
+    "hierarchy_agreement": 0.8,
+    "brand_in_query": 0.6,
+    "brand_share": 0.2,
+    "retrieval_score": 1.0
+}
+
+HIERARCHY_LEVELS = [
+    ("category", "cat_pred", 1.0),
+    ("sub_category", "sub_cat_pred", 2.0),
+    ("sub_sub_category", "sub_sub_cat_pred", 3.0),
+    ("sub_sub_sub_category", "sub_sub_sub_cat_pred", 4.0)
+]
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+reranker_weights = None
+
+
+def tokenize(text):
+    return set(TOKEN_PATTERN.findall((text or "").lower()))
+
+
+def load_weights():
+    global reranker_weights
+
+    if reranker_weights is None:
+        weights = dict(DEFAULT_WEIGHTS)
+        if os.path.exists(config.LOCAL_RERANKER_WEIGHTS):
+            with open(config.LOCAL_RERANKER_WEIGHTS) as f:
+                weights.update(json.load(f).get("weights", {}))
+
+        reranker_weights = np.array([weights[name] for name in FEATURES], dtype=np.float32)
+
+    return reranker_weights
+
+
+def candidate_features(original_query, data_to_rerank, search_context=None, retrieval_scores=None):
+    """
+    Builds the (n_candidates × n_features) feature matrix.
+    """
+    n = len(data_to_rerank)
+    query_tokens = tokenize(original_query)
+    search_context = search_context or {}
+
+    features = np.zeros((n, len(FEATURES)), dtype=np.float32)
+    if n == 0:
+        return features
+
+    name_tokens = [tokenize(item.get("name")) for item in data_to_rerank]
+    if query_tokens:
+        features[:, 0] = [len(query_tokens & tokens) / len(query_tokens) for tokens in name_tokens]
+
+    total_level_weight = sum(weight for _, pred_key, weight in HIERARCHY_LEVELS if search_context.get(pred_key))
+    if total_level_weight:
+        for field, pred_key, weight in HIERARCHY_LEVELS:
+            pred = search_context.get(pred_key)
+            if pred:
+                features[:, 1] += weight * np.array([item.get(field) == pred for item in data_to_rerank])
+        features[:, 1] /= total_level_weight
+
+    brands = [(item.get("brand") or "").lower() for item in data_to_rerank]
+    features[:, 2] = [bool(brand) and tokenize(brand) <= query_tokens for brand in brands]
+
+    _, brand_index = np.unique(brands, return_inverse=True)
+    brand_counts = np.bincount(brand_index)
+    features[:, 3] = np.where(np.array(brands) != "", brand_counts[brand_index] / n, 0.0)
+
+    if retrieval_scores is not None and len(retrieval_scores) == n:
+        scores = np.asarray(retrieval_scores, dtype=np.float32)
+        spread = scores.max() - scores.min()
+        features[:, 4] = (scores - scores.min()) / spread if spread > 0 else 1.0
+    else:
+        features[:, 4] = 1.0 - np.arange(n, dtype=np.float32) / n
+
+    return features
+
+
+def rerank_locally(original_query, data_to_rerank, search_context=None, retrieval_scores=None):
+    """
+    Reranks candidates with the local linear model.
+
+    Ties keep retrieval order.
+
+    Returns:
+        list: Product IDs in reranked order.
+    """
+    features = candidate_features(original_query, data_to_rerank, search_context, retrieval_scores)
+    scores = features @ load_weights()
+
+    order = np.argsort(-scores, kind="stable")
+    return [data_to_rerank[i]["product_id"] for i in order]
+
+
+def rerank_hits(original_query, hits, search_context=None, window=None):
+    """
+    Reorders the head (`window` items) of ES hits locally; the tail keeps
+    retrieval order.
+    """
+    window = window or config.RERANK_WINDOW
+    head, tail = hits[:window], hits[window:]
+
+    reranked_ids = rerank_locally(
+        original_query,
+        [hit["_source"] for hit in head],
+        search_context,
+        [hit.get("_score") or 0.0 for hit in head] if all(hit.get("_score") is not None for hit in head) else None
+    )
+
+    hit_map = {hit["_source"]["product_id"]: hit for hit in head}
+    return [hit_map[pid] for pid in reranked_ids] + tail
+
+
+# ----------------- LEARNING -----------------
+def pairwise_training_data(original_query, ranked_items, search_context, max_pairs=200, rng=None):
+    """
+    Feature differences for (better, worse) pairs taken from an LLM ordering.
+    """
+    rng = rng or np.random.default_rng(0)
+    n = len(ranked_items)
+
+    # Constant retrieval feature: the LLM order must not leak in as a rank prior
+    features = candidate_features(original_query, ranked_items, search_context, [0.0] * n)
+
+    if n < 2:
+        return np.empty((0, len(FEATURES)), dtype=np.float32)
+
+    i = rng.integers(0, n, size=max_pairs)
+    j = rng.integers(0, n, size=max_pairs)
+    keep = i != j
+    i, j = i[keep], j[keep]
+
+    better, worse = np.minimum(i, j), np.maximum(i, j)
+    return features[better] - features[worse]
+
+
+def fit_pairwise_weights(differences, iterations=500, learning_rate=0.5, l2=1e-3):
+    """
+    Pairwise logistic regression (RankNet-style) by gradient descent.
+    """
+    weights = np.array([DEFAULT_WEIGHTS[name] for name in FEATURES], dtype=np.float64)
+    trainable = np.array([name != "retrieval_score" for name in FEATURES])
+
+    for _ in range(iterations):
+        margin = differences @ weights
+        gradient = -(differences * (1.0 / (1.0 + np.exp(margin)))[:, None]).mean(axis=0) + l2 * weights
+        weights[trainable] -= learning_rate * gradient[trainable]
+
+    return weights
+
+
+def llm_orderings(es, max_queries):
+    """
+    Yields (cache entry source, LLM-ordered product IDs) for up to
+    `max_queries` entries reranked by the LLM. Entries written by the local
+    reranker (or an LLM fallback to it) are skipped, and so are the IDs the
+    LLM did not order itself, so the model never learns from its own output.
+    """
+    from elasticsearch import helpers
+
+    used = 0
+    for doc in helpers.scan(
+        es,
+        index=config.CACHE_INDEX,
+        query={"query": {"match_all": {}}, "_source": ["user_query", "search_context", "cached_product_ids", "reranker", "llm_ranked"]}
+    ):
+        source = doc["_source"]
+        if source.get("reranker") != "llm":
+            continue
+
+        ranked_ids = (source.get("cached_product_ids") or [])[:min(config.RERANK_WINDOW, source.get("llm_ranked") or 0)]
+        if len(ranked_ids) < 2:
+            continue
+
+        yield source, ranked_ids
+
+        used += 1
+        if used >= max_queries:
+            return
+
+
+def learn_reranker_weights(es, max_queries=5000, out_path=None, batch_size=50):
+    """
+    Learns feature weights from the LLM orderings in the cache index.
+
+    Products are hydrated with one mget per `batch_size` entries. The
+    original retrieval order is not stored, so `retrieval_score` keeps its
+    default weight.
+    """
+    from src.services.elastic_query_service import get_items_by_id_query
+
+    out_path = out_path or config.LOCAL_RERANKER_WEIGHTS
+    rng = np.random.default_rng(0)
+    all_differences = []
+    used = 0
+
+    def learn_from(batch):
+        ids = list(dict.fromkeys(pid for _, ranked_ids in batch for pid in ranked_ids))
+        docs = es.mget(index=config.INVENTORY_INDEX, body=get_items_by_id_query(ids))["docs"]
+        found = {d["_id"]: d["_source"] for d in docs if d.get("found")}
+
+        for source, ranked_ids in batch:
+            ranked_items = [found[pid] for pid in ranked_ids if pid in found]
+            all_differences.append(pairwise_training_data(
+                source.get("user_query", ""), ranked_items, source.get("search_context"), rng=rng
+            ))
+
+    batch = []
+    for source, ranked_ids in llm_orderings(es, max_queries):
+        batch.append((source, ranked_ids))
+        used += 1
+        if len(batch) >= batch_size:
+            learn_from(batch)
+            batch = []
+
+    if batch:
+        learn_from(batch)
+
+    if not all_differences:
+        print("⚠️ No cached LLM orderings to learn from")
+        return None
+
+    weights = fit_pairwise_weights(np.concatenate(all_differences))
+    learned = {name: round(float(w), 4) for name, w in zip(FEATURES, weights)}
+
+    if os.path.dirname(out_path):
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, "w") as f:
+        json.dump({"weights": learned, "trained_on_queries": used}, f, indent=2)
+
+    global reranker_weights
+    reranker_weights = None
+
+    print(f"✅ Learned reranker weights from {used} queries: {learned}")
+    return learned
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local reranker utilities.")
+    parser.add_argument("command", choices=["learn"])
+    parser.add_argument("--max-queries", type=int, default=5000)
+    parser.add_argument("--out", default=config.LOCAL_RERANKER_WEIGHTS)
+    args = parser.parse_args()
+
+    from src.services.startup_service import create_es_client
+
+    es = create_es_client()
+    learn_reranker_weights(es, args.max_queries, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+Lightweight in-process instrumentation: timing spans, counters and
+histograms, exported in Prometheus text format, plus an optional
+per-request trace log (one JSON line per request with its stage timings).
+
+Usage:
+    @traced("search_inventory")
+    def search_inventory(...):
+        with span("encode_query"):
+            ...
+        inc("search_cache_requests_total", result="hit")
+
+With METRICS_ENABLED off and no TRACE_LOG, `span` returns a shared no-op
+context manager and `inc` / `observe` return immediately.
+"""
+import asyncio
+import bisect
+import contextvars
+import functools
+import json
+import threading
+import time
+from contextlib import nullcontext
+
+from config import config
+
+# Latency buckets (seconds) and size buckets (items)
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+NOOP = nullcontext()
+
+metrics_lock = threading.Lock()
+counters = {}
+histograms = {}
+collectors = []
+
+# Trace of the request being served (per thread / asyncio task)
+current_trace = contextvars.ContextVar("current_trace", default=None)
+trace_log_lock = threading.Lock()
+trace_log_file = None
+
+
+def label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """
+    Increments a counter.
+    """
+    if not config.METRICS_ENABLED:
+        return
+
+    key = (name, label_key(labels))
+    with metrics_lock:
+        counters[key] = counters.get(key, 0) + value
+
+
+def observe(name, value, buckets=TIME_BUCKETS, **labels):
+    """
+    Records one observation in a histogram (buckets are fixed by the first call).
+    """
+    if not config.METRICS_ENABLED:
+        return
+
+    key = (name, label_key(labels))
+    with metrics_lock:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = {"buckets": buckets, "counts": [0] * (len(buckets) + 1), "sum": 0.0, "count": 0}
+
+        histogram["counts"][bisect.bisect_left(histogram["buckets"], value)] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def register_collector(collector):
+    """
+    Registers a callable evaluated at scrape time. It returns an iterable of
+    (name, type, labels, value) samples, e.g. queue depth or cache sizes.
+    """
+    collectors.append(collector)
+
+
+def cache_samples(name, cache):
+    """
+    Samples of a `LocalCache` (size, hits, misses, hit ratio).
+    """
+    stats = cache.stats()
+    labels = {"cache": name}
+    return [
+        ("local_cache_entries", "gauge", labels, stats["size"]),
+        ("local_cache_hits_total", "counter", labels, stats["hits"]),
+        ("local_cache_misses_total", "counter", labels, stats["misses"]),
+        ("local_cache_hit_ratio", "gauge", labels, stats["hit_ratio"])
+    ]
+
+
+class Span:
+    """
+    Times a stage into `stage_duration_seconds{stage=...}`, counts failures
+    in `stage_errors_total` and appends the timing to the active trace.
+    """
+    __slots__ = ("stage", "labels", "trace", "start")
+
+    def __init__(self, stage, trace, labels):
+        self.stage = stage
+        self.labels = labels
+        self.trace = trace
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+
+        observe("stage_duration_seconds", elapsed, stage=self.stage, **self.labels)
+        if exc_type is not None:
+            inc("stage_errors_total", stage=self.stage, error=exc_type.__name__)
+
+        if self.trace is not None:
+            record = {"stage": self.stage, "ms": round(elapsed * 1000, 3), **self.labels}
+            if exc_type is not None:
+                record["error"] = exc_type.__name__
+            self.trace["spans"].append(record)
+
+        return False
+
+
+def span(stage, **labels):
+    trace = current_trace.get()
+    if trace is None and not config.METRICS_ENABLED:
+        return NOOP
+
+    return Span(stage, trace, labels)
+
+
+class RequestTrace:
+    """
+    Times a whole request into `request_duration_seconds{request=...}` and,
+    with TRACE_LOG set, collects its spans and writes them as one JSON line.
+    Nested requests (e.g. a PDP falling back to search) join the outer trace.
+    """
+    __slots__ = ("name", "attributes", "trace", "token", "start")
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.trace = None
+        self.token = None
+
+    def __enter__(self):
+        if current_trace.get() is None and config.TRACE_LOG:
+            self.trace = {"request": self.name, **self.attributes, "spans": []}
+            self.token = current_trace.set(self.trace)
+
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+
+        observe("request_duration_seconds", elapsed, request=self.name)
+        inc("requests_total", request=self.name, outcome="error" if exc_type else "ok")
+
+        if self.token is not None:
+            current_trace.reset(self.token)
+            self.trace["ts"] = time.time()
+            self.trace["total_ms"] = round(elapsed * 1000, 3)
+            if exc_type is not None:
+                self.trace["error"] = exc_type.__name__
+            write_trace(self.trace)
+
+        return False
+
+
+def request_trace(name, **attributes):
+    if not config.METRICS_ENABLED and not config.TRACE_LOG:
+        return NOOP
+
+    return RequestTrace(name, attributes)
+
+
+def traced(name):
+    """
+    Decorator running a (sync or async) function inside `request_trace(name)`.
+    """
+    def decorator(function):
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with request_trace(name):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with request_trace(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def write_trace(trace):
+    global trace_log_file
+
+    try:
+        line = json.dumps(trace, default=str)
+        with trace_log_lock:
+            if trace_log_file is None:
+                trace_log_file = open(config.TRACE_LOG, "a", buffering=1)
+            trace_log_file.write(line + "\n")
+    except Exception as e:
+        print("Trace log write failed: ", e)
+
+
+# ----------------- EXPOSITION -----------------
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(str(value))}"' for name, value in labels) + "}"
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    """
+    Renders every metric in the Prometheus text exposition format (0.0.4).
+    """
+    with metrics_lock:
+        counter_samples = sorted(counters.items())
+        histogram_samples = sorted(
+            (key, {**histogram, "counts": list(histogram["counts"])})
+            for key, histogram in histograms.items()
+        )
+
+    gauge_samples = []
+    for collector in collectors:
+        try:
+            gauge_samples.extend(collector())
+        except Exception as e:
+            print("Metrics collector failed: ", e)
+
+    lines = []
+    typed = set()
+
+    def type_line(name, metric_type):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {metric_type}")
+
+    for (name, labels), value in counter_samples:
+        type_line(name, "counter")
+        lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+
+    for (name, labels), histogram in histogram_samples:
+        type_line(name, "histogram")
+
+        cumulative = 0
+        for bound, count in zip(histogram["buckets"], histogram["counts"]):
+            cumulative += count
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', format_value(bound)),))} {cumulative}")
+        lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+        lines.append(f"{name}_sum{format_labels(labels)} {format_value(histogram['sum'])}")
+        lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+
+    for name, metric_type, labels, value in sorted(gauge_samples, key=lambda sample: sample[0]):
+        if value is None:
+            continue
+        type_line(name, metric_type)
+        lines.append(f"{name}{format_labels(label_key(labels))} {format_value(value)}")
+
+    return "\n".join(lines) + "\n"
+
+
+def reset_metrics():
+    with metrics_lock:
+        counters.clear()
+        histograms.clear()
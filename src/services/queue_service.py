@@ -1,45 +1,413 @@
+import os
 import queue
+import socket
 import threading
-from src.services.caching_service.set_cache import set_cached_results
+import time
+from collections import deque
+
+from src.services import durable_queue_service
+from src.services.caching_service.cache_keys import base_type
+from src.services.caching_service.set_cache import rerank_head, set_cached_results
+from src.services.llm_reranking_services import rerank_elasticsearch_results_batch
+from src.services.metrics_service import SIZE_BUCKETS, inc, observe, register_collector, span
+from src.services.reranking_service import get_reranker
+from config import config
 
 # Single global queue
-rerank_queue = queue.Queue(maxsize=1000)
+rerank_queue = queue.Queue(maxsize=config.RERANK_QUEUE_SIZE)
 
 # 🔒 Tracks (query, _type) currently being reranked
 rerank_in_progress: set[tuple[str, str]] = set()
 rerank_lock = threading.Lock()
 
+# Sync ES client used by the worker when a job carries none (e.g. async search path)
+worker_es = None
+# Embedding model for re-running shortened searches (None → the process's shared model)
+worker_model = None
+rerank_workers: list[threading.Thread] = []
+rerank_workers_lock = threading.Lock()
+
+# Queue metrics (guarded by metrics_lock)
+metrics_lock = threading.Lock()
+rerank_counters = {
+    "enqueued": 0,
+    "deduplicated": 0,
+    "shed": 0,
+    "dropped": 0,
+    "completed": 0,
+    "failed": 0,
+    "llm_calls": 0
+}
+completion_times = deque(maxlen=10000)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting LLM calls across all workers.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum burst size.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Blocks until `tokens` are available, then takes them.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+
+                wait = (tokens - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+llm_rate_limiter = TokenBucket(
+    rate=config.RERANK_LLM_CALLS_PER_SEC,
+    capacity=config.RERANK_LLM_BURST
+)
+
+
+def acquire_llm_call():
+    # Every LLM call of the worker (batch call and per-query retries) takes a token
+    with span("rerank_rate_limit_wait"):
+        llm_rate_limiter.acquire()
+    count("llm_calls")
+
+
+def count(name, value=1):
+    with metrics_lock:
+        rerank_counters[name] += value
+
+
+def use_durable_queue():
+    return config.RERANK_QUEUE_BACKEND == "sqlite"
+
+
+def enqueue_rerank(query, results, _type, es=None, search_context=None):
+    """
+    Enqueues (query, _type) for background reranking unless it is already queued.
+
+    With RERANK_QUEUE_BACKEND = "sqlite" the job goes to the durable queue,
+    deduplicated across every process sharing it. Otherwise it goes to the
+    in-process queue, where backpressure applies: above the high watermark
+    only search jobs are accepted (recommendation jobs are shed), and a full
+    queue drops the job.
+
+    Args:
+        es: Sync Elasticsearch client to write the cache with, or None to use
+            the client the worker was started with.
+
+    Returns:
+        bool: True if the job was enqueued.
+    """
+    if use_durable_queue():
+        try:
+            enqueued = durable_queue_service.enqueue_job(query, _type, results, search_context)
+        except Exception as e:
+            print("Durable rerank enqueue failed: ", e)
+            inc("errors_total", where="rerank_enqueue", error=type(e).__name__)
+            count("dropped")
+            return False
+
+        count("enqueued" if enqueued else "deduplicated")
+        return enqueued
+
+    if base_type(_type) != config.search_type and rerank_queue.qsize() >= config.RERANK_QUEUE_HIGH_WATERMARK:
+        count("shed")
+        return False
+
+    with rerank_lock:
+        key = (query, _type)
+        if key in rerank_in_progress:
+            count("deduplicated")
+            return False
+
+        rerank_in_progress.add(key)
+        try:
+            rerank_queue.put_nowait((query, results, _type, es, search_context, time.time()))
+        except queue.Full:
+            # Roll back state if enqueue fails
+            rerank_in_progress.discard(key)
+            count("dropped")
+            return False
+
+    count("enqueued")
+    return True
+
+
+def next_rerank_batch(owner):
+    """
+    Blocks for one job, then coalesces whatever else is already queued
+    (up to RERANK_BATCH_SIZE jobs) into the same batch.
+    """
+    if use_durable_queue():
+        while True:
+            try:
+                leased = durable_queue_service.lease_jobs(owner, config.RERANK_BATCH_SIZE)
+            except Exception as e:
+                print("Durable rerank lease failed: ", e)
+                inc("errors_total", where="rerank_lease", error=type(e).__name__)
+                leased = []
+
+            if leased:
+                return [
+                    (job["query"], job["results"], job["_type"], None, job["search_context"], job["enqueued_at"])
+                    for job in leased
+                ]
+
+            time.sleep(config.RERANK_POLL_INTERVAL)
+
+    jobs = [rerank_queue.get()]
+
+    while len(jobs) < config.RERANK_BATCH_SIZE:
+        try:
+            jobs.append(rerank_queue.get_nowait())
+        except queue.Empty:
+            break
+
+    return jobs
+
+
+def complete_shortened_jobs(jobs, default_es, model, failures):
+    """
+    Re-runs the retrieval of jobs from shortened searches (see
+    `complete_shortened_search`), so they are cached with the full
+    pipeline's results. Jobs that fail are recorded in `failures` and left
+    out of the returned list.
+    """
+    from src.services.inventory_search_service import complete_shortened_search
+
+    completed = []
+    for query, results, _type, es, search_context, enqueued_at in jobs:
+        if (search_context or {}).get("shortened"):
+            try:
+                with span("rerank_complete_search"):
+                    results, search_context = complete_shortened_search(query, search_context, es or default_es, model)
+            except Exception as e:
+                failures[(query, _type)] = e
+                count("failed")
+                print("Rerank worker failed to complete a shortened search: ", e)
+                inc("errors_total", where="rerank_complete_search", error=type(e).__name__)
+                continue
+
+        completed.append((query, results, _type, es, search_context, enqueued_at))
+
+    return completed
+
+
+def process_rerank_batch(jobs, default_es=None, model=None):
+    """
+    Reranks a batch of jobs with one (rate-limited) LLM call and caches them.
+    Jobs from shortened searches are first re-run in full.
+
+    Returns:
+        dict: (query, _type) → error for every job that failed.
+    """
+    failures = {}
+
+    now = time.time()
+    observe("rerank_batch_size", len(jobs), buckets=SIZE_BUCKETS)
+    for query, results, _type, es, search_context, enqueued_at in jobs:
+        observe("rerank_queue_wait_seconds", now - enqueued_at)
+
+    try:
+        jobs = complete_shortened_jobs(jobs, default_es, model, failures)
+        if not jobs:
+            return failures
+
+        if config.BACKGROUND_RERANKER == "llm":
+            # This is where LLM runs (blocking, but NOT user-facing), rate-limited per call
+            with span("rerank_llm"):
+                reranked = rerank_elasticsearch_results_batch([
+                    (query, rerank_head(results))
+                    for query, results, _type, es, search_context, enqueued_at in jobs
+                ], before_llm_call=acquire_llm_call)
+        else:
+            reranker = get_reranker(config.BACKGROUND_RERANKER)
+            with span("rerank_local"):
+                reranked = [
+                    reranker(query, rerank_head(results), search_context)
+                    for query, results, _type, es, search_context, enqueued_at in jobs
+                ]
+
+        for (query, results, _type, es, search_context, enqueued_at), reranked_ids in zip(jobs, reranked):
+            try:
+                with span("rerank_cache_write"):
+                    set_cached_results(
+                        query, results, _type, es or default_es, search_context, reranked_ids, retrieved_at=enqueued_at
+                    )
+                count("completed")
+            except Exception as e:
+                failures[(query, _type)] = e
+                count("failed")
+                print("Rerank worker failed to cache results: ", e)
+
+    except Exception as e:
+        for query, results, _type, es, search_context, enqueued_at in jobs:
+            failures[(query, _type)] = e
+        count("failed", len(jobs))
+        print("Rerank worker crashed: ", e)
+        inc("errors_total", where="rerank_worker", error=type(e).__name__)
+
+    return failures
+
+
+def finish_rerank_batch(jobs, failures, owner, db_path=None):
+    """
+    Acknowledges processed jobs: deletes or releases durable leases, or
+    clears the in-process dedup state.
+    """
+    if use_durable_queue() or db_path:
+        for query, results, _type, es, search_context, enqueued_at in jobs:
+            try:
+                if (query, _type) in failures:
+                    durable_queue_service.fail_job(query, _type, owner, failures[(query, _type)], db_path)
+                else:
+                    durable_queue_service.complete_job(query, _type, owner, db_path)
+            except Exception as e:
+                print("Durable rerank ack failed: ", e)
+                inc("errors_total", where="rerank_ack", error=type(e).__name__)
+    else:
+        with rerank_lock:
+            for query, results, _type, es, search_context, enqueued_at in jobs:
+                rerank_in_progress.discard((query, _type))
+
+        for _ in jobs:
+            rerank_queue.task_done()
+
+    now = time.time()
+    with metrics_lock:
+        completion_times.extend([now] * len(jobs))
+
 
 def rerank_worker():
     """
     Background worker that performs LLM reranking
     """
+    owner = f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
 
     while True:
 
-        query, results, _type, es = rerank_queue.get()
+        jobs = next_rerank_batch(owner)
 
+        failures = {}
         try:
+            failures = process_rerank_batch(jobs, worker_es, worker_model)
+        finally:
+            # 🔑 Always clean up
+            finish_rerank_batch(jobs, failures, owner)
 
-            # This is where LLM runs (blocking, but NOT user-facing)
-            set_cached_results(query, results, _type, es)
 
-        except Exception as e:
-            print("Rerank worker crashed: ", e)
+def drain_durable_queue(es, db_path=None):
+    """
+    Processes every leasable durable job in the foreground (used by the CLI).
 
-        finally:
-            # 🔑 Always clean up
-            with rerank_lock:
-                rerank_in_progress.discard((query, _type))
+    Returns:
+        int: Number of jobs processed.
+    """
+    owner = f"drain:{socket.gethostname()}:{os.getpid()}"
+    processed = 0
 
-            rerank_queue.task_done()
+    while jobs := durable_queue_service.lease_jobs(owner, config.RERANK_BATCH_SIZE, db_path=db_path):
+        jobs = [
+            (job["query"], job["results"], job["_type"], None, job["search_context"], job["enqueued_at"])
+            for job in jobs
+        ]
+        failures = process_rerank_batch(jobs, es)
+        finish_rerank_batch(jobs, failures, owner, db_path or config.RERANK_QUEUE_DB)
+        processed += len(jobs)
+
+    return processed
+
+
+def rerank_queue_metrics(window=60):
+    """
+    Returns queue depth, oldest job age, drain rate (jobs/sec over `window`
+    seconds) and lifetime counters.
+    """
+    now = time.time()
 
-def start_rerank_worker():
+    if use_durable_queue():
+        stats = durable_queue_service.queue_stats()
+        depth = stats["pending"]
+        in_progress = stats["leased"]
+        oldest_age = stats["oldest_age_sec"]
+    else:
+        with rerank_queue.mutex:
+            oldest = rerank_queue.queue[0][-1] if rerank_queue.queue else None
+            depth = len(rerank_queue.queue)
+
+        in_progress = len(rerank_in_progress)
+        oldest_age = now - oldest if oldest else 0.0
+
+    with metrics_lock:
+        drained = sum(1 for t in completion_times if t >= now - window)
+        counters = dict(rerank_counters)
+
+    return {
+        "depth": depth,
+        "capacity": None if use_durable_queue() else rerank_queue.maxsize,
+        "in_progress": in_progress,
+        "oldest_age_sec": oldest_age,
+        "drain_rate_per_sec": drained / window,
+        "workers": sum(1 for worker in rerank_workers if worker.is_alive()),
+        **counters
+    }
+
+
+def rerank_queue_samples():
+    metrics = rerank_queue_metrics()
+    return [
+        ("rerank_queue_depth", "gauge", {}, metrics["depth"]),
+        ("rerank_queue_capacity", "gauge", {}, metrics["capacity"]),
+        ("rerank_queue_in_progress", "gauge", {}, metrics["in_progress"]),
+        ("rerank_queue_oldest_age_seconds", "gauge", {}, metrics["oldest_age_sec"]),
+        ("rerank_queue_drain_rate_per_second", "gauge", {}, metrics["drain_rate_per_sec"]),
+        ("rerank_workers_alive", "gauge", {}, metrics["workers"]),
+        ("rerank_llm_calls_total", "counter", {}, metrics["llm_calls"])
+    ] + [
+        ("rerank_jobs_total", "counter", {"outcome": name}, metrics[name])
+        for name in rerank_counters
+        if name != "llm_calls"
+    ]
+
+
+register_collector(rerank_queue_samples)
+
+
+def start_rerank_worker(es=None, num_workers=config.RERANK_WORKERS, model=None):
     """
-    Start exactly ONE background worker
+    Start the background worker pool (once per process)
     """
-    worker = threading.Thread(
-        target=rerank_worker,
-        daemon=True
-    )
-    worker.start()
+    global worker_es, worker_model
+
+    with rerank_workers_lock:
+        worker_es = es
+        worker_model = model
+
+        if any(worker.is_alive() for worker in rerank_workers):
+            return
+
+        for i in range(num_workers):
+            worker = threading.Thread(
+                target=rerank_worker,
+                name=f"rerank-worker-{i}",
+                daemon=True
+            )
+            worker.start()
+            rerank_workers.append(worker)
@@ -0,0 +1,20 @@
+from src.services.llm_reranking_services import rerank_elasticsearch_results
+from src.services.local_reranking_service import rerank_locally
+
+
+def rerank_with_llm(original_query, data_to_rerank, search_context=None):
+    return rerank_elasticsearch_results(original_query, data_to_rerank)
+
+
+# 🔌 Pluggable rerankers: (original_query, data_to_rerank, search_context) → ranked product IDs
+RERANKERS = {
+    "llm": rerank_with_llm,
+    "local": rerank_locally
+}
+
+
+def get_reranker(name):
+    if name not in RERANKERS:
+        raise ValueError(f"Unknown reranker '{name}', expected one of {sorted(RERANKERS)}")
+
+    return RERANKERS[name]
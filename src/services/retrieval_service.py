@@ -0,0 +1,118 @@
+import asyncio
+
+from config import config
+from src.services.elastic_query_service import get_items_by_id_query
+
+
+def use_local_backend(body):
+    # The local index holds vectors only → filtered kNN is pre-filtered by ES
+    return config.VECTOR_BACKEND == "local" and "knn" in body and not body["knn"].get("filter")
+
+
+def local_knn_candidates(body):
+    """
+    Runs the kNN clause of a `search_query` body on the local vector index.
+
+    Returns:
+        tuple: (product IDs, ES-style kNN scores), best first.
+    """
+    from src.services.vector_index_service import get_local_vector_index
+
+    knn = body["knn"]
+    k = max(knn.get("k", 10), body.get("from", 0) + body.get("size", 10))
+
+    product_ids, cosine_scores = get_local_vector_index().search_ids(knn["query_vector"], k)
+
+    # Same scale as ES `cosine` similarity scores
+    return product_ids, [(1.0 + score) / 2.0 for score in cosine_scores]
+
+
+def term_boost(source, bool_query):
+    """
+    Approximates the bool `should` term clauses of a hybrid query locally:
+    each matching term adds its boost.
+    """
+    score = 0.0
+    for clause in (bool_query or {}).get("should", []):
+        for field, term in clause.get("term", {}).items():
+            if source.get(field) == term.get("value"):
+                score += term.get("boost", 1.0)
+
+    return score
+
+
+def build_local_response(body, product_ids, knn_scores, docs):
+    """
+    Scores hydrated candidates and shapes them as an ES search response.
+    """
+    doc_map = {doc["_id"]: doc for doc in docs if doc.get("found")}
+    bool_query = body.get("query", {}).get("bool")
+
+    hits = []
+    for pid, knn_score in zip(product_ids, knn_scores):
+        doc = doc_map.get(pid)
+        if doc is None:
+            continue
+
+        hits.append({
+            "_index": doc.get("_index"),
+            "_id": pid,
+            "_score": knn_score + term_boost(doc.get("_source", {}), bool_query),
+            "_source": doc.get("_source", {})
+        })
+
+    # Same order as the ES query: score, then product_id as tie-break
+    hits.sort(key=lambda hit: (-hit["_score"], hit["_id"]))
+
+    _from = body.get("from", 0)
+    return {
+        "hits": {
+            "total": {"value": len(hits), "relation": "eq"},
+            "max_score": hits[0]["_score"] if hits else None,
+            "hits": hits[_from:_from + body.get("size", 10)]
+        }
+    }
+
+
+def vector_search(es, INDEX_NAME, body):
+    """
+    Executes a `search_query` body against the configured vector backend.
+
+    With VECTOR_BACKEND = "elasticsearch" this is a plain `es.search`. With
+    "local", candidates come from the memory-mapped local index and ES only
+    hydrates `_source` for them with one mget; the hybrid category boosts are
+    applied locally over the ANN candidates.
+    """
+    if not use_local_backend(body):
+        return es.search(index=INDEX_NAME, body=body)
+
+    product_ids, knn_scores = local_knn_candidates(body)
+    if not product_ids:
+        return build_local_response(body, [], [], [])
+
+    docs = es.mget(
+        index=INDEX_NAME,
+        body=get_items_by_id_query(product_ids, _source=body.get("_source", True))
+    )["docs"]
+
+    return build_local_response(body, product_ids, knn_scores, docs)
+
+
+async def vector_search_async(es, INDEX_NAME, body, executor=None):
+    """
+    Async variant of `vector_search`; local ANN scoring runs in `executor`.
+    """
+    if not use_local_backend(body):
+        return await es.search(index=INDEX_NAME, body=body)
+
+    loop = asyncio.get_running_loop()
+    product_ids, knn_scores = await loop.run_in_executor(executor, local_knn_candidates, body)
+    if not product_ids:
+        return build_local_response(body, [], [], [])
+
+    response = await es.mget(
+        index=INDEX_NAME,
+        body=get_items_by_id_query(product_ids, _source=body.get("_source", True))
+    )
+
+    return build_local_response(body, product_ids, knn_scores, response["docs"])
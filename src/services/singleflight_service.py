@@ -0,0 +1,119 @@
+"""
+Single-flight request coalescing.
+
+Concurrent calls with the same key share one in-flight computation: the
+first caller (the leader) runs it, later callers wait for its result, or
+for its exception, which is re-raised in every waiter. Once the call
+finishes the key is released, so nothing is cached beyond the flight itself
+(caching stays with the cache tiers).
+
+Waiters give up after SINGLEFLIGHT_TIMEOUT seconds with a `TimeoutError`;
+the leader is never interrupted. Results are shared between all callers of
+a flight and must be treated as read-only.
+
+Usage:
+    search_flights = SingleFlight("search")
+    hits = search_flights.do(key, run_search_inventory, query, ...)
+"""
+import asyncio
+import threading
+
+from src.services.metrics_service import inc
+from config import config
+
+
+class Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls across threads.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.flights = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        if not config.SINGLEFLIGHT_ENABLED:
+            return fn(*args, **kwargs)
+
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+
+        if not leader:
+            return self.wait(flight)
+
+        inc("singleflight_calls_total", group=self.name, role="leader")
+        try:
+            flight.result = fn(*args, **kwargs)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                self.flights.pop(key, None)
+            flight.done.set()
+
+    def wait(self, flight):
+        inc("singleflight_calls_total", group=self.name, role="waiter")
+
+        if not flight.done.wait(config.SINGLEFLIGHT_TIMEOUT):
+            inc("singleflight_timeouts_total", group=self.name)
+            raise TimeoutError(f"Timed out waiting for an in-flight {self.name} request")
+
+        if flight.error is not None:
+            raise flight.error
+
+        return flight.result
+
+
+class AsyncSingleFlight:
+    """
+    Coalesces concurrent identical coroutine calls on one event loop.
+
+    The computation runs as its own task, shielded from the callers: a
+    leader that is cancelled (e.g. the client went away) does not abort it
+    for the others.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.flights = {}
+
+    async def do(self, key, fn, *args, **kwargs):
+        if not config.SINGLEFLIGHT_ENABLED:
+            return await fn(*args, **kwargs)
+
+        task = self.flights.get(key)
+        if task is None:
+            inc("singleflight_calls_total", group=self.name, role="leader")
+            task = self.flights[key] = asyncio.ensure_future(fn(*args, **kwargs))
+            task.add_done_callback(lambda done: self.release(key, done))
+            return await asyncio.shield(task)
+
+        inc("singleflight_calls_total", group=self.name, role="waiter")
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), config.SINGLEFLIGHT_TIMEOUT)
+        except asyncio.TimeoutError:
+            inc("singleflight_timeouts_total", group=self.name)
+            raise TimeoutError(f"Timed out waiting for an in-flight {self.name} request")
+
+    def release(self, key, task):
+        if self.flights.get(key) is task:
+            del self.flights[key]
+
+        # Mark the error as retrieved even if every caller gave up waiting
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,208 @@
+"""
+Cold-start helpers: per-stage startup timings, background model warm-up
+and lazily created Elasticsearch clients.
+
+The embedding model (sentence_transformers / torch) is by far the slowest
+thing to import and load, so it is warmed on a background thread while the
+process already serves what does not need it (browse, health checks).
+`is_model_ready` is the readiness flag; `get_model` waits for the warm-up.
+
+Usage:
+    with startup_stage("es_clients"):
+        es = get_es_client()
+
+    start_model_warmup()
+    ...
+    model = get_model(timeout=config.MODEL_WAIT_TIMEOUT)
+"""
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from src.services.metrics_service import observe
+from config import config
+
+process_started_at = time.time()
+
+startup_stages = []
+stages_lock = threading.Lock()
+
+model_state = {"model": None, "error": None, "thread": None}
+model_lock = threading.Lock()
+model_loaded = threading.Event()
+
+clients = {}
+clients_lock = threading.Lock()
+
+
+# ----------------- STAGE REPORT -----------------
+def rss_mb():
+    """
+    Current resident memory of the process in MB (peak RSS where /proc is
+    unavailable).
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * resource.getpagesize() / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS, KB elsewhere
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+@contextmanager
+def startup_stage(name):
+    """
+    Records how long a startup stage took and how much memory it added.
+    """
+    started = time.perf_counter()
+    rss_before = rss_mb()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        rss_after = rss_mb()
+
+        with stages_lock:
+            startup_stages.append({
+                "stage": name,
+                "seconds": round(seconds, 3),
+                "rss_mb": round(rss_after, 1),
+                "rss_delta_mb": round(rss_after - rss_before, 1)
+            })
+        observe("startup_stage_seconds", seconds, stage=name)
+
+
+def startup_report():
+    """
+    Returns the recorded stages in completion order, plus the time since
+    the process started.
+    """
+    with stages_lock:
+        stages = list(startup_stages)
+
+    return {
+        "uptime_seconds": round(time.time() - process_started_at, 3),
+        "model_ready": is_model_ready(),
+        "stages": stages
+    }
+
+
+def print_startup_report():
+    report = startup_report()
+    for stage in report["stages"]:
+        print(
+            f"Startup {stage['stage']}: {stage['seconds']:.3f}s, "
+            f"RSS {stage['rss_mb']:.1f} MB ({stage['rss_delta_mb']:+.1f} MB)"
+        )
+
+
+# ----------------- MODEL WARM-UP -----------------
+def load_model():
+    # Deferred: importing sentence_transformers pulls in torch
+    with startup_stage("import_sentence_transformers"):
+        from sentence_transformers import SentenceTransformer
+
+    with startup_stage("load_model"):
+        model = SentenceTransformer(config.EMBEDDING_MODEL_NAME)
+
+    # The first encode initialises kernels / thread pools; pay for it here
+    with startup_stage("warm_up_model"):
+        model.encode(["warm up"], batch_size=1)
+
+    return model
+
+
+def warm_up_model():
+    try:
+        model_state["model"] = load_model()
+    except Exception as e:
+        print("Model warm-up failed: ", e)
+        model_state["error"] = e
+    finally:
+        model_loaded.set()
+        print_startup_report()
+
+
+def start_model_warmup():
+    """
+    Starts loading the embedding model on a background thread (once per
+    process).
+    """
+    with model_lock:
+        if model_state["thread"] is not None:
+            return
+
+        thread = threading.Thread(target=warm_up_model, name="model-warmup", daemon=True)
+        model_state["thread"] = thread
+        thread.start()
+
+
+def is_model_ready():
+    return model_state["model"] is not None
+
+
+def get_model(timeout=None):
+    """
+    Returns the embedding model, starting the warm-up if needed and waiting
+    up to `timeout` seconds for it (None waits indefinitely).
+
+    Raises:
+        TimeoutError: If the model is still loading after `timeout`.
+        RuntimeError: If loading the model failed.
+    """
+    if model_state["model"] is not None:
+        return model_state["model"]
+
+    start_model_warmup()
+
+    if not model_loaded.wait(timeout):
+        raise TimeoutError("Embedding model is still loading")
+
+    if model_state["model"] is None:
+        raise RuntimeError(f"Embedding model failed to load: {model_state['error']}")
+
+    return model_state["model"]
+
+
+# ----------------- LAZY CLIENTS -----------------
+def es_client_options():
+    """
+    Connection settings shared by the sync and async clients: a bounded
+    default timeout, retries on overload (429 / 502-504) and on dropped
+    connections but not on timeouts (a retry would only blow the request's
+    budget), and a pool of kept-alive connections sized for concurrency.
+    """
+    return {
+        "basic_auth": (
+            config.ELASTICSEARCH_USER,
+            config.ELASTICSEARCH_PASSWORD
+        ),
+        "verify_certs": False,
+        "request_timeout": config.ES_REQUEST_TIMEOUT,
+        "max_retries": config.ES_MAX_RETRIES,
+        "retry_on_timeout": config.ES_RETRY_ON_TIMEOUT,
+        "connections_per_node": config.ES_CONNECTIONS_PER_NODE,
+        "http_compress": config.ES_HTTP_COMPRESS
+    }
+
+
+def create_es_client():
+    from elasticsearch import Elasticsearch
+
+    return Elasticsearch(config.ELASTICSEARCH_URL, **es_client_options())
+
+
+def get_es_client():
+    """
+    Returns the process-wide sync Elasticsearch client, created on first use.
+    """
+    if "es" not in clients:
+        with clients_lock:
+            if "es" not in clients:
+                clients["es"] = create_es_client()
+
+    return clients["es"]
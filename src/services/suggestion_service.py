@@ -0,0 +1,421 @@
+"""
+Typeahead suggestions from an in-memory prefix index.
+
+Suggestions come from the queries in the cache index (so picking one is
+served from cache) and from the catalog: brands, category names and product
+names. They are compiled into sorted arrays; a lookup is a `bisect` range
+over the keys, and the best suggestions of every short prefix (up to
+SUGGEST_PRECOMPUTED_PREFIX_LEN characters, where ranges are widest) are
+precomputed. Lookups never touch ES or the model.
+
+Ranking: a per-kind weight that puts cached queries first, plus popularity
+within the kind scaled to [0, 1] (searches seen by this process for cached
+queries, saturating at SUGGEST_QUERY_POPULARITY_SCALE; product counts for
+brands and categories, relative to the most common one).
+
+The index is refreshed incrementally on a background thread: only cache
+entries created since the last refresh are read, and the changed queries
+are merged into a copy of the index (`SuggestionIndex.merge`) instead of
+recompiling it. Queries whose cache entry is gone are dropped: expired or
+invalidated ones by the sweeper's rules on every refresh, and any other
+deleted entry by a full re-read every SUGGEST_RECONCILE_INTERVAL seconds.
+The catalog terms are re-read, and the index rebuilt, only when the catalog
+generation changes.
+"""
+import bisect
+import heapq
+import math
+import threading
+import time
+from collections import Counter
+from itertools import chain
+
+from elasticsearch import NotFoundError, helpers
+
+from src.services.caching_service.cache_generation import get_catalog_generation
+from src.services.metrics_service import inc, span
+from config import config
+
+KIND_WEIGHTS = {
+    "query": 3.0,
+    "category": 2.0,
+    "brand": 1.5,
+    "product": 0.0
+}
+
+CATEGORY_FIELDS = ["category", "sub_category", "sub_sub_category", "sub_sub_sub_category"]
+
+# INDEX_NAME → SuggestionIndex
+suggestion_indexes = {}
+# INDEX_NAME → source data the index is compiled from
+suggestion_sources = {}
+sources_lock = threading.Lock()
+
+# Searches seen since the last refresh: normalized query → count
+recent_queries = Counter()
+recent_queries_lock = threading.Lock()
+
+refresher_threads = {}
+
+
+def normalize_suggestion(text):
+    return " ".join(str(text).lower().split())
+
+
+class SuggestionIndex:
+    """
+    Immutable prefix index over normalized suggestion texts.
+
+    Args:
+        suggestions (dict): normalized text → (display text, kind, score).
+    """
+
+    def __init__(self, suggestions, built_at=None):
+        self.entries = dict(suggestions)
+        self.keys = sorted(suggestions)
+        self.built_at = built_at or time.time()
+        self.top = self.precompute_top()
+
+    def score(self, key):
+        return self.entries[key][2]
+
+    def precompute_top(self):
+        by_prefix = {}
+        for key in self.keys:
+            for prefix in prefixes_of(key):
+                by_prefix.setdefault(prefix, []).append(key)
+
+        return {
+            prefix: heapq.nlargest(config.SUGGEST_MAX_RESULTS, keys, key=self.score)
+            for prefix, keys in by_prefix.items()
+        }
+
+    def prefix_range(self, prefix, max_scan=None):
+        start = bisect.bisect_left(self.keys, prefix)
+        end = len(self.keys) if max_scan is None else min(len(self.keys), start + max_scan)
+        return start, bisect.bisect_left(self.keys, prefix + "\uffff", start, end)
+
+    def merge(self, updates, removals=()):
+        """
+        Returns a copy with the `updates` (normalized text → (display text,
+        kind, score)) set and the `removals` dropped. Changed keys are
+        bisected into the sorted keys, and only the precomputed prefixes
+        they fall under are updated, so a refresh costs in proportion to
+        what changed rather than to the size of the index.
+        """
+        index = SuggestionIndex.__new__(SuggestionIndex)
+        index.entries = dict(self.entries)
+        index.keys = list(self.keys)
+        index.top = dict(self.top)
+        index.built_at = time.time()
+
+        for key in removals:
+            if index.entries.pop(key, None) is not None:
+                del index.keys[bisect.bisect_left(index.keys, key)]
+
+        for key, suggestion in updates.items():
+            if key not in index.entries:
+                bisect.insort(index.keys, key)
+            index.entries[key] = suggestion
+
+        # A prefix whose top lost a key or saw one score lower is rescanned;
+        # the others take the updated keys in against their current top
+        lowered = [key for key, suggestion in updates.items() if key in self.entries and suggestion[2] < self.entries[key][2]]
+        rescan = {
+            prefix for key in chain(removals, lowered) for prefix in prefixes_of(key)
+            if key in self.top.get(prefix, ())
+        }
+        for prefix in rescan:
+            start, end = index.prefix_range(prefix)
+            index.top[prefix] = heapq.nlargest(config.SUGGEST_MAX_RESULTS, index.keys[start:end], key=index.score)
+            if not index.top[prefix]:
+                del index.top[prefix]
+
+        for key in updates:
+            for prefix in prefixes_of(key):
+                if prefix not in rescan:
+                    candidates = set(index.top.get(prefix, ())) | {key}
+                    index.top[prefix] = heapq.nlargest(config.SUGGEST_MAX_RESULTS, candidates, key=index.score)
+
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, prefix, limit=config.SUGGEST_MAX_RESULTS):
+        """
+        Returns up to `limit` suggestions starting with `prefix`, best first.
+        """
+        prefix = normalize_suggestion(prefix)
+        if not prefix:
+            return []
+
+        if len(prefix) <= config.SUGGEST_PRECOMPUTED_PREFIX_LEN and limit <= config.SUGGEST_MAX_RESULTS:
+            keys = self.top.get(prefix, [])[:limit]
+        else:
+            # Scan at most SUGGEST_MAX_SCAN keys of the prefix range
+            start, end = self.prefix_range(prefix, config.SUGGEST_MAX_SCAN)
+            keys = heapq.nlargest(limit, self.keys[start:end], key=self.score)
+
+        return [{"text": self.entries[key][0], "kind": self.entries[key][1]} for key in keys]
+
+
+def prefixes_of(key):
+    return [key[:length] for length in range(1, min(len(key), config.SUGGEST_PRECOMPUTED_PREFIX_LEN) + 1)]
+
+
+# ----------------- SOURCES -----------------
+def record_query(normalized_query):
+    """
+    Counts a search towards the popularity of its query (applied on the
+    next refresh if the query is cached by then).
+    """
+    with recent_queries_lock:
+        recent_queries[normalize_suggestion(normalized_query)] += 1
+
+
+def read_cached_queries(es, since=None):
+    """
+    Returns {normalized query: created_at} for search entries in the cache
+    index created at or after `since` (all when None).
+    """
+    query = {"match_all": {}} if since is None else {"range": {"created_at": {"gte": since}}}
+
+    queries = {}
+    try:
+        for doc in helpers.scan(
+            es,
+            index=config.CACHE_INDEX,
+            query={"query": query, "_source": ["user_query", "_type", "created_at"]}
+        ):
+            source = doc["_source"]
+            if source.get("_type") == config.search_type and source.get("user_query"):
+                queries[normalize_suggestion(source["user_query"])] = source.get("created_at") or 0
+
+            if len(queries) >= config.SUGGEST_MAX_QUERIES:
+                break
+    except NotFoundError:
+        # No cache index yet → no query suggestions
+        pass
+
+    return queries
+
+
+def read_catalog_terms(es, INDEX_NAME):
+    """
+    Returns (brand counts, category name counts, product names) of the catalog.
+    """
+    fields = ["brand"] + CATEGORY_FIELDS
+    response = es.search(
+        index=INDEX_NAME,
+        body={
+            "size": 0,
+            "aggs": {
+                field: {"terms": {"field": field, "size": config.SUGGEST_MAX_TERMS}}
+                for field in fields
+            }
+        }
+    )
+
+    aggs = response["aggregations"]
+    brands = {bucket["key"]: bucket["doc_count"] for bucket in aggs["brand"]["buckets"]}
+
+    categories = Counter()
+    for field in CATEGORY_FIELDS:
+        for bucket in aggs[field]["buckets"]:
+            categories[bucket["key"]] += bucket["doc_count"]
+
+    names = []
+    for doc in helpers.scan(es, index=INDEX_NAME, query={"query": {"match_all": {}}, "_source": ["name"]}):
+        name = doc["_source"].get("name")
+        if name:
+            names.append(name)
+        if len(names) >= config.SUGGEST_MAX_PRODUCT_NAMES:
+            break
+
+    return brands, dict(categories), names
+
+
+def compile_catalog_suggestions(brands, categories, names):
+    """
+    Merges the catalog terms into normalized text → (display, kind, score);
+    a text found in several sources keeps its best-scoring one.
+    """
+    suggestions = {}
+
+    def add_all(kind, counts):
+        # log-scaled popularity, relative to the most popular of the kind
+        top = math.log1p(max(counts.values(), default=0)) or 1.0
+
+        for text, popularity in counts.items():
+            key = normalize_suggestion(text)
+            if not key:
+                continue
+
+            score = KIND_WEIGHTS[kind] + math.log1p(popularity) / top
+            if key not in suggestions or suggestions[key][2] < score:
+                suggestions[key] = (text, kind, score)
+
+    add_all("product", dict.fromkeys(names, 0))
+    add_all("brand", brands)
+    add_all("category", categories)
+
+    return suggestions
+
+
+def query_suggestion(query, sources):
+    """
+    Returns the suggestion of a cached query, or the catalog term with the
+    same text if that one scores higher.
+    """
+    # Fixed scale (not relative to the most searched query) so a count change only moves its own score
+    popularity = min(1.0, math.log1p(sources["query_counts"][query]) / math.log1p(config.SUGGEST_QUERY_POPULARITY_SCALE))
+    suggestion = (query, "query", KIND_WEIGHTS["query"] + popularity)
+
+    catalog_suggestion = sources["catalog"].get(query)
+    if catalog_suggestion is not None and catalog_suggestion[2] > suggestion[2]:
+        return catalog_suggestion
+
+    return suggestion
+
+
+def compile_suggestions(sources):
+    suggestions = dict(sources["catalog"])
+    for query in sources["query_counts"]:
+        suggestions[query] = query_suggestion(query, sources)
+
+    return suggestions
+
+
+def gone_queries(sources, generation, now, cached=None):
+    """
+    Returns the suggested queries whose cache entry no longer exists:
+    created before the sweeper's cutoff (expired, or from before the
+    current catalog generation), or missing from `cached` (a full read of
+    the cached queries) when given.
+    """
+    stale_before = max(now - config.CACHE_ENTRY_TTL, generation["updated_at"])
+
+    return {
+        query for query, created_at in sources["query_created"].items()
+        if created_at < stale_before or (cached is not None and query not in cached)
+    }
+
+
+# ----------------- REFRESH -----------------
+def refresh_suggestion_index(es, INDEX_NAME):
+    """
+    Pulls what changed since the last refresh and swaps in an updated
+    index: the changed queries are merged into the current one, and it is
+    recompiled only when the catalog generation changes. On failure the
+    previous index keeps being served.
+    """
+    try:
+        with sources_lock, span("suggest_refresh"):
+            sources = suggestion_sources.get(INDEX_NAME)
+            generation = get_catalog_generation(es, INDEX_NAME)
+            now = time.time()
+            rebuild = sources is None or sources["generation"] != generation["generation"]
+
+            if rebuild:
+                brands, categories, names = read_catalog_terms(es, INDEX_NAME)
+                sources = {
+                    "generation": generation["generation"],
+                    "catalog": compile_catalog_suggestions(brands, categories, names),
+                    "query_counts": sources["query_counts"] if sources else Counter(),
+                    "query_created": sources["query_created"] if sources else {},
+                    "watermark": sources["watermark"] if sources else None,
+                    "reconciled_at": sources["reconciled_at"] if sources else now
+                }
+
+            new_queries = read_cached_queries(es, since=sources["watermark"])
+            for query, created_at in new_queries.items():
+                sources["query_counts"].setdefault(query, 0)
+                sources["query_created"][query] = created_at
+            if new_queries:
+                sources["watermark"] = max(new_queries.values())
+
+            with recent_queries_lock:
+                recent = dict(recent_queries)
+                recent_queries.clear()
+
+            # Only cached queries are suggested; counts of the others are dropped
+            changed = set(new_queries)
+            for query, count in recent.items():
+                if query in sources["query_counts"]:
+                    sources["query_counts"][query] += count
+                    changed.add(query)
+
+            # Deleted entries the expiry rules cannot see (e.g. trimmed to CACHE_MAX_ENTRIES) → full read
+            cached = None
+            if now - sources["reconciled_at"] >= config.SUGGEST_RECONCILE_INTERVAL:
+                cached = read_cached_queries(es)
+                sources["reconciled_at"] = now
+
+            gone = gone_queries(sources, generation, now, cached)
+
+            # Bounded: keep the most popular queries
+            excess = len(sources["query_counts"]) - len(gone) - config.SUGGEST_MAX_QUERIES
+            if excess > 0:
+                least_popular = sorted(
+                    (query for query in sources["query_counts"] if query not in gone),
+                    key=sources["query_counts"].__getitem__
+                )
+                gone.update(least_popular[:excess])
+
+            for query in gone:
+                del sources["query_counts"][query]
+                del sources["query_created"][query]
+            changed -= gone
+
+            suggestion_sources[INDEX_NAME] = sources
+            index = suggestion_indexes.get(INDEX_NAME)
+
+            if rebuild or index is None:
+                suggestion_indexes[INDEX_NAME] = SuggestionIndex(compile_suggestions(sources))
+            elif changed or gone:
+                # A dropped query that is also a catalog term falls back to the catalog suggestion
+                updates = {query: query_suggestion(query, sources) for query in changed}
+                updates.update({query: sources["catalog"][query] for query in gone if query in sources["catalog"]})
+                suggestion_indexes[INDEX_NAME] = index.merge(updates, [query for query in gone if query not in updates])
+
+        inc("suggest_refreshes_total", outcome="ok")
+        inc("suggest_queries_dropped_total", len(gone))
+    except Exception as e:
+        print("Suggestion index refresh failed: ", e)
+        inc("suggest_refreshes_total", outcome="error")
+
+    return suggestion_indexes.get(INDEX_NAME)
+
+
+def start_suggestion_refresher(es, INDEX_NAME):
+    """
+    Builds the index, then refreshes it every SUGGEST_REFRESH_INTERVAL
+    seconds on a background thread (once per process).
+    """
+    if INDEX_NAME in refresher_threads and refresher_threads[INDEX_NAME].is_alive():
+        return
+
+    def run():
+        while True:
+            refresh_suggestion_index(es, INDEX_NAME)
+            time.sleep(config.SUGGEST_REFRESH_INTERVAL)
+
+    thread = threading.Thread(target=run, name="suggestion-refresher", daemon=True)
+    thread.start()
+    refresher_threads[INDEX_NAME] = thread
+
+
+def suggest(prefix, INDEX_NAME=config.INVENTORY_INDEX, limit=config.SUGGEST_MAX_RESULTS):
+    """
+    Returns up to `limit` suggestions for `prefix` ([] until the index is
+    first built).
+
+    Returns:
+        list[dict]: {"text", "kind"} with kind in query / category / brand / product.
+    """
+    index = suggestion_indexes.get(INDEX_NAME)
+    if index is None:
+        return []
+
+    return index.lookup(prefix, limit)
@@ -0,0 +1,328 @@
+"""
+Local memory-mapped vector index used as an alternative kNN backend.
+
+The inventory embeddings are exported once from Elasticsearch into a
+row-normalized `.npy` matrix (float16 or float32), with the product ID and
+category hierarchy of every row stored as columns next to it: fixed-width
+product IDs, and per-level category codes into small name lists
+(`CatalogColumns`). An IVF (inverted file) index is built on top: k-means
+centroids, and the row IDs grouped by their nearest centroid. Every array
+is opened with `mmap_mode="r"`, so multiple worker processes share the same
+pages through the OS page cache instead of each holding a copy.
+
+Usage:
+    python -m src.services.vector_index_service --out data/vector_index
+"""
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+from elasticsearch import helpers
+
+from config import config
+
+HIERARCHY_FIELDS = ["category", "sub_category", "sub_sub_category", "sub_sub_sub_category"]
+
+EMBEDDINGS_FILE = "embeddings.npy"
+PRODUCT_IDS_FILE = "product_ids.npy"
+CATEGORY_CODES_FILE = "category_codes.npy"
+CATEGORY_NAMES_FILE = "category_names.json"
+CENTROIDS_FILE = "ivf_centroids.npy"
+ORDER_FILE = "ivf_order.npy"
+OFFSETS_FILE = "ivf_offsets.npy"
+
+
+# ----------------- EXPORT -----------------
+def export_catalog_embeddings(es, INDEX_NAME, out_dir, dtype="float16", batch_size=2000):
+    """
+    Streams every inventory document's embedding into a memory-mapped matrix.
+
+    Rows are L2-normalized so cosine similarity becomes a dot product.
+
+    Returns:
+        int: Number of exported rows.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+
+    total = es.count(index=INDEX_NAME)["count"]
+    embeddings = np.lib.format.open_memmap(
+        os.path.join(out_dir, EMBEDDINGS_FILE),
+        mode="w+",
+        dtype=dtype,
+        shape=(total, config.EMBEDDING_DIMS)
+    )
+
+    product_ids = []
+    hierarchy = {field: [] for field in HIERARCHY_FIELDS}
+
+    rows = 0
+    for doc in helpers.scan(
+        es,
+        index=INDEX_NAME,
+        query={"_source": ["product_id", "embedding", *HIERARCHY_FIELDS]},
+        size=batch_size
+    ):
+        source = doc["_source"]
+        vector = source.get("embedding")
+        if not vector or rows >= total:
+            continue
+
+        vector = np.asarray(vector, dtype=np.float32)
+        embeddings[rows] = vector / (np.linalg.norm(vector) or 1.0)
+
+        product_ids.append(source.get("product_id") or doc["_id"])
+        for field in HIERARCHY_FIELDS:
+            hierarchy[field].append(source.get(field))
+
+        rows += 1
+
+    embeddings.flush()
+    write_catalog_columns(out_dir, product_ids, hierarchy)
+
+    print(f"✅ Exported {rows} embeddings to {out_dir}")
+    return rows
+
+
+def write_catalog_columns(index_dir, product_ids, hierarchy):
+    """
+    Writes the per-row catalog columns: product IDs as a fixed-width bytes
+    array, and an int32 (rows × levels) matrix of category codes (-1 =
+    missing) into the per-level name lists.
+    """
+    np.save(os.path.join(index_dir, PRODUCT_IDS_FILE), np.array([str(pid).encode("utf-8") for pid in product_ids], dtype=np.bytes_))
+
+    codes = np.full((len(product_ids), len(HIERARCHY_FIELDS)), -1, dtype=np.int32)
+    names = {}
+    for level, field in enumerate(HIERARCHY_FIELDS):
+        names[field] = sorted({value for value in hierarchy[field] if value})
+        code_of = {name: code for code, name in enumerate(names[field])}
+        codes[:, level] = [code_of.get(value, -1) for value in hierarchy[field]]
+
+    np.save(os.path.join(index_dir, CATEGORY_CODES_FILE), codes)
+    with open(os.path.join(index_dir, CATEGORY_NAMES_FILE), "w") as f:
+        json.dump(names, f)
+
+
+class CatalogColumns:
+    """
+    Memory-mapped per-row catalog columns of an export. Only the distinct
+    category names are held in memory.
+    """
+
+    def __init__(self, index_dir):
+        if not os.path.exists(os.path.join(index_dir, PRODUCT_IDS_FILE)):
+            raise FileNotFoundError(
+                f"No catalog columns in {index_dir}: re-run the export "
+                f"(python -m src.services.vector_index_service --out {index_dir})"
+            )
+
+        self.ids = np.load(os.path.join(index_dir, PRODUCT_IDS_FILE), mmap_mode="r")
+        self.codes = np.load(os.path.join(index_dir, CATEGORY_CODES_FILE), mmap_mode="r")
+        with open(os.path.join(index_dir, CATEGORY_NAMES_FILE)) as f:
+            self.names = json.load(f)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def product_id(self, row):
+        return self.ids[row].decode("utf-8")
+
+    def column(self, field):
+        """
+        Returns the values of `field` ("product_ids" or a hierarchy level)
+        for every row as a list (offline builds only: it is a heap copy).
+        """
+        if field == "product_ids":
+            return [pid.decode("utf-8") for pid in self.ids]
+
+        names = self.names[field]
+        return [names[code] if code >= 0 else None for code in self.codes[:, HIERARCHY_FIELDS.index(field)]]
+
+
+def load_catalog_export(index_dir):
+    """
+    Opens an export created by `export_catalog_embeddings`.
+
+    Returns:
+        tuple: (memory-mapped embedding matrix, CatalogColumns)
+    """
+    catalog = CatalogColumns(index_dir)
+    embeddings = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+    return embeddings[:len(catalog)], catalog
+
+
+# ----------------- IVF BUILD -----------------
+def assign_to_centroids(embeddings, centroids, block_size=8192):
+    assignments = np.empty(len(embeddings), dtype=np.int32)
+
+    for start in range(0, len(embeddings), block_size):
+        block = np.asarray(embeddings[start:start + block_size], dtype=np.float32)
+        assignments[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+
+    return assignments
+
+
+def train_centroids(embeddings, n_lists, sample_size=50000, iterations=15, seed=0):
+    """
+    Spherical k-means on a random sample of the (normalized) embeddings.
+    """
+    rng = np.random.default_rng(seed)
+    sample_rows = np.sort(rng.choice(len(embeddings), size=min(sample_size, len(embeddings)), replace=False))
+    sample = np.asarray(embeddings[sample_rows], dtype=np.float32)
+
+    centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+
+        empty = ~sums.any(axis=1)
+        # Re-seed empty lists with random sample points
+        sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+
+        centroids = sums / np.linalg.norm(sums, axis=1, keepdims=True)
+
+    return centroids
+
+
+def build_ivf_index(index_dir, n_lists=None):
+    """
+    Builds the IVF lists for an export: centroids, rows sorted by list, and
+    list offsets (list i = order[offsets[i]:offsets[i + 1]]).
+    """
+    embeddings, _ = load_catalog_export(index_dir)
+
+    n_lists = n_lists or max(1, int(np.sqrt(len(embeddings))))
+    n_lists = min(n_lists, len(embeddings))
+
+    centroids = train_centroids(embeddings, n_lists)
+    assignments = assign_to_centroids(embeddings, centroids)
+
+    order = np.argsort(assignments, kind="stable").astype(np.int32)
+    offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(assignments, minlength=n_lists))
+
+    np.save(os.path.join(index_dir, CENTROIDS_FILE), centroids.astype(np.float32))
+    np.save(os.path.join(index_dir, ORDER_FILE), order)
+    np.save(os.path.join(index_dir, OFFSETS_FILE), offsets)
+
+    print(f"✅ Built IVF index with {n_lists} lists over {len(embeddings)} rows")
+
+
+# ----------------- SEARCH -----------------
+class LocalVectorIndex:
+    """
+    Read-only IVF index over a memory-mapped embedding matrix.
+
+    Falls back to exact (blocked brute-force) search when no IVF files exist.
+
+    Args:
+        index_dir (str): Directory created by `export_catalog_embeddings`.
+        nprobe (int): Number of IVF lists scanned per query.
+    """
+
+    def __init__(self, index_dir, nprobe=config.LOCAL_VECTOR_NPROBE):
+        self.nprobe = nprobe
+        self.embeddings, self.catalog = load_catalog_export(index_dir)
+
+        centroids_path = os.path.join(index_dir, CENTROIDS_FILE)
+        if os.path.exists(centroids_path):
+            self.centroids = np.load(centroids_path)
+            self.order = np.load(os.path.join(index_dir, ORDER_FILE), mmap_mode="r")
+            self.offsets = np.load(os.path.join(index_dir, OFFSETS_FILE))
+        else:
+            self.centroids = None
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def candidate_rows(self, query):
+        if self.centroids is None:
+            return None
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        probe_lists = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+
+        rows = np.concatenate([
+            self.order[self.offsets[i]:self.offsets[i + 1]]
+            for i in probe_lists
+        ])
+        # Sorted rows → sequential reads on the memory map
+        return np.sort(rows)
+
+    def search(self, query_vector, k, block_size=16384):
+        """
+        Returns the top-k rows by cosine similarity.
+
+        Returns:
+            tuple: (row indices, cosine scores), best first.
+        """
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        rows = self.candidate_rows(query)
+        if rows is None:
+            scores = np.concatenate([
+                np.asarray(self.embeddings[start:start + block_size], dtype=np.float32) @ query
+                for start in range(0, len(self.embeddings), block_size)
+            ])
+            rows = np.arange(len(scores))
+        else:
+            scores = np.asarray(self.embeddings[rows], dtype=np.float32) @ query
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        return rows[top], scores[top]
+
+    def search_ids(self, query_vector, k):
+        rows, scores = self.search(query_vector, k)
+        return [self.catalog.product_id(row) for row in rows], scores.tolist()
+
+
+local_vector_index = None
+local_vector_index_lock = threading.Lock()
+
+
+def get_local_vector_index():
+    """
+    Lazily opens the shared local index configured by LOCAL_VECTOR_INDEX_DIR.
+    """
+    global local_vector_index
+
+    if local_vector_index is None:
+        with local_vector_index_lock:
+            if local_vector_index is None:
+                local_vector_index = LocalVectorIndex(config.LOCAL_VECTOR_INDEX_DIR)
+
+    return local_vector_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export inventory embeddings and build the local IVF index.")
+    parser.add_argument("--out", default=config.LOCAL_VECTOR_INDEX_DIR)
+    parser.add_argument("--index", default=config.INVENTORY_INDEX)
+    parser.add_argument("--dtype", default="float16", choices=["float16", "float32"])
+    parser.add_argument("--lists", type=int, default=None, help="Number of IVF lists (default: sqrt(rows))")
+    parser.add_argument("--skip-export", action="store_true", help="Rebuild IVF lists from an existing export")
+    args = parser.parse_args()
+
+    if not args.skip_export:
+        from src.services.startup_service import create_es_client
+
+        es = create_es_client()
+        export_catalog_embeddings(es, args.index, args.out, dtype=args.dtype)
+
+    build_ivf_index(args.out, n_lists=args.lists)
+
+
+if __name__ == "__main__":
+    main()